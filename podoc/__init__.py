@@ -20,9 +20,15 @@ pytest.register_assert_rewrite('podoc.core')
 from .core import Podoc  # noqa
 from .plugin import (IPlugin, discover_plugins,
                      get_plugin, get_plugins)  # noqa
+from .utils import ConversionTimeout, ConversionCancelled  # noqa
 from .ast import ASTPlugin
 from .markdown import MarkdownPlugin
 from .notebook import NotebookPlugin
+from .html import HTMLPlugin
+from .latex import LaTeXPlugin
+from .rst import RSTPlugin
+from .text import TextPlugin
+from .script import ScriptPlugin
 
 
 #-------------------------------------------------------------------------------------------------
@@ -8,4 +8,5 @@
 # Imports
 #-------------------------------------------------------------------------------------------------
 
-from ._ast import ASTNode, ASTPlugin, PandocPlugin, ast_from_pandoc
+from ._ast import ASTNode, ASTPlugin, PandocPlugin, ast_from_pandoc, ast_from_pandoc_json
+from ._columnar import ColumnarAST, ColumnarNode
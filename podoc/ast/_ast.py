@@ -13,10 +13,10 @@ import logging
 import os.path as op
 import re
 
-from podoc.tree import Node, TreeTransformer, filter_tree
+from podoc.tree import Node, PassManager, TreeRewriter, TreeTransformer
 from podoc.plugin import IPlugin
 from podoc.utils import (has_pandoc, pandoc, get_pandoc_formats,
-                         PANDOC_API_VERSION,
+                         PANDOC_API_VERSION, process_options,
                          _save_resources, _get_resources_path,
                          _merge_str, _get_file,
                          )
@@ -129,12 +129,28 @@ NATIVE_NAMES = BLOCK_NAMES + INLINE_NAMES + (
 
 
 class ASTNode(Node):
+    # Fields of the native node types.
+    __slots__ = _fields = ('level', 'lang', 'url', 'start', 'style', 'delimiter',
+                           'bullet_char', 'raw_type')
+
     def is_block(self):
         return self.name in BLOCK_NAMES
 
     def is_inline(self):
         return self.name in INLINE_NAMES
 
+    def is_block_like(self):
+        """Return whether the node is rendered as a block by the writers: a block node,
+        a code cell, a horizontal rule, or a node marked with `is_block` in its
+        `_visit_meta` dictionary."""
+        return bool(self.is_block() or self.name in ('CodeCell', 'HorizontalRule') or
+                    self.get('_visit_meta', {}).get('is_block', None))
+
+    def text_contents(self):
+        """Return the text contained in the node."""
+        return ''.join(child if isinstance(child, str) else child.text_contents()
+                       for child in self.children)
+
     def is_native(self):
         """Return whether the node type is one of the native AST types"""
         return self.name in NATIVE_NAMES
@@ -208,18 +224,40 @@ def _to_pandoc_metadata(ast_metadata):
 def _from_pandoc_metadata(pandoc_metadata):
     l = pandoc_metadata.get('podoc', {}).get('c', {})
     for k, v in l.items():
-        yield k, v['c'][0]['c']
+        value = v['c'][0]
+        # NOTE: the single-pass decoder converts the Str elements to strings.
+        yield k, value if isinstance(value, str) else value['c']
 
 
-class PodocToPandocPreProcessor(TreeTransformer):
-    def transform_Node(self, node):
-        """Call the transformation methods recursively."""
-        children = self.transform_children(node)
-        node.children = children
-        return node
+class PodocToPandocPreProcessor(TreeRewriter):
+    """Transform the AST before the conversion to pandoc.
+
+    The unchanged subtrees are shared with the original AST.
+
+    """
+
+    node_local = True
 
 
 class PodocToPandoc(TreeTransformer):
+    """Convert an AST to a pandoc document.
+
+    Parameters
+    ----------
+
+    passes : PassManager (None)
+        The passes applied to the AST before the conversion. By default, the
+        `PodocToPandocPreProcessor`.
+
+    """
+
+    bottom_up = True
+
+    def __init__(self, passes=None):
+        super(PodocToPandoc, self).__init__()
+        self.passes = (passes if passes is not None else
+                       PassManager([PodocToPandocPreProcessor()]))
+
     def transform_Node(self, node):
         if node.is_native():
             return _node_dict(node,
@@ -296,7 +334,11 @@ class PodocToPandoc(TreeTransformer):
         return {'t': 'Math', 'c': [{'t': 'InlineMath'}, contents]}
 
     def transform_main(self, ast):
-        ast = PodocToPandocPreProcessor().transform(ast)
+        ast = self.passes.transform(ast)
+        return self.transform_document(ast)
+
+    def transform_document(self, ast):
+        """Return the pandoc document of an AST, without pre-processing it."""
         blocks = self.transform(ast)['c']
         # Save podoc metadata in the pandoc JSON.
         m = ast.get('metadata', {})
@@ -316,18 +358,41 @@ def ast_from_pandoc(d, **kwargs):
     return PandocToPodoc(**kwargs).transform_main(d)
 
 
-class PandocToPodocPostProcessor(TreeTransformer):
-    def transform_Node(self, node):
-        """Call the transformation methods recursively."""
-        children = self.transform_children(node)
-        node.children = children
-        return node
+def ast_from_pandoc_json(s, **kwargs):
+    """Convert a pandoc JSON string to an AST, while the JSON is parsed."""
+    return PandocToPodoc(**kwargs).loads(s)
+
+
+def _unsupported_message(name, child):
+    return ("The pandoc element `{}` is not supported: its contents include a {} "
+            "that is neither an element nor a string.".format(name, type(child).__name__))
+
+
+class PandocToPodocPostProcessor(TreeRewriter):
+    """Transform the AST after the conversion from pandoc."""
+
+    node_local = True
 
 
 class PandocToPodoc(TreeTransformer):
-    def __init__(self, bullet_char=None):
+    """Convert a pandoc document to an AST.
+
+    Parameters
+    ----------
+
+    bullet_char : str ('*')
+        The bullet character of the bullet lists.
+    passes : PassManager (None)
+        The passes applied to the AST after the conversion. By default, the
+        `PandocToPodocPostProcessor`.
+
+    """
+
+    def __init__(self, bullet_char=None, passes=None):
         super(TreeTransformer, self).__init__()
         self.bullet_char = bullet_char or DEFAULT_BULLET_SYMBOL
+        self.passes = (passes if passes is not None else
+                       PassManager([PandocToPodocPostProcessor()]))
 
     def get_node_name(self, node):
         return node['t']
@@ -335,25 +400,92 @@ class PandocToPodoc(TreeTransformer):
     def get_node_children(self, node):
         return node.get('c', None)
 
-    def set_next_child(self, child, next_child):
-        pass
-
     def transform(self, d):
         if isinstance(d, str):
             return d
-        c = self.get_node_children(d)
-        node = ASTNode(self.get_node_name(d))
-        children = self.get_transform_func(d)(c, node)
+        table = self._dispatch_table()
+        default = table['Node']
+        get_name = self.get_node_name
+        get_children = self.get_node_children
+        # NOTE: the tree is created from the root to the leaves with an explicit stack,
+        # so that pandoc documents of any depth can be transformed. Items of the stack:
+        # `(node, elements)` where `elements` are to be transformed into the children.
+        out = ASTNode('Node')
+        stack = [(out, [d])]
+        while stack:
+            parent, elements = stack.pop()
+            nodes = []
+            for d in elements:
+                if isinstance(d, str):
+                    nodes.append(d)
+                    continue
+                if not isinstance(d, dict):
+                    raise ValueError(_unsupported_message(parent.name, d))
+                name = get_name(d)
+                node = ASTNode(name)
+                children = table.get(name, default)(self, get_children(d), node)
+                if isinstance(children, str):
+                    nodes.append(children)
+                    continue
+                children = children or []
+                assert isinstance(children, list)
+                nodes.append(node)
+                stack.append((node, children))
+            # Merge consecutive strings in the list of children.
+            parent.children = _merge_str(nodes)
+        return out.children[0]
+
+    # Single-pass decoder
+    # --------------------------------------------------------------------------------------------
+
+    def decode_element(self, d):
+        """Convert a pandoc element whose contents have already been converted.
+
+        The transformation methods are the same as in `transform()`, and the children
+        they return are either converted (nodes and strings), or pandoc elements without
+        contents, which are converted here.
+
+        """
+        table = self._dispatch_table()
+        name = d['t']
+        node = ASTNode(name)
+        children = table.get(name, table['Node'])(self, d.get('c', None), node)
         if isinstance(children, str):
             return children
-        children = children or []
-        assert isinstance(children, list)
-        # Recursively transform all children and assign them to the node.
-        node.children = [self.transform(child) for child in children]
-        # Merge consecutive strings in the list of children.
-        node.children = _merge_str(node.children)
+        nodes = []
+        for child in children or ():
+            if isinstance(child, dict):
+                child = self.decode_element(child)
+            # NOTE: the contents of the unsupported elements, like the attributes of a
+            # Div, are neither nodes nor strings.
+            if not isinstance(child, (ASTNode, str)):
+                raise ValueError(_unsupported_message(name, child))
+            nodes.append(child)
+        node.children = _merge_str(nodes)
         return node
 
+    def object_hook(self, d):
+        """Convert a pandoc element as soon as it is parsed by the JSON decoder.
+
+        The JSON objects are parsed from the leaves to the root, so that the contents of
+        an element are converted before the element. The elements without contents are
+        kept, as they can be parameters of their parent, like the math and list styles,
+        and so are the metadata.
+
+        """
+        name = d.get('t', None)
+        if 'c' not in d or not isinstance(name, str) or name.startswith('Meta'):
+            return d
+        return self.decode_element(d)
+
+    def loads(self, s):
+        """Convert a pandoc JSON string to an AST in a single pass: the nodes are
+        created while the JSON is parsed, without the intermediate pandoc document."""
+        return self.transform_main(json.loads(s, object_hook=self.object_hook))
+
+    # Transformation methods
+    # --------------------------------------------------------------------------------------------
+
     def transform_Node(self, c, node):
         # By default, obj['c'] is the list of children to process.
         return c
@@ -429,9 +561,11 @@ class PandocToPodoc(TreeTransformer):
         # Special case: the root.
         # Process the root: obj is a list, and the second item
         # is a list of blocks to process.
-        children = [self.transform(block) for block in obj['blocks']]
+        # NOTE: the blocks may have been converted by the single-pass decoder.
+        children = [self.transform(block) if isinstance(block, dict) else block
+                    for block in obj['blocks']]
         out = ASTNode('root', children=children)
-        out = PandocToPodocPostProcessor().transform(out)
+        out = self.passes.transform(out)
         # Load metadata.
         m = obj.get('meta', {})
         if m:
@@ -443,6 +577,17 @@ class PandocToPodoc(TreeTransformer):
 # pandoc plugin
 #-------------------------------------------------------------------------------------------------
 
+def _pandoc_output_kwargs(lang, context):
+    """Return the extra pandoc arguments needed when converting to a language."""
+    if lang not in PANDOC_OUTPUT_FILE_REQUIRED:
+        return {}
+    output = context.get('output', None)
+    if not output:
+        raise ValueError("The target language %s requires an output file.", lang)
+    context['output_file_required'] = True
+    return {'outputfile': output}
+
+
 class PandocPlugin(IPlugin):
     def attach(self, podoc):
         if not has_pandoc():  # pragma: no cover
@@ -456,10 +601,8 @@ class PandocPlugin(IPlugin):
             def conv(doc, context=None):
                 """Convert a document from `lang` to the podoc AST, via
                 pandoc."""
-                d = pandoc(doc, 'json', format=lang)
-                # Convert the
-                ast = ast_from_pandoc(json.loads(d))
-                return ast
+                d = pandoc(doc, 'json', format=lang, **process_options(context))
+                return ast_from_pandoc_json(d)
             return conv
 
         # podoc_langs = podoc.languages
@@ -470,23 +613,15 @@ class PandocPlugin(IPlugin):
             podoc.register_lang(source, pandoc=True,
                                 file_ext=PANDOC_FILE_EXTENSIONS.get(source, None),
                                 )
-            podoc.register_func(source=source, target='ast', func=func)
+            podoc.register_func(source=source, target='ast', func=func, pandoc=True)
 
         # From AST to pandoc target formats.
         def _make_target_func(lang):
-            output_file_required = lang in PANDOC_OUTPUT_FILE_REQUIRED
-
             def conv(ast, context=None):
                 """Convert a document from the podoc AST to `lang`, via pandoc."""
                 d = json.dumps(ast.to_pandoc())
-                context = context or {}
-                kwargs = {}
-                if output_file_required:
-                    output = context.get('output', None)
-                    if not output:
-                        raise ValueError("The target language %s requires an output file.", lang)
-                    kwargs = {'outputfile': output}
-                    context['output_file_required'] = True
+                kwargs = _pandoc_output_kwargs(lang, context or {})
+                kwargs.update(process_options(context))
                 out = pandoc(d, lang, format='json', **kwargs)
                 return out
             return conv
@@ -497,9 +632,35 @@ class PandocPlugin(IPlugin):
             #     continue
             func = _make_target_func(target)
             podoc.register_lang(target, pandoc=True,
-                                file_ext=PANDOC_FILE_EXTENSIONS.get(source, None),
+                                file_ext=PANDOC_FILE_EXTENSIONS.get(target, None),
                                 )
-            podoc.register_func(source='ast', target=target, func=func)
+            podoc.register_func(source='ast', target=target, func=func, pandoc=True)
+
+        # Direct conversions between pandoc formats, skipping the podoc AST.
+        def _make_direct_func(source, target):
+            def conv(doc, context=None):
+                """Convert a document from `source` to `target` with a single
+                pandoc call."""
+                kwargs = _pandoc_output_kwargs(target, context or {})
+                kwargs.update(process_options(context))
+                return pandoc(doc, target, format=source, **kwargs)
+            return conv
+
+        for source in source_langs:
+            for target in target_langs:
+                # NOTE: 'json' is an alias for 'ast'.
+                if source == target or 'json' in (source, target):
+                    continue
+                # Only use a direct conversion when both sides are handled by
+                # pandoc: native podoc readers and writers (for example
+                # Markdown) always go through the AST.
+                fs = podoc.get_func(source, 'ast')
+                ft = podoc.get_func('ast', target)
+                if not (fs and fs.get('pandoc') and ft and ft.get('pandoc')):
+                    continue
+                podoc.register_func(source=source, target=target,
+                                    func=_make_direct_func(source, target),
+                                    pandoc=True)
 
 
 #-------------------------------------------------------------------------------------------------
@@ -513,7 +674,6 @@ class ASTPlugin(IPlugin):
         podoc.register_lang('ast', file_ext='.json',
                             load_func=self.load, dump_func=self.dump,
                             loads_func=self.loads, dumps_func=self.dumps,
-                            eq_filter=self.eq_filter,
                             )
 
     def load(self, file_or_path):
@@ -522,11 +682,8 @@ class ASTPlugin(IPlugin):
         with _get_file(file_or_path, 'r') as f:
             # Get the path to the JSON file.
             # path = op.realpath(f.name)
-            d = json.load(f)
-        assert isinstance(d, dict)
-        ast = ast_from_pandoc(d)
-        assert isinstance(ast, ASTNode)
-        return ast
+            s = f.read()
+        return self.loads(s)
 
     def dump(self, ast, file_or_path, context=None):
         """Dump an AST instance to a JSON file."""
@@ -546,9 +703,7 @@ class ASTPlugin(IPlugin):
 
     def loads(self, s):
         """Load a JSON string and return an AST instance."""
-        d = json.loads(s)
-        assert isinstance(d, dict)
-        ast = ast_from_pandoc(d)
+        ast = ast_from_pandoc_json(s)
         assert isinstance(ast, ASTNode)
         return ast
 
@@ -559,9 +714,3 @@ class ASTPlugin(IPlugin):
         assert isinstance(d, dict)
         return json.dumps(d, sort_keys=True, indent=2,
                           separators=(',', ': '))
-
-    def eq_filter(self, ast):
-        def f(node):
-            # node.pop('metadata', None)
-            return node
-        return filter_tree(ast, f)
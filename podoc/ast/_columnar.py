@@ -0,0 +1,349 @@
+# -*- coding: utf-8 -*-
+
+"""Columnar AST.
+
+A columnar AST stores a podoc AST in a few contiguous arrays instead of a tree of
+Python objects, which is much more compact for very large documents. It can be
+converted to and from `ASTNode` trees, queried with vectorized operations (with NumPy
+when it is available), and rendered by the tree transformers through read-only node
+views, without creating the tree of nodes.
+
+"""
+
+
+#-------------------------------------------------------------------------------------------------
+# Imports
+#-------------------------------------------------------------------------------------------------
+
+from array import array
+from collections import Counter
+import logging
+
+from podoc.tree import Node
+from ._ast import ASTNode, PodocToPandoc
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+logger = logging.getLogger(__name__)
+
+
+#-------------------------------------------------------------------------------------------------
+# Utils
+#-------------------------------------------------------------------------------------------------
+
+def _ints(values=()):
+    return array('i', values)
+
+
+def _as_numpy(a):
+    """Return a NumPy view of an integer array, without copying it."""
+    return np.frombuffer(a, dtype=np.intc)
+
+
+#-------------------------------------------------------------------------------------------------
+# Columnar AST
+#-------------------------------------------------------------------------------------------------
+
+class ColumnarAST(object):
+    """AST stored in contiguous arrays.
+
+    The nodes are numbered in depth-first order, the root being the node 0. The strings
+    of the AST are nodes too, with an empty name. Every node has the following columns:
+
+    * `types`: index of the node's name in the string table
+    * `parents`: index of the parent node, or -1 for the root
+    * `ends`: index following the last descendant of the node, so that the descendants
+      of the node `i` are the nodes `i + 1` to `ends[i] - 1`
+    * `texts`: for the string nodes, index of the string in the string table, or -1
+
+    The fields of the node `i` are the rows `attr_offsets[i]` to `attr_offsets[i + 1] - 1`
+    of the `attr_keys` (index in the string table) and `attr_values` (index in the value
+    table) columns.
+
+    The strings are interned, so that the repeated names, words, languages, and so on
+    are only stored once.
+
+    """
+
+    def __init__(self):
+        self.types = _ints()
+        self.parents = _ints()
+        self.ends = _ints()
+        self.texts = _ints()
+        self.attr_offsets = _ints([0])
+        self.attr_keys = _ints()
+        self.attr_values = _ints()
+        self.strings = []
+        self.values = []
+        self._string_ids = {}
+        self._value_ids = {}
+        # NOTE: the string nodes have the type 0, an empty name.
+        self._intern('')
+
+    def _intern(self, s):
+        i = self._string_ids.get(s, None)
+        if i is None:
+            i = self._string_ids[s] = len(self.strings)
+            self.strings.append(s)
+        return i
+
+    def _intern_value(self, value):
+        try:
+            key = (type(value), value)
+            i = self._value_ids.get(key, None)
+        except TypeError:
+            # Unhashable values are not interned.
+            key = i = None
+        if i is None:
+            i = len(self.values)
+            self.values.append(value)
+            if key is not None:
+                self._value_ids[key] = i
+        return i
+
+    def _add_node(self, parent, name=None, text=None, fields=()):
+        self.parents.append(parent)
+        self.types.append(self._intern(name) if name is not None else 0)
+        self.texts.append(self._intern(text) if text is not None else -1)
+        for key, value in fields:
+            self.attr_keys.append(self._intern(key))
+            self.attr_values.append(self._intern_value(value))
+        self.attr_offsets.append(len(self.attr_keys))
+
+    @classmethod
+    def from_ast(cls, ast):
+        """Create a columnar AST from an AST."""
+        self = cls()
+        stack = [(ast, -1)]
+        while stack:
+            node, parent = stack.pop()
+            if isinstance(node, str):
+                self._add_node(parent, text=node)
+                continue
+            index = len(self.types)
+            self._add_node(parent, name=node.name,
+                           fields=[(key, value) for key, value in node.items()
+                                   if key not in ('name', 'children')])
+            stack.extend((child, index) for child in reversed(node.children))
+        # The descendants of a node follow it.
+        n = len(self.types)
+        ends = self.ends = _ints(range(1, n + 1))
+        parents = self.parents
+        for i in range(n - 1, 0, -1):
+            p = parents[i]
+            if ends[i] > ends[p]:
+                ends[p] = ends[i]
+        return self
+
+    # Nodes
+    # --------------------------------------------------------------------------------------------
+
+    def __len__(self):
+        """Number of nodes, including the strings."""
+        return len(self.types)
+
+    @property
+    def root(self):
+        """Read-only view of the root node."""
+        return self.node(0)
+
+    def node(self, index):
+        """Return a read-only view of a node, or the string of a string node."""
+        t = self.texts[index]
+        return self.strings[t] if t >= 0 else ColumnarNode(self, index)
+
+    def name(self, index):
+        """Name of a node, or None for a string node."""
+        return self.strings[self.types[index]] if self.texts[index] < 0 else None
+
+    def iter_children(self, index):
+        """Iterate over the indices of the children of a node."""
+        ends = self.ends
+        end = ends[index]
+        i = index + 1
+        while i < end:
+            yield i
+            i = ends[i]
+
+    def children(self, index):
+        """Return the children of a node: strings and read-only views of nodes."""
+        return [self.node(i) for i in self.iter_children(index)]
+
+    def fields(self, index):
+        """Return the fields of a node, except its name and children."""
+        start, end = self.attr_offsets[index], self.attr_offsets[index + 1]
+        strings, values = self.strings, self.values
+        return {strings[self.attr_keys[r]]: values[self.attr_values[r]]
+                for r in range(start, end)}
+
+    # Conversions
+    # --------------------------------------------------------------------------------------------
+
+    def to_ast(self, index=0):
+        """Create the AST of a node."""
+        nodes = {}
+        root = None
+        for i in range(index, self.ends[index]):
+            t = self.texts[i]
+            node = (self.strings[t] if t >= 0 else
+                    ASTNode(self.strings[self.types[i]], **self.fields(i)))
+            if i == index:
+                root = node
+            else:
+                nodes[self.parents[i]].children.append(node)
+            if t < 0:
+                nodes[i] = node
+        return root
+
+    def to_pandoc(self):
+        """Convert the AST to a pandoc document, without creating the AST."""
+        return PodocToPandoc().transform_document(self.root)
+
+    # Queries
+    # --------------------------------------------------------------------------------------------
+
+    def count_types(self):
+        """Return the number of nodes of every type, strings excluded."""
+        if np is not None:
+            counts = enumerate(np.bincount(_as_numpy(self.types)).tolist())
+        else:
+            counts = Counter(self.types).items()
+        return {self.strings[t]: c for t, c in counts if t and c}
+
+    def find(self, name):
+        """Return the indices of the nodes with a given name."""
+        t = self._string_ids.get(name, None)
+        if not t:
+            return []
+        if np is not None:
+            return np.flatnonzero(_as_numpy(self.types) == t).tolist()
+        return [i for i, ti in enumerate(self.types) if ti == t]
+
+    def depths(self):
+        """Return the depth of all nodes, the root having a depth of 0."""
+        n = len(self)
+        if np is None:
+            # NOTE: the parents come before their children.
+            depths = _ints([0]) * n
+            parents = self.parents
+            for i in range(1, n):
+                depths[i] = depths[parents[i]] + 1
+            return depths
+        # Pointer jumping: every node is linked to an ancestor at a known distance, and
+        # the links are doubled until they reach the root.
+        ancestors = _as_numpy(self.parents).astype(np.intp)
+        depths = (ancestors >= 0).astype(np.intp)
+        while True:
+            idx = np.flatnonzero(ancestors >= 0)
+            if not len(idx):
+                return depths
+            a = ancestors[idx]
+            depths[idx] += depths[a]
+            ancestors[idx] = ancestors[a]
+
+    def select(self, name, key):
+        """Return the value of a field of all nodes with a given name, for example
+        `select('Image', 'url')`."""
+        t = self._string_ids.get(name, None)
+        k = self._string_ids.get(key, None)
+        if not t or k is None:
+            return []
+        if np is not None:
+            offsets = _as_numpy(self.attr_offsets)
+            row_nodes = np.repeat(np.arange(len(self)), np.diff(offsets))
+            rows = np.flatnonzero((_as_numpy(self.attr_keys) == k) &
+                                  (_as_numpy(self.types)[row_nodes] == t))
+            return [self.values[v] for v in _as_numpy(self.attr_values)[rows].tolist()]
+        out = []
+        for i in self.find(name):
+            for r in range(self.attr_offsets[i], self.attr_offsets[i + 1]):
+                if self.attr_keys[r] == k:
+                    out.append(self.values[self.attr_values[r]])
+        return out
+
+    def nbytes(self):
+        """Size of the arrays, in bytes."""
+        return sum(a.itemsize * len(a) for a in (self.types, self.parents, self.ends,
+                                                 self.texts, self.attr_offsets,
+                                                 self.attr_keys, self.attr_values))
+
+
+#-------------------------------------------------------------------------------------------------
+# Columnar node
+#-------------------------------------------------------------------------------------------------
+
+class ColumnarNode(ASTNode):
+    """Read-only view of a node of a columnar AST.
+
+    The views are created when needed, for example by the tree transformers, and they
+    are not stored in the columnar AST. Use `to_ast()` to get a modifiable node.
+
+    """
+
+    __slots__ = ('_ast', '_index')
+
+    def __init__(self, ast, index):
+        object.__setattr__(self, '_ast', ast)
+        object.__setattr__(self, '_index', index)
+        object.__setattr__(self, '_meta', None)
+        object.__setattr__(self, '_digest', None)
+        object.__setattr__(self, '_span', None)
+
+    @property
+    def name(self):
+        return self._ast.name(self._index)
+
+    @property
+    def children(self):
+        return self._ast.children(self._index)
+
+    def __getattr__(self, key):
+        # NOTE: only called for the fields, which are not stored in the view.
+        if key.startswith('_'):
+            raise AttributeError(key)
+        fields = self._ast.fields(self._index)
+        if key in fields:
+            return fields[key]
+        raise AttributeError(key)
+
+    def __setattr__(self, key, value):
+        raise AttributeError("The nodes of a columnar AST are read-only.")
+
+    def __delattr__(self, key):
+        raise AttributeError("The nodes of a columnar AST are read-only.")
+
+    def keys(self):
+        return ['name', 'children'] + list(self._ast.fields(self._index))
+
+    def __getitem__(self, key):
+        if key == 'name':
+            return self.name
+        elif key == 'children':
+            return self.children
+        return self._ast.fields(self._index)[key]
+
+    def __eq__(self, other):
+        if (isinstance(other, ColumnarNode) and other._ast is self._ast and
+                other._index == self._index):
+            return True
+        if not isinstance(other, Node):
+            return NotImplemented
+        return self.to_ast() == (other.to_ast() if isinstance(other, ColumnarNode) else other)
+
+    __hash__ = None
+
+    def to_ast(self):
+        """Create the AST of the node."""
+        return self._ast.to_ast(self._index)
+
+    def copy(self):
+        return self.to_ast()
+
+    def replace(self, **fields):
+        return self.to_ast().replace(**fields)
+
+    def structural_hash(self):
+        return self.to_ast().structural_hash()
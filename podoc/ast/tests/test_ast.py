@@ -8,10 +8,12 @@
 #-------------------------------------------------------------------------------------------------
 
 import json
+import sys
 
-from pytest import fixture
+from pytest import fixture, raises
 
-from .._ast import (ASTNode, ast_from_pandoc, _split_spaces)
+from .._ast import (ASTNode, ast_from_pandoc, ast_from_pandoc_json, _split_spaces)
+from podoc.markdown._markdown import ASTToMarkdown
 from podoc.core import Podoc
 from podoc.utils import (has_pandoc, pandoc,
                          PANDOC_MARKDOWN_FORMAT,
@@ -86,6 +88,23 @@ def test_equal(ast):
     assert ast == ast_2
 
 
+def test_block_like():
+    assert ASTNode('Para').is_block_like()
+    assert ASTNode('CodeCell').is_block_like()
+    assert not ASTNode('Emph').is_block_like()
+    node = ASTNode('custom')
+    assert not node.is_block_like()
+    node._visit_meta['is_block'] = True
+    assert node.is_block_like()
+
+
+def test_text_contents():
+    code = ASTNode('Code', children=['c'])
+    node = ASTNode('Para', children=['a ', ASTNode('Emph', children=['b', code])])
+    assert node.text_contents() == 'a bc'
+    assert ASTNode('Para').text_contents() == ''
+
+
 def test_metadata():
     m = {'hello': 'two *words*'}
     ast = ASTNode('root', metadata=m)
@@ -107,6 +126,36 @@ def test_from_pandoc(ast, ast_pandoc):
     assert ast_from_pandoc(ast_pandoc) == ast
 
 
+def test_from_pandoc_json(ast, ast_pandoc):
+    assert ast_from_pandoc_json(json.dumps(ast_pandoc)) == ast
+
+    # Elements without contents, as blocks, children, and parameters.
+    blocks = [{'t': 'HorizontalRule'},
+              {'t': 'Para', 'c': [{'t': 'Str', 'c': 'a'}, {'t': 'Space'},
+                                  {'t': 'Emph', 'c': [{'t': 'Str', 'c': 'b'}]},
+                                  {'t': 'SoftBreak'}, {'t': 'Str', 'c': 'c'},
+                                  {'t': 'Math', 'c': [{'t': 'InlineMath'}, 'x']}]},
+              {'t': 'OrderedList', 'c': [[3, {'t': 'Decimal'}, {'t': 'Period'}],
+                                         [[{'t': 'Plain', 'c': [{'t': 'Str', 'c': 'i'}]}]]]},
+              ]
+    d = ASTNode('root', metadata={'language': 'python'}).to_pandoc()
+    d['blocks'] = blocks
+    ast_1 = ast_from_pandoc_json(json.dumps(d))
+    assert ast_1 == ast_from_pandoc(d)
+    assert ast_1.metadata == {'language': 'python'}
+    assert ast_1.children[0] == ASTNode('HorizontalRule')
+    assert ast_1.children[1].children[0] == 'a '
+    assert ast_1.children[2].start == 3
+    assert ast_1.children[2].delimiter == '.'
+
+    # Unsupported elements.
+    d['blocks'] = [{'t': 'Div', 'c': [['', [], []], [{'t': 'Para', 'c': []}]]}]
+    with raises(ValueError, match='`Div` is not supported'):
+        ast_from_pandoc_json(json.dumps(d))
+    with raises(ValueError, match='`Div` is not supported'):
+        ast_from_pandoc(d)
+
+
 def test_unknown_node():
     ast = ASTNode('root')
     ast.add_child(ASTNode('Para'))
@@ -123,6 +172,26 @@ def test_unknown_node():
 # Tests with pandoc
 #-------------------------------------------------------------------------------------------------
 
+def test_deep_ast():
+    # Nested block quotes, deeper than the recursion limit.
+    depth = 2 * sys.getrecursionlimit()
+    ast = ASTNode('Para', children=['hello ', ASTNode('Emph', children=['world'])])
+    for i in range(depth):
+        ast = ASTNode('BlockQuote', children=[ast])
+    ast = ASTNode('root', children=[ast])
+
+    d = ast.to_pandoc()
+    ast_1 = ast_from_pandoc(d)
+    for i in range(depth + 1):
+        ast_1 = ast_1.children[0]
+    assert ast_1.name == 'Para'
+    assert ast_1.children[0] == 'hello '
+    assert ast_1.children[1].children == ['world']
+
+    markdown = ASTToMarkdown().transform(ast)
+    assert markdown.endswith('> ' * depth + 'hello *world*')
+
+
 def test_pandoc_conv():
     podoc = Podoc()
     html = '<p><a href="b">a</a></p>'
@@ -130,6 +199,20 @@ def test_pandoc_conv():
     assert podoc.convert_text('[a](b)', lang_chain=['markdown', 'ast', 'rst']) == '`a <b>`__\n'
 
 
+def test_pandoc_direct_conv():
+    podoc = Podoc()
+    # Conversions between pandoc formats use a single pandoc call.
+    html = '<table><tr><td>a</td><td>b</td></tr></table>'
+    rst, context = podoc.convert_text(html, source='html', target='rst', return_context=True)
+    assert context.lang_chain == ['html', 'rst']
+    # Tables are not supported by the podoc AST, but they are kept here.
+    assert rst == '= =\na b\n= =\n'
+    # Native podoc formats still go through the AST.
+    _, context = podoc.convert_text('[a](b)', source='markdown', target='rst',
+                                    return_context=True)
+    assert context.lang_chain == ['markdown', 'ast', 'rst']
+
+
 # We use strict Markdown, but we allow fancy lists.
 
 def _test_pandoc_ast(s):
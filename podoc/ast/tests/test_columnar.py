@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+
+"""Test columnar AST."""
+
+
+#-------------------------------------------------------------------------------------------------
+# Imports
+#-------------------------------------------------------------------------------------------------
+
+from pytest import fixture, raises, skip
+
+from .. import _columnar
+from .._ast import ASTNode, ASTPlugin
+from .._columnar import ColumnarAST, ColumnarNode
+from podoc.html._html import ASTToHTML
+from podoc.latex._latex import ASTToLaTeX
+from podoc.markdown._markdown import ASTToMarkdown
+from podoc.markdown.parser import MarkdownParser
+from podoc.rst._rst import ASTToRST
+from podoc.utils import get_test_file_path
+
+
+#-------------------------------------------------------------------------------------------------
+# Fixtures
+#-------------------------------------------------------------------------------------------------
+
+_MARKDOWN = ('# Title\n\nhello *world* ![img](a.png)\n\n'
+             '* item ![other](b.png)\n* **item**\n\n'
+             '```python\nprint(1)\n```\n\n3. three\n4. four\n')
+
+
+@fixture(params=['numpy', 'python'])
+def backend(request, monkeypatch):
+    if request.param == 'python':
+        monkeypatch.setattr(_columnar, 'np', None)
+    elif _columnar.np is None:  # pragma: no cover
+        skip('numpy is not installed')
+    return request.param
+
+
+@fixture
+def ast():
+    return MarkdownParser().parse(_MARKDOWN)
+
+
+#-------------------------------------------------------------------------------------------------
+# Test columnar AST
+#-------------------------------------------------------------------------------------------------
+
+def test_columnar_roundtrip(ast):
+    cast = ColumnarAST.from_ast(ast)
+    assert cast.to_ast() == ast
+    assert cast.root == ast
+    assert cast.root.name == 'root'
+    assert cast.name(0) == 'root'
+
+    # The strings are interned.
+    assert cast.strings.count('item') == 1
+
+    for filename in ('hello.json', 'simplenb.json'):
+        ast = ASTPlugin().load(get_test_file_path('ast', filename))
+        assert ColumnarAST.from_ast(ast).to_ast() == ast
+
+
+def test_columnar_node(ast):
+    cast = ColumnarAST.from_ast(ast)
+    root = cast.root
+    assert isinstance(root, ASTNode)
+    header = root.children[0]
+    assert isinstance(header, ColumnarNode)
+    assert header.level == 1
+    assert header['level'] == 1
+    assert header.get('lang', None) is None
+    assert header.children == ['Title']
+    assert 'level' in header.keys()
+    assert header.to_ast() == ASTNode('Header', level=1, children=['Title'])
+
+    # The views are read-only.
+    with raises(AttributeError):
+        header.level = 2
+    with raises(AttributeError):
+        header.url
+
+    # A subtree can be materialized and modified.
+    assert header.replace(level=2).level == 2
+    assert header.structural_hash() == header.to_ast().structural_hash()
+
+
+def test_columnar_queries(ast, backend):
+    cast = ColumnarAST.from_ast(ast)
+    counts = cast.count_types()
+    assert counts['Image'] == 2
+    assert counts['ListItem'] == 4
+    assert '' not in counts
+
+    assert cast.select('Image', 'url') == ['a.png', 'b.png']
+    assert cast.select('Header', 'level') == [1]
+    assert cast.select('Unknown', 'url') == []
+    assert [cast.name(i) for i in cast.find('CodeBlock')] == ['CodeBlock']
+    assert cast.find('Unknown') == []
+
+    depths = list(cast.depths())
+    assert depths[0] == 0
+    # Root > Header > 'Title'
+    assert depths[:3] == [0, 1, 2]
+    # Root > BulletList > ListItem > Plain > Strong > 'item'
+    assert max(depths) == 5
+
+
+def test_columnar_transforms(ast):
+    cast = ColumnarAST.from_ast(ast)
+    assert cast.to_pandoc() == ast.to_pandoc()
+    assert ASTToMarkdown().transform(cast.root) == ASTToMarkdown().transform(ast)
+
+    # The writers handle the code cells of a columnar AST.
+    ast.add_child(ASTNode('CodeCell', children=[ASTNode('CodeBlock', lang='python',
+                                                        children=['1'])]))
+    cast = ColumnarAST.from_ast(ast)
+    assert cast.root.children[-1].is_block_like()
+    for writer in (ASTToHTML, ASTToLaTeX, ASTToRST):
+        assert writer().transform(cast.root) == writer().transform(ast)
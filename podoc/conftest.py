@@ -53,6 +53,7 @@ def pytest_generate_tests(metafunc):
         # Add source => target for all source => ast, ast => target in conversion pairs.
         sources = [lang for lang, _ in cp if _ == 'ast']
         target = [lang for _, lang in cp if _ == 'ast']
-        cp.extend([(a, b) for (a, b) in product(sources, target) if a != b])
+        cp.extend([(a, b) for (a, b) in product(sources, target)
+                   if a != b and (a, b) not in cp])
         print(cp)
         metafunc.parametrize('source_target', cp, ids=(lambda pair: '-to-'.join(pair)))
@@ -12,9 +12,12 @@ import glob
 import inspect
 import logging
 import os.path as op
+import time
 
-from .utils import Bunch, load_text, dump_text, _create_dir_if_not_exists
+from .utils import (Bunch, load_text, dump_text, _create_dir_if_not_exists,
+                    ConversionTimeout, ConversionCancelled, has_pandoc)
 from .plugin import get_plugins
+from .tree import PassManager
 
 logger = logging.getLogger(__name__)
 
@@ -32,15 +35,21 @@ def _graph_from_edges(edges):
 
 
 def _bfs_paths(graph, start, target):
-    """Generate paths from start to target."""
+    """Generate paths from start to target, shortest first."""
     # http://eddmann.com/posts/depth-first-search-and-breadth-first-search-in-python/  # noqa
+    # NOTE: every vertex is only expanded once, otherwise the search explodes
+    # on dense graphs like the one with the direct pandoc conversions.
+    # NOTE: the neighbors are sorted so that the path does not depend on the
+    # iteration order of the sets.
+    visited = set([start])
     queue = [(start, [start])]
     while queue:
         (vertex, path) = queue.pop(0)
-        for next in graph[vertex] - set(path):
+        for next in sorted(graph[vertex] - visited):
             if next == target:
                 yield path + [next]
             else:
+                visited.add(next)
                 queue.append((next, path + [next]))
 
 
@@ -89,12 +98,29 @@ class Podoc(object):
         List of plugins to load. By default, load all plugins found.
     with_pandoc : bool (True)
         Whether to load all pandoc conversion paths.
+    timeout : float (None)
+        Default maximum duration of a conversion, in seconds.
+    limits : dict (None)
+        Resource limits of the external processes spawned during the conversions,
+        with `memory` (bytes) and `cpu` (seconds) keys.
+    native : bool or list of str (None)
+        Languages for which the native podoc readers and writers are preferred over
+        pandoc. By default, pandoc is preferred when it is installed.
+    plugin_options : dict (None)
+        Keyword arguments of the plugins, by plugin class name, for example
+        `{'MarkdownPlugin': {'cache_size': 1000}}`.
 
     """
 
-    def __init__(self, plugins=None, with_pandoc=True):
+    def __init__(self, plugins=None, with_pandoc=True, timeout=None, limits=None,
+                 native=None, plugin_options=None):
         self._funcs = {}  # mapping `(lang0, lang1) => func`
         self._langs = {}  # mapping `lang: Bunch()`
+        self.timeout = timeout
+        self.limits = limits
+        self.native = native
+        self.plugin_options = plugin_options or {}
+        self.with_pandoc = with_pandoc
         self._load_plugins(plugins, with_pandoc)
 
     def _load_plugins(self, plugins=None, with_pandoc=True):
@@ -105,18 +131,34 @@ class Podoc(object):
             # Skip pandoc plugin.
             if not with_pandoc and p.__name__ == 'PandocPlugin':
                 continue
-            p().attach(self)
+            p(**self.plugin_options.get(p.__name__, {})).attach(self)
+
+    def prefers_native(self, lang):
+        """Return whether the native conversions of a language are preferred over pandoc."""
+        if self.native is None:
+            return not has_pandoc()
+        if isinstance(self.native, bool):
+            return self.native
+        return lang in self.native
 
     # Main methods
     # --------------------------------------------------------------------------------------------
 
     def register_func(self, func=None, source=None, target=None,
                       pre_filter=None, post_filter=None,
-                      ):
-        """Register a conversion function between two languages."""
+                      **kwargs):
+        """Register a conversion function between two languages.
+
+        Extra keyword arguments are saved along with the function, for example
+        `pandoc=True` for conversions that are done by pandoc.
+
+        """
         if func is None:
             return lambda _: self.register_func(_, source=source,
-                                                target=target)
+                                                target=target,
+                                                pre_filter=pre_filter,
+                                                post_filter=post_filter,
+                                                **kwargs)
         assert func
         assert 'context' in inspect.getargspec(func).args
         source = source or _get_annotation(func, 'source')
@@ -131,7 +173,7 @@ class Podoc(object):
         self._funcs[(source, target)] = Bunch(func=func,
                                               pre_filter=pre_filter,
                                               post_filter=post_filter,
-                                              )
+                                              **kwargs)
 
     def register_lang(self, name, file_ext=None,
                       load_func=None, dump_func=None,
@@ -161,6 +203,7 @@ class Podoc(object):
 
     def _create_context(self, path=None, source=None, target=None, lang_chain=None,
                         output=None, output_dir=None,
+                        timeout=None, cancel=None,
                         ):
 
         # Infer source and target from lang_chain.
@@ -214,25 +257,47 @@ class Podoc(object):
             # Construct the output filename.
             output = op.join(output_dir, op.splitext(op.basename(path))[0] + extension)
 
+        # Deadline of the conversion.
+        timeout = timeout if timeout is not None else self.timeout
+        deadline = time.monotonic() + timeout if timeout is not None else None
+
         return Bunch(path=path, source=source, target=target,
-                     lang_chain=lang_chain, output=output)
+                     lang_chain=lang_chain, output=output,
+                     timeout=timeout, deadline=deadline, cancel=cancel,
+                     limits=self.limits)
+
+    def _check_context(self, context):
+        """Raise an exception if the conversion has been cancelled or is past its deadline."""
+        if context.get('cancel', None) is not None and context.cancel.is_set():
+            raise ConversionCancelled()
+        if (context.get('deadline', None) is not None and
+                time.monotonic() >= context.deadline):
+            raise ConversionTimeout(timeout=context.timeout)
 
     def _make_conversion(self, obj, context):
+        # Post-filter of the previous conversion.
+        post_filter = None
         # Iterate over all successive pairs.
         for t0, t1 in zip(context.lang_chain, context.lang_chain[1:]):
+            self._check_context(context)
             # Get the function registered for t0, t1.
             fd = self._funcs.get((t0, t1), None)
             if not fd:
                 raise ValueError("No function registered for `{}` => `{}`.".
                                  format(t0, t1))
             f = fd.func
-            # Pre-filter.
-            obj = fd.pre_filter(obj, context=context) if fd.pre_filter else obj
+            # Pre-filter, fused with the previous post-filter when both are pass managers.
+            pre_filter = fd.pre_filter
+            if post_filter and isinstance(post_filter, PassManager) and \
+                    isinstance(pre_filter, PassManager):
+                pre_filter = post_filter + pre_filter
+            elif post_filter:
+                obj = post_filter(obj, context=context)
+            obj = pre_filter(obj, context=context) if pre_filter else obj
             # Perform the conversion.
             obj = f(obj, context=context)
-            # Post-filter.
-            obj = fd.post_filter(obj, context=context) if fd.post_filter else obj
-        return obj
+            post_filter = fd.post_filter
+        return post_filter(obj, context=context) if post_filter else obj
 
     def _convert_from_context(self, obj_or_path, context, is_path=None, do_append=None):
         # Load the object from disk if necessary.
@@ -249,24 +314,39 @@ class Podoc(object):
 
     def convert_text(self, text, source=None, target=None, lang_chain=None,
                      output=None, output_dir=None,
-                     return_context=False):
+                     return_context=False, timeout=None, cancel=None):
+        """Convert a text or an object.
+
+        The conversion raises `ConversionTimeout` if it lasts more than `timeout` seconds,
+        and `ConversionCancelled` when the `cancel` event (`threading.Event`) is set.
+
+        """
         # Create the context object.
         context = self._create_context(source=source, target=target, lang_chain=lang_chain,
-                                       output=output, output_dir=output_dir,)
+                                       output=output, output_dir=output_dir,
+                                       timeout=timeout, cancel=cancel)
         obj = self._convert_from_context(text, context, is_path=False)
         if return_context:
             return obj, context
         return obj
 
     def convert_files(self, paths, source=None, target=None, lang_chain=None,
-                      output=None, output_dir=None):
-        """Convert a file by passing it through a chain of conversion functions."""
+                      output=None, output_dir=None, timeout=None, cancel=None):
+        """Convert a file by passing it through a chain of conversion functions.
+
+        The timeout applies to the conversion of every file. Setting the `cancel` event
+        stops the conversion of the current file and of the remaining files.
+
+        """
         objs = []
         for i, path in enumerate(paths):
+            if cancel is not None and cancel.is_set():
+                raise ConversionCancelled()
             # Create the context object.
             context = self._create_context(path=path, source=source, target=target,
                                            lang_chain=lang_chain,
                                            output=output, output_dir=output_dir,
+                                           timeout=timeout, cancel=cancel,
                                            )
             logger.debug("Converting `%s` from %s to %s.", op.basename(context.path),
                          context.source, context.target)
@@ -276,11 +356,13 @@ class Podoc(object):
         return objs[0] if objs and len(objs) else objs
 
     def convert_file(self, path, source=None, target=None, lang_chain=None,
-                     output=None, output_dir=None, return_context=False):
+                     output=None, output_dir=None, return_context=False,
+                     timeout=None, cancel=None):
         # Create the context object.
         context = self._create_context(path=path, source=source, target=target,
                                        lang_chain=lang_chain,
                                        output=output, output_dir=output_dir,
+                                       timeout=timeout, cancel=cancel,
                                        )
         logger.debug("Converting `%s` from %s to %s.", op.basename(context.path),
                      context.source, context.target)
@@ -289,6 +371,15 @@ class Podoc(object):
             return obj, context
         return obj
 
+    def get_func(self, source, target):
+        """Return the conversion registered between two languages, if any.
+
+        The returned object has `func`, `pre_filter` and `post_filter` fields,
+        as well as the extra keyword arguments passed to `register_func()`.
+
+        """
+        return self._funcs.get((source, target), None)
+
     def pre_filter(self, obj, source, target):
         fd = self._funcs.get((source, target), None)
         if fd and fd.pre_filter:
@@ -0,0 +1,11 @@
+# -*- coding: utf-8 -*-
+# flake8: noqa
+
+"""HTML plugin."""
+
+
+#-------------------------------------------------------------------------------------------------
+# Imports
+#-------------------------------------------------------------------------------------------------
+
+from ._html import ASTToHTML, HTMLPlugin
@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+
+"""HTML plugin."""
+
+
+#-------------------------------------------------------------------------------------------------
+# Imports
+#-------------------------------------------------------------------------------------------------
+
+import base64
+from html import escape
+import logging
+import mimetypes
+import os.path as op
+import re
+
+from podoc.ast import ASTNode
+from podoc.plugin import IPlugin
+from podoc.tree import TreeTransformer
+from podoc.utils import _get_file, _get_resources_path, _save_resources
+
+logger = logging.getLogger(__name__)
+
+
+#-------------------------------------------------------------------------------------------------
+# Utils
+#-------------------------------------------------------------------------------------------------
+
+def _header_id(text):
+    """Return the identifier of a header, like pandoc's `auto_identifiers` extension."""
+    text = re.sub(r'[^\w\s.-]', '', text.lower())
+    text = re.sub(r'\s+', '-', text.strip())
+    # Remove everything up to the first letter.
+    text = re.sub(r'^[^a-z]+', '', text)
+    return text or 'section'
+
+
+#-------------------------------------------------------------------------------------------------
+# HTML renderer
+#-------------------------------------------------------------------------------------------------
+
+class ASTToHTML(TreeTransformer):
+    """Read an AST and render an HTML string.
+
+    Parameters
+    ----------
+
+    resources : dict (None)
+        Mapping `{filename: data}` used to embed the `{resource:...}` images that have
+        not been replaced by actual paths.
+
+    """
+
+    def __init__(self, resources=None):
+        self.resources = resources or {}
+        self._header_ids = set()
+
+    def get_inner_contents(self, node):
+        # Consecutive blocks are separated by new lines, inline nodes are concatenated.
+        first = node.children[0] if node.children else None
+        delim = '\n' if isinstance(first, ASTNode) and first.is_block_like() else ''
+        return delim.join(filter(None, self.transform_children(node)))
+
+    def iter_blocks(self, ast):
+        """Yield the HTML of all top-level blocks of an AST."""
+        self._header_ids = set()
+        for child in ast.children:
+            out = self.transform(child)
+            if out:
+                yield out
+
+    def write(self, ast, file):
+        """Render an AST to an open file, one top-level block at a time."""
+        for out in self.iter_blocks(ast):
+            file.write(out)
+            file.write('\n')
+
+    def transform_str(self, text):
+        return escape(text, quote=False)
+
+    def transform_Node(self, node):
+        return self.get_inner_contents(node)
+
+    def transform_root(self, node):
+        # NOTE: the header identifiers are unique within a document.
+        self._header_ids = set()
+        return self.get_inner_contents(node)
+
+    # Block nodes
+    # --------------------------------------------------------------------------------------------
+
+    def transform_Plain(self, node):
+        return self.get_inner_contents(node)
+
+    def transform_Para(self, node):
+        return '<p>{}</p>'.format(self.get_inner_contents(node))
+
+    def transform_Header(self, node):
+        # NOTE: the identifiers are unique within a document, like in pandoc.
+        base = _header_id(node.text_contents())
+        id, i = base, 0
+        while id in self._header_ids:
+            i += 1
+            id = '{}-{}'.format(base, i)
+        self._header_ids.add(id)
+        return '<h{0} id="{1}">{2}</h{0}>'.format(node.level, id,
+                                                  self.get_inner_contents(node))
+
+    def transform_CodeBlock(self, node):
+        lang = node.get('lang', None) or ''
+        m = re.match(r'^\{output:([^\}]+)\}$', lang)
+        if m:
+            # Code cell output: stdout, stderr, result, error.
+            lang = 'output ' + m.group(1)
+        cls = ' class="{}"'.format(escape(lang)) if lang else ''
+        return '<pre{}><code>{}</code></pre>'.format(cls, self.get_inner_contents(node))
+
+    def transform_CodeCell(self, node):
+        # NOTE: code cells are rendered as their source and outputs, so that a notebook
+        # and its Markdown version give the same HTML.
+        return '\n'.join(filter(None, self.transform_children(node)))
+
+    def transform_BlockQuote(self, node):
+        return '<blockquote>\n{}\n</blockquote>'.format(self.get_inner_contents(node))
+
+    def transform_MathBlock(self, node):
+        return '<span class="math display">\\[{}\\]</span>'.format(
+            self.get_inner_contents(node))
+
+    def transform_RawBlock(self, node):
+        # NOTE: like pandoc, only raw HTML is kept in the output.
+        if node.get('raw_type', None) == 'html':
+            return ''.join(node.children)
+        return ''
+
+    def transform_HorizontalRule(self, node):
+        return '<hr />'
+
+    def transform_BulletList(self, node):
+        return '<ul>\n{}\n</ul>'.format('\n'.join(self.transform_children(node)))
+
+    def transform_OrderedList(self, node):
+        start = node.get('start', 1)
+        attrs = ' start="{}"'.format(start) if start != 1 else ''
+        return '<ol{}>\n{}\n</ol>'.format(attrs, '\n'.join(self.transform_children(node)))
+
+    def transform_ListItem(self, node):
+        return '<li>{}</li>'.format(self.get_inner_contents(node))
+
+    # Inline nodes
+    # --------------------------------------------------------------------------------------------
+
+    def transform_Emph(self, node):
+        return '<em>{}</em>'.format(self.get_inner_contents(node))
+
+    def transform_Strong(self, node):
+        return '<strong>{}</strong>'.format(self.get_inner_contents(node))
+
+    def transform_Strikeout(self, node):
+        return '<del>{}</del>'.format(self.get_inner_contents(node))
+
+    def transform_Code(self, node):
+        return '<code>{}</code>'.format(self.get_inner_contents(node))
+
+    def transform_LineBreak(self, node):
+        return '<br />\n'
+
+    def transform_Math(self, node):
+        return '<span class="math inline">\\({}\\)</span>'.format(self.get_inner_contents(node))
+
+    def transform_Link(self, node):
+        return '<a href="{}">{}</a>'.format(escape(node.url), self.get_inner_contents(node))
+
+    def _image_url(self, url):
+        m = re.match(r'^\{resource:([^\}]+)\}$', url)
+        if not m or m.group(1) not in self.resources:
+            return url
+        # Embed the resource in the HTML document.
+        fn = m.group(1)
+        mime_type = mimetypes.guess_type(fn)[0] or 'application/octet-stream'
+        data = base64.b64encode(self.resources[fn]).decode('ascii')
+        return 'data:{};base64,{}'.format(mime_type, data)
+
+    def transform_Image(self, node):
+        return '<img src="{}" alt="{}" />'.format(escape(self._image_url(node.url)),
+                                                  escape(node.text_contents()))
+
+
+#-------------------------------------------------------------------------------------------------
+# HTML plugin
+#-------------------------------------------------------------------------------------------------
+
+class HTMLPlugin(IPlugin):
+    def attach(self, podoc):
+        podoc.register_lang('html', file_ext='.html', load_func=self.load, dump_func=self.dump)
+        # NOTE: when pandoc is available, the conversion to HTML is done by pandoc unless
+        # the native writer is preferred.
+        if podoc.with_pandoc and not podoc.prefers_native('html'):
+            return
+        podoc.register_func(source='ast', target='html', func=self.write)
+
+    def load(self, file_or_path):
+        """Load an HTML file and return a string."""
+        with _get_file(file_or_path, 'r') as f:
+            text = f.read()
+        return text
+
+    def dump(self, text, file_or_path, context=None):
+        """Dump string to an HTML file."""
+        with _get_file(file_or_path, 'w') as f:
+            path = op.realpath(f.name)
+            f.write(text)
+            f.write('\n')
+        # Save the resources.
+        if (context or {}).get('resources', {}):
+            _save_resources(context.get('resources', {}), _get_resources_path(path))
+
+    def write(self, ast, context=None):
+        assert isinstance(ast, ASTNode)
+        return ASTToHTML(resources=(context or {}).get('resources', None)).transform(ast)
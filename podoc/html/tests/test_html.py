@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+
+"""Test HTML plugin."""
+
+
+#-------------------------------------------------------------------------------------------------
+# Imports
+#-------------------------------------------------------------------------------------------------
+
+from io import StringIO
+
+from podoc.ast import ASTNode, ASTPlugin
+from podoc.core import Podoc
+from podoc.markdown.parser import MarkdownParser
+from podoc.utils import get_test_file_path, has_pandoc
+from .._html import ASTToHTML, HTMLPlugin
+
+
+#-------------------------------------------------------------------------------------------------
+# Utils
+#-------------------------------------------------------------------------------------------------
+
+def _test_renderer(markdown, html):
+    ast = MarkdownParser().parse(markdown)
+    assert ASTToHTML().transform(ast) == html
+
+
+#-------------------------------------------------------------------------------------------------
+# Test HTML renderer
+#-------------------------------------------------------------------------------------------------
+
+def test_html_inline():
+    _test_renderer('hello *world* **a** `b < c`', '<p>hello <em>world</em> '
+                   '<strong>a</strong> <code>b &lt; c</code></p>')
+    _test_renderer('a\nb', '<p>a<br />\nb</p>')
+    _test_renderer('[a & b](http://x.org/?a=1&b=2)',
+                   '<p><a href="http://x.org/?a=1&amp;b=2">a &amp; b</a></p>')
+    _test_renderer('![an *image*](a.png)', '<p><img src="a.png" alt="an image" /></p>')
+
+
+def test_html_math():
+    _test_renderer('$x<y$', '<p><span class="math inline">\\(x&lt;y\\)</span></p>')
+    _test_renderer('$$y$$', '<p><span class="math display">\\[y\\]</span></p>')
+
+
+def test_html_blocks():
+    _test_renderer('# Hello world\n\n# Hello world',
+                   '<h1 id="hello-world">Hello world</h1>\n'
+                   '<h1 id="hello-world-1">Hello world</h1>')
+    _test_renderer('```python\na = 1\n```\n\n```{output:stdout}\n1\n```',
+                   '<pre class="python"><code>a = 1</code></pre>\n'
+                   '<pre class="output stdout"><code>1</code></pre>')
+    _test_renderer('> a\n\n---', '<blockquote>\n<p>a</p>\n</blockquote>\n<hr />')
+    _test_renderer('\\begin{align*}\nx\n\\end{align*}', '')
+
+
+def test_html_lists():
+    _test_renderer('* a\n* b', '<ul>\n<li>a</li>\n<li>b</li>\n</ul>')
+    _test_renderer('3. a\n\n4. b', '<ol start="3">\n<li><p>a</p></li>\n<li><p>b</p></li>\n</ol>')
+    _test_renderer('* a\n    * b', '<ul>\n<li>a\n<ul>\n<li>b</li>\n</ul></li>\n</ul>')
+
+
+def test_html_code_cell():
+    ast = ASTNode('root')
+    cell = ast.add_child(ASTNode('CodeCell'))
+    cell.add_child(ASTNode('CodeBlock', lang='python', children=['1']))
+    cell.add_child(ASTNode('Para', children=[ASTNode('Image', url='{resource:a.png}',
+                                                     children=['Output'])]))
+    assert ASTToHTML().transform(ast) == ('<pre class="python"><code>1</code></pre>\n'
+                                          '<p><img src="{resource:a.png}" alt="Output" /></p>')
+
+    # Embedded resources.
+    html = ASTToHTML(resources={'a.png': b'abc'}).transform(ast)
+    assert 'src="data:image/png;base64,YWJj"' in html
+
+
+def test_html_write():
+    ast = ASTPlugin().load(get_test_file_path('ast', 'simplenb.json'))
+    f = StringIO()
+    ASTToHTML().write(ast, f)
+    assert f.getvalue() == ASTToHTML().transform(ast) + '\n'
+
+
+def test_html_header_ids():
+    ast = MarkdownParser().parse('# A\n\n# A')
+    assert ASTToHTML().transform(ast) == '<h1 id="a">A</h1>\n<h1 id="a-1">A</h1>'
+
+    # The identifiers are unique within a document, not across documents.
+    writer = ASTToHTML()
+    assert writer.transform(ast) == writer.transform(ast)
+    f = StringIO()
+    writer.write(ast, f)
+    writer.write(ast, f)
+    assert f.getvalue() == 2 * (writer.transform(ast) + '\n')
+
+
+def test_html_plugin():
+    podoc = Podoc(plugins=[HTMLPlugin], with_pandoc=False)
+    assert podoc.get_func('ast', 'html')
+
+    # The native writer is only used with pandoc if it is preferred.
+    podoc = Podoc(native=['html'])
+    assert not podoc.get_func('ast', 'html').get('pandoc', None)
+    if has_pandoc():
+        podoc = Podoc()
+        assert podoc.get_func('ast', 'html').pandoc
@@ -0,0 +1,11 @@
+# -*- coding: utf-8 -*-
+# flake8: noqa
+
+"""LaTeX plugin."""
+
+
+#-------------------------------------------------------------------------------------------------
+# Imports
+#-------------------------------------------------------------------------------------------------
+
+from ._latex import ASTToLaTeX, LaTeXPlugin
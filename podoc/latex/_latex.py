@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+
+"""LaTeX plugin."""
+
+
+#-------------------------------------------------------------------------------------------------
+# Imports
+#-------------------------------------------------------------------------------------------------
+
+import logging
+import os.path as op
+import re
+
+from podoc.ast import ASTNode
+from podoc.plugin import IPlugin
+from podoc.tree import TreeTransformer
+from podoc.utils import _get_file, _get_resources_path, _save_resources
+
+logger = logging.getLogger(__name__)
+
+
+#-------------------------------------------------------------------------------------------------
+# Utils
+#-------------------------------------------------------------------------------------------------
+
+# Template of a standalone document: `$body$` is replaced by the rendered document.
+DEFAULT_TEMPLATE = r'''\documentclass{article}
+\usepackage[utf8]{inputenc}
+\usepackage{amsmath,amssymb}
+\usepackage{graphicx}
+\usepackage{hyperref}
+\usepackage[normalem]{ulem}
+\begin{document}
+$body$
+\end{document}
+'''
+
+_ESCAPE = {
+    '\\': r'\textbackslash{}',
+    '{': r'\{',
+    '}': r'\}',
+    '$': r'\$',
+    '&': r'\&',
+    '#': r'\#',
+    '_': r'\_',
+    '%': r'\%',
+    '~': r'\textasciitilde{}',
+    '^': r'\textasciicircum{}',
+}
+_ESCAPE_RE = re.compile('|'.join(re.escape(c) for c in _ESCAPE))
+
+_SECTIONS = ('section', 'subsection', 'subsubsection', 'paragraph', 'subparagraph')
+_ENUM_COUNTERS = ('enumi', 'enumii', 'enumiii', 'enumiv')
+
+
+def escape_latex(text):
+    """Escape the LaTeX special characters in a text."""
+    return _ESCAPE_RE.sub(lambda m: _ESCAPE[m.group(0)], text)
+
+
+def _split_template(template):
+    """Return the parts of a template before and after `$body$`."""
+    if '$body$' not in template:
+        raise ValueError("The LaTeX template should contain `$body$`.")
+    head, tail = template.split('$body$', 1)
+    return head, tail
+
+
+#-------------------------------------------------------------------------------------------------
+# LaTeX renderer
+#-------------------------------------------------------------------------------------------------
+
+class ASTToLaTeX(TreeTransformer):
+    """Read an AST and render a LaTeX string.
+
+    Parameters
+    ----------
+
+    template : str (None)
+        LaTeX template where `$body$` is replaced by the rendered document, for example
+        `DEFAULT_TEMPLATE`. By default, only the body is rendered.
+
+    """
+
+    def __init__(self, template=None):
+        self.template = template
+        # Depth of the ordered lists.
+        self._enum_depth = 0
+
+    def get_inner_contents(self, node):
+        # Consecutive blocks are separated by blank lines, inline nodes are concatenated.
+        first = node.children[0] if node.children else None
+        delim = '\n\n' if isinstance(first, ASTNode) and first.is_block_like() else ''
+        return delim.join(filter(None, self.transform_children(node)))
+
+    def iter_blocks(self, ast):
+        """Yield the LaTeX of all top-level blocks of an AST."""
+        for child in ast.children:
+            out = self.transform(child)
+            if out:
+                yield out
+
+    def render(self, ast):
+        """Render an AST, using the template if there is one."""
+        body = self.transform(ast)
+        if not self.template:
+            return body
+        head, tail = _split_template(self.template)
+        return head + body + tail
+
+    def write(self, ast, file):
+        """Render an AST to an open file, one top-level block at a time."""
+        head, tail = _split_template(self.template) if self.template else ('', '\n')
+        file.write(head)
+        for i, out in enumerate(self.iter_blocks(ast)):
+            if i:
+                file.write('\n\n')
+            file.write(out)
+        file.write(tail)
+
+    def code_environment(self, lang):
+        """Return the environment of a code block with a given language.
+
+        Output blocks have a `{output:...}` language. Override this method to use an
+        environment defined in the template, for example from the `listings` package.
+
+        """
+        return 'verbatim'
+
+    def transform_str(self, text):
+        return escape_latex(text)
+
+    def transform_Node(self, node):
+        return self.get_inner_contents(node)
+
+    # Block nodes
+    # --------------------------------------------------------------------------------------------
+
+    def transform_Plain(self, node):
+        return self.get_inner_contents(node)
+
+    def transform_Para(self, node):
+        return self.get_inner_contents(node)
+
+    def transform_Header(self, node):
+        section = _SECTIONS[min(node.level, len(_SECTIONS)) - 1]
+        return '\\{}{{{}}}'.format(section, self.get_inner_contents(node))
+
+    def transform_CodeBlock(self, node):
+        # NOTE: the code is written verbatim.
+        env = self.code_environment(node.get('lang', None) or '')
+        return '\\begin{{{0}}}\n{1}\n\\end{{{0}}}'.format(env, ''.join(node.children))
+
+    def transform_CodeCell(self, node):
+        # NOTE: code cells are rendered as their source and outputs, so that a notebook
+        # and its Markdown version give the same LaTeX.
+        return '\n\n'.join(filter(None, self.transform_children(node)))
+
+    def transform_BlockQuote(self, node):
+        return '\\begin{{quote}}\n{}\n\\end{{quote}}'.format(self.get_inner_contents(node))
+
+    def transform_MathBlock(self, node):
+        return '\\[{}\\]'.format(''.join(node.children))
+
+    def transform_RawBlock(self, node):
+        # NOTE: like pandoc, only raw LaTeX is kept in the output.
+        if node.get('raw_type', None) in ('latex', 'tex'):
+            return ''.join(node.children)
+        return ''
+
+    def transform_HorizontalRule(self, node):
+        return '\\begin{center}\\rule{0.5\\linewidth}{0.5pt}\\end{center}'
+
+    def transform_BulletList(self, node):
+        items = '\n'.join(self.transform_children(node))
+        return '\\begin{{itemize}}\n{}\n\\end{{itemize}}'.format(items)
+
+    def transform_OrderedList(self, node):
+        counter = _ENUM_COUNTERS[min(self._enum_depth, len(_ENUM_COUNTERS) - 1)]
+        self._enum_depth += 1
+        items = '\n'.join(self.transform_children(node))
+        self._enum_depth -= 1
+        # Numbering style and start.
+        options = ''
+        delimiter = node.get('delimiter', '.')
+        if delimiter != '.':
+            options += '\\def\\label{0}{{\\arabic{{{0}}}{1}}}\n'.format(counter, delimiter)
+        start = node.get('start', 1)
+        if start != 1:
+            options += '\\setcounter{{{}}}{{{}}}\n'.format(counter, start - 1)
+        return '\\begin{{enumerate}}\n{}{}\n\\end{{enumerate}}'.format(options, items)
+
+    def transform_ListItem(self, node):
+        # NOTE: the item contents are not indented, which would change the verbatim code.
+        return '\\item ' + self.get_inner_contents(node)
+
+    # Inline nodes
+    # --------------------------------------------------------------------------------------------
+
+    def transform_Emph(self, node):
+        return '\\emph{{{}}}'.format(self.get_inner_contents(node))
+
+    def transform_Strong(self, node):
+        return '\\textbf{{{}}}'.format(self.get_inner_contents(node))
+
+    def transform_Strikeout(self, node):
+        return '\\sout{{{}}}'.format(self.get_inner_contents(node))
+
+    def transform_Code(self, node):
+        return '\\texttt{{{}}}'.format(self.get_inner_contents(node))
+
+    def transform_LineBreak(self, node):
+        return '\\\\\n'
+
+    def transform_Math(self, node):
+        return '${}$'.format(''.join(node.children))
+
+    def transform_Link(self, node):
+        url = re.sub(r'([%#\\])', r'\\\1', node.url)
+        return '\\href{{{}}}{{{}}}'.format(url, self.get_inner_contents(node))
+
+    def transform_Image(self, node):
+        # NOTE: the resources that have not been replaced by actual paths are referred
+        # to by their file name.
+        url = re.sub(r'^\{resource:([^\}]+)\}$', r'\1', node.url)
+        return '\\includegraphics{{{}}}'.format(url)
+
+
+#-------------------------------------------------------------------------------------------------
+# LaTeX plugin
+#-------------------------------------------------------------------------------------------------
+
+class LaTeXPlugin(IPlugin):
+    """LaTeX plugin.
+
+    Parameters
+    ----------
+
+    template : str (None)
+        LaTeX template where `$body$` is replaced by the rendered document. By default,
+        only the body is rendered. To use a template, attach a plugin instance to a
+        Podoc instance loaded without this plugin.
+
+    """
+
+    def __init__(self, template=None):
+        self.template = template
+
+    def attach(self, podoc):
+        podoc.register_lang('latex', file_ext='.tex', load_func=self.load, dump_func=self.dump)
+        # NOTE: when pandoc is available, the conversion to LaTeX is done by pandoc unless
+        # the native writer is preferred.
+        if podoc.with_pandoc and not podoc.prefers_native('latex'):
+            return
+        podoc.register_func(source='ast', target='latex', func=self.write)
+
+    def load(self, file_or_path):
+        """Load a LaTeX file and return a string."""
+        with _get_file(file_or_path, 'r') as f:
+            text = f.read()
+        return text
+
+    def dump(self, text, file_or_path, context=None):
+        """Dump string to a LaTeX file."""
+        with _get_file(file_or_path, 'w') as f:
+            path = op.realpath(f.name)
+            f.write(text)
+            f.write('\n')
+        # Save the resources.
+        if (context or {}).get('resources', {}):
+            _save_resources(context.get('resources', {}), _get_resources_path(path))
+
+    def write(self, ast, context=None):
+        assert isinstance(ast, ASTNode)
+        return ASTToLaTeX(template=self.template).render(ast)
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+
+"""Test LaTeX plugin."""
+
+
+#-------------------------------------------------------------------------------------------------
+# Imports
+#-------------------------------------------------------------------------------------------------
+
+from io import StringIO
+
+from pytest import raises
+
+from podoc.ast import ASTNode, ASTPlugin
+from podoc.core import Podoc
+from podoc.markdown.parser import MarkdownParser
+from podoc.utils import get_test_file_path
+from .._latex import ASTToLaTeX, LaTeXPlugin, DEFAULT_TEMPLATE, escape_latex
+
+
+#-------------------------------------------------------------------------------------------------
+# Utils
+#-------------------------------------------------------------------------------------------------
+
+def _test_renderer(markdown, latex):
+    ast = MarkdownParser().parse(markdown)
+    assert ASTToLaTeX().transform(ast) == latex
+
+
+#-------------------------------------------------------------------------------------------------
+# Test LaTeX renderer
+#-------------------------------------------------------------------------------------------------
+
+def test_escape_latex():
+    assert escape_latex('a_b 50% {x} \\ ~') == ('a\\_b 50\\% \\{x\\} \\textbackslash{} '
+                                                '\\textasciitilde{}')
+
+
+def test_latex_inline():
+    _test_renderer('hello *world* **a** `b_c`',
+                   'hello \\emph{world} \\textbf{a} \\texttt{b\\_c}')
+    _test_renderer('a\nb', 'a\\\\\nb')
+    _test_renderer('[a](http://x.org/#b)', '\\href{http://x.org/\\#b}{a}')
+    _test_renderer('![a](a.png)', '\\includegraphics{a.png}')
+    _test_renderer('$x_1$ and $$y_1$$', '$x_1$ and \\[y_1\\]')
+
+
+def test_latex_blocks():
+    _test_renderer('# A\n\n### B', '\\section{A}\n\n\\subsubsection{B}')
+    _test_renderer('```python\na = {}\n```', '\\begin{verbatim}\na = {}\n\\end{verbatim}')
+    _test_renderer('> a', '\\begin{quote}\na\n\\end{quote}')
+    _test_renderer('\\begin{align*}\nx\n\\end{align*}', '\\begin{align*}\nx\n\\end{align*}')
+
+
+def test_latex_lists():
+    _test_renderer('* a\n* b', '\\begin{itemize}\n\\item a\n\\item b\n\\end{itemize}')
+    _test_renderer('3) a\n4) b',
+                   '\\begin{enumerate}\n\\def\\labelenumi{\\arabic{enumi})}\n'
+                   '\\setcounter{enumi}{2}\n\\item a\n\\item b\n\\end{enumerate}')
+    # Nested ordered lists use the next counter.
+    _test_renderer('1. a\n    2. b',
+                   '\\begin{enumerate}\n\\item a\n\n\\begin{enumerate}\n'
+                   '\\setcounter{enumii}{1}\n\\item b\n\\end{enumerate}\n\\end{enumerate}')
+
+
+def test_latex_code_cell():
+    ast = ASTNode('root')
+    cell = ast.add_child(ASTNode('CodeCell'))
+    cell.add_child(ASTNode('CodeBlock', lang='python', children=['1']))
+    cell.add_child(ASTNode('CodeBlock', lang='{output:result}', children=['1']))
+    cell.add_child(ASTNode('Para', children=[ASTNode('Image', url='{resource:a.png}',
+                                                     children=['Output'])]))
+
+    class Renderer(ASTToLaTeX):
+        def code_environment(self, lang):
+            return 'output' if lang.startswith('{output') else 'verbatim'
+
+    assert Renderer().transform(ast) == ('\\begin{verbatim}\n1\n\\end{verbatim}\n\n'
+                                         '\\begin{output}\n1\n\\end{output}\n\n'
+                                         '\\includegraphics{a.png}')
+
+
+def test_latex_template():
+    ast = ASTPlugin().load(get_test_file_path('ast', 'simplenb.json'))
+    body = ASTToLaTeX().transform(ast)
+
+    latex = ASTToLaTeX(template=DEFAULT_TEMPLATE).render(ast)
+    assert latex.startswith('\\documentclass')
+    assert body in latex
+
+    # Streaming writer.
+    for template in (None, DEFAULT_TEMPLATE):
+        f = StringIO()
+        ASTToLaTeX(template=template).write(ast, f)
+        assert f.getvalue() == (latex if template else body + '\n')
+
+    with raises(ValueError):
+        ASTToLaTeX(template='no body').render(ast)
+
+
+def test_latex_plugin():
+    podoc = Podoc(plugins=[], with_pandoc=False)
+    LaTeXPlugin(template='BEGIN\n$body$\nEND').attach(podoc)
+    assert podoc.convert_text(MarkdownParser().parse('*a*'), source='ast',
+                              target='latex') == 'BEGIN\n\\emph{a}\nEND'
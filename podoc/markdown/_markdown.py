@@ -7,16 +7,17 @@
 # Imports
 #-------------------------------------------------------------------------------------------------
 
+from concurrent.futures import ThreadPoolExecutor
 import logging
 import os.path as op
 
-import pypandoc
-
 from podoc.ast import ASTNode, ASTPlugin
+from podoc.markdown.parser import MarkdownParser
 from podoc.markdown.renderer import MarkdownRenderer
 from podoc.plugin import IPlugin
-from podoc.tree import TreeTransformer
+from podoc.tree import RenderCache, TreeTransformer
 from podoc.utils import (PANDOC_MARKDOWN_FORMAT,
+                         has_pandoc, pandoc, process_options,
                          _get_file,
                          _get_resources_path, _save_resources,
                          )
@@ -29,13 +30,31 @@ logger = logging.getLogger(__name__)
 #-------------------------------------------------------------------------------------------------
 
 class ASTToMarkdown(TreeTransformer):
-    """Read an AST and render a Markdown string."""
+    """Read an AST and render a Markdown string.
+
+    Parameters
+    ----------
+
+    cache : RenderCache (None)
+        If set, the Markdown of the top-level blocks is cached by `transform_main()`,
+        so that only the blocks that changed since the last rendering are rendered.
+
+    """
+
+    bottom_up = True
 
-    def __init__(self):
+    def __init__(self, cache=None):
         self.renderer = MarkdownRenderer()
+        self.cache = cache
         # Nested lists.
         self._lists = []
 
+    def transform_main(self, ast):
+        """Render a whole document, with the render cache if there is one."""
+        if self.cache is None or not isinstance(ast, ASTNode):
+            return self.transform(ast)
+        return self.transform_cached(ast, self.cache)
+
     def get_inner_contents(self, node):
         delim = ''
         # What is the delimiter between children? If the children are
@@ -49,9 +68,6 @@ class ASTToMarkdown(TreeTransformer):
                 delim = '\n\n'
         return delim.join(self.transform_children(node))
 
-    def transform_str(self, text):
-        return text
-
     def transform_Node(self, node):
         return self.get_inner_contents(node)
 
@@ -144,8 +160,57 @@ class ASTToMarkdown(TreeTransformer):
 # Markdown plugin
 #-------------------------------------------------------------------------------------------------
 
+# Paragraph separating the blocks parsed with a single pandoc call.
+_BLOCK_DELIMITER = '@@@@@ PODOC-NEW-BLOCK @@@@@'
+
+
 class MarkdownPlugin(IPlugin):
+    """Markdown plugin.
+
+    Parameters
+    ----------
+
+    native : bool (None)
+        Whether to read Markdown with the native podoc parser instead of pandoc.
+        By default, the native parser is only used when pandoc is not installed.
+    cache_size : int (0)
+        Number of top-level blocks whose AST and Markdown are cached between the
+        conversions, so that reading or writing a large document after a small change
+        only parses or renders the changed blocks. The caches are disabled by default.
+        The top-level blocks of the ASTs read with the cache are frozen and shared with
+        the cache (see `Node.freeze()`): they cannot be modified in place, use `copy()`
+        or the persistent updates instead. Only the frozen blocks are looked up in the
+        render cache, so that writing an AST read with the cache only renders its new
+        blocks.
+    jobs : int (1)
+        Number of concurrent pandoc processes parsing the chunks of a large document.
+        The documents are split between top-level blocks, and each chunk is parsed
+        with the reference link definitions of the whole document. The native parser
+        always parses the whole document, since sending the ASTs back from worker
+        processes would cost more than parsing them. The documents are not split either
+        when `cache_size` or `sourcepos` is set, since the blocks are then parsed
+        separately, or when the conversion has resource limits, which cannot be safely
+        set in processes started from several threads.
+    chunk_size : int (1000000)
+        Approximate size of the chunks, in characters. Smaller documents are parsed at
+        once.
+    sourcepos : bool (False)
+        Whether to set the `source_span` of the top-level blocks, as character offsets in
+        the Markdown string. The blocks are then parsed separately.
+
+    """
+
+    def __init__(self, native=None, cache_size=0, jobs=1, chunk_size=1000000,
+                 sourcepos=False):
+        self.native = native if native is not None else not has_pandoc()
+        self.sourcepos = sourcepos
+        self.jobs = jobs
+        self.chunk_size = chunk_size
+        self.parse_cache = RenderCache(cache_size) if cache_size else None
+        self.render_cache = RenderCache(cache_size) if cache_size else None
+
     def attach(self, podoc):
+        self.native = podoc.prefers_native('markdown')
         podoc.register_lang('markdown', file_ext='.md', load_func=self.load, dump_func=self.dump,)
         podoc.register_func(source='markdown', target='ast', func=self.read)
         podoc.register_func(source='ast', target='markdown', func=self.write)
@@ -166,13 +231,123 @@ class MarkdownPlugin(IPlugin):
         if (context or {}).get('resources', {}):
             _save_resources(context.get('resources', {}), _get_resources_path(path))
 
-    def read(self, contents, context=None):
-        assert isinstance(contents, str)
-        js = pypandoc.convert_text(contents, 'json', format=PANDOC_MARKDOWN_FORMAT)
+    def _parse(self, contents, context=None):
+        if self.native:
+            return MarkdownParser().parse(contents)
+        js = pandoc(contents, 'json', format=PANDOC_MARKDOWN_FORMAT,
+                    **process_options(context))
         ast = ASTPlugin().loads(js)
         return ast
 
+    def _parse_blocks(self, parser, blocks, context=None):
+        """Parse top-level blocks and return the list of nodes of every block, or None
+        if the blocks could not be separated."""
+        if self.native:
+            return [parser.parse_blocks(block.split('\n')) for block in blocks]
+        # NOTE: the blocks are parsed with a single pandoc call, separated by delimiter
+        # paragraphs, and followed by the reference link definitions of the document.
+        contents = ('\n\n%s\n\n' % _BLOCK_DELIMITER).join(blocks)
+        contents += '\n\n' + '\n'.join(parser._reference_lines)
+        out = [[]]
+        for child in self._parse(contents, context=context).children:
+            if child.name == 'Para' and child.children == [_BLOCK_DELIMITER]:
+                out.append([])
+            else:
+                out[-1].append(child)
+        return out if len(out) == len(blocks) else None
+
+    def _read_blocks(self, contents, context=None):
+        """Parse a document block by block, only parsing the blocks that are not in the
+        parse cache, and set the source spans of the blocks."""
+        parser = MarkdownParser()
+        spans = parser.split_spans(contents)
+        blocks = [block for _, _, block in spans]
+        cache = self.parse_cache
+        # NOTE: the reference link definitions apply to all blocks.
+        references = '\n'.join(parser._reference_lines)
+        keys = [(block, references) for block in blocks]
+        nodes = [cache.get(key, None) if cache is not None else None for key in keys]
+        missing = [i for i, block_nodes in enumerate(nodes) if block_nodes is None]
+        if missing:
+            parsed = self._parse_blocks(parser, [blocks[i] for i in missing], context=context)
+            if parsed is None:
+                logger.debug("Unable to parse the blocks separately, parsing the document.")
+                return self._parse(contents, context=context)
+            for i, block_nodes in zip(missing, parsed):
+                nodes[i] = tuple(block_nodes)
+                if cache is not None:
+                    # NOTE: the cached blocks are frozen, so that they can be shared by
+                    # the ASTs, and looked up in the render cache without being hashed.
+                    for node in nodes[i]:
+                        node.freeze()
+                    cache[keys[i]] = nodes[i]
+        if not self.sourcepos:
+            return ASTNode('root', children=[node for block_nodes in nodes
+                                             for node in block_nodes])
+        children = []
+        for (start, end, _), block_nodes in zip(spans, nodes):
+            for node in block_nodes:
+                if node.frozen:
+                    # NOTE: the source span of a shared block is set on a new node, which
+                    # shares the children of the block.
+                    node = node.replace()
+                    node.source_span = (start, end)
+                    node.freeze()
+                else:
+                    node.source_span = (start, end)
+                children.append(node)
+        return ASTNode('root', children=children)
+
+    def _iter_chunks(self, contents):
+        """Split a document between top-level blocks, into chunks of about `chunk_size`
+        characters followed by the reference link definitions of the document."""
+        parser = MarkdownParser()
+        blocks = parser.split(contents)
+        references = '\n'.join(parser._reference_lines)
+        chunk, size = [], 0
+        for block in blocks:
+            chunk.append(block)
+            size += len(block)
+            if size >= self.chunk_size:
+                yield '\n\n'.join(chunk) + '\n\n' + references
+                chunk, size = [], 0
+        if chunk:
+            yield '\n\n'.join(chunk) + '\n\n' + references
+
+    def _read_parallel(self, contents, context=None):
+        """Parse the chunks of a document with concurrent pandoc processes and
+        concatenate their blocks."""
+        chunks = list(self._iter_chunks(contents))
+        logger.debug("Parsing %d Markdown chunks with %d jobs.", len(chunks), self.jobs)
+        # NOTE: the threads wait for the pandoc processes, which share the conversion
+        # context and its cancellation event with this process.
+        with ThreadPoolExecutor(self.jobs) as executor:
+            parsed = list(executor.map(
+                lambda chunk: self._parse(chunk, context=context).children, chunks))
+        return ASTNode('root', children=[node for nodes in parsed for node in nodes])
+
+    def read(self, contents, context=None):
+        assert isinstance(contents, str)
+        # NOTE: the YAML metadata block is only supported by pandoc, on whole documents.
+        if not self.native and contents.startswith('---'):
+            return self._parse(contents, context=context)
+        parallel = not self.native and self.jobs > 1 and len(contents) > self.chunk_size
+        if self.parse_cache is not None or self.sourcepos:
+            if parallel:
+                logger.debug("The blocks are parsed separately, the %d jobs are not used.",
+                             self.jobs)
+            return self._read_blocks(contents, context=context)
+        # NOTE: the resource limits are set in the pandoc processes by a `preexec_fn`,
+        # which is not safe while other threads are running.
+        if parallel and (context or {}).get('limits', None):
+            logger.debug("The conversion has resource limits, parsing the document "
+                         "with a single job.")
+            parallel = False
+        if parallel:
+            return self._read_parallel(contents, context=context)
+        return self._parse(contents, context=context)
+
     def write(self, ast, context=None):
         assert isinstance(ast, (ASTNode, str))
-        text = ASTToMarkdown().transform(ast)
+        text = ASTToMarkdown(cache=self.render_cache).transform_main(ast)
         return text
@@ -0,0 +1,670 @@
+# -*- coding: utf-8 -*-
+
+"""Native Markdown parser.
+
+This parser converts Markdown to the podoc AST without calling pandoc. It only supports
+the subset of Markdown that has an equivalent in the podoc AST (paragraphs, headers,
+fenced and indented code blocks, block quotes, bullet and ordered lists, math, links,
+images, emphasis, inline code), and it follows the conventions of the pandoc Markdown
+format used by podoc (`PANDOC_MARKDOWN_FORMAT`): every new line in a paragraph is a line
+break, headers, block quotes and lists need a blank line before them, and `$...$`
+and `$$...$$` denote math.
+
+Unlike pandoc, the parser does not apply smart punctuation (quotes, dashes, ellipses
+are kept as they are) and it does not support YAML metadata, tables, definition lists,
+or fancy list styles. Runs of four or more emphasis delimiters (`****a****`) and link
+destinations with unescaped spaces (`[a](b c)`) are also parsed differently.
+
+"""
+
+
+#-------------------------------------------------------------------------------------------------
+# Imports
+#-------------------------------------------------------------------------------------------------
+
+from html import unescape
+import logging
+import re
+import string
+
+from podoc.ast import ASTNode
+from podoc.utils import _merge_str
+
+logger = logging.getLogger(__name__)
+
+
+#-------------------------------------------------------------------------------------------------
+# Regular expressions
+#-------------------------------------------------------------------------------------------------
+
+_FENCE = re.compile(r'^( {0,3})(`{3,}|~{3,})\s*([^`]*?)\s*$')
+_ATX_HEADER = re.compile(r'^ {0,3}(#{1,6})(?:[ \t]+(.*?))??(?:[ \t]+#+)?[ \t]*$')
+_SETEXT_UNDERLINE = re.compile(r'^ {0,3}(=+|-+)[ \t]*$')
+_HORIZONTAL_RULE = re.compile(r'^ {0,3}([-*_])(?:[ \t]*\1){2,}[ \t]*$')
+_BLOCK_QUOTE = re.compile(r'^ {0,3}> ?')
+_BULLET_ITEM = re.compile(r'^( {0,3})([*+-])( +|$)')
+_ORDERED_ITEM = re.compile(r'^( {0,3})(\d{1,9})([.)])( +|$)')
+_RAW_BEGIN = re.compile(r'^ {0,3}\\begin\{([^}]+)\}')
+_REFERENCE = re.compile(r'^ {0,3}\[([^\]]+)\]:[ \t]*(?:<([^<>]*)>|([^\s<>]+))(?:[ \t]+(?:"[^"]*"|\'[^\']*\'|\([^)]*\)))?[ \t]*$')  # noqa
+_ENTITY = re.compile(r'&(?:#[0-9]{1,7}|#[xX][0-9a-fA-F]{1,6}|[a-zA-Z][a-zA-Z0-9]{1,31});')
+_AUTOLINK = re.compile(r'<([a-zA-Z][a-zA-Z0-9+.-]{1,31}:[^\s<>]*)>')
+_SPACES = re.compile(r'[ \t]+')
+# Characters which are percent-encoded in URLs, like pandoc does.
+_URL_ESCAPED = re.compile(r'[\s<>|"{}\[\]^`]')
+# Characters which have a special meaning in inline contents.
+_SPECIAL = re.compile(r'[\\`$!\[<*_&\n \t]')
+
+_PUNCTUATION = set(string.punctuation)
+
+
+def _line_offsets(text):
+    """Return the start and end offsets of all lines of a text."""
+    starts, ends = [0], []
+    for m in re.finditer(r'\r\n|\r|\n', text):
+        ends.append(m.start())
+        starts.append(m.end())
+    ends.append(len(text))
+    return starts, ends
+
+
+def _is_blank(line):
+    return not line.strip()
+
+
+def _indentation(line):
+    return len(line) - len(line.lstrip(' '))
+
+
+def _normalize_label(label):
+    return ' '.join(label.split()).lower()
+
+
+def _escape_url(url):
+    """Percent-encode the whitespace and the unsafe characters of a URL."""
+    return _URL_ESCAPED.sub(lambda m: ''.join('%%%02X' % b for b in m.group().encode('utf-8')),
+                            url)
+
+
+#-------------------------------------------------------------------------------------------------
+# Block parser
+#-------------------------------------------------------------------------------------------------
+
+def _list_item_match(line):
+    """Return `(list_type, indent, content_column, start, delimiter)` if the line
+    starts a list item, None otherwise."""
+    m = _BULLET_ITEM.match(line)
+    if m:
+        indent, _, spaces = m.groups()
+        list_type, start, delimiter = 'bullet', None, None
+    else:
+        m = _ORDERED_ITEM.match(line)
+        if not m:
+            return
+        indent, number, delimiter, spaces = m.groups()
+        list_type, start = 'ordered', int(number)
+    # NOTE: a content starting with 5+ spaces is an indented code block.
+    column = m.end() if len(spaces) <= 4 else m.end() - len(spaces) + 1
+    return list_type, len(indent), column, start, delimiter
+
+
+def _closing_fence(lines, i, m):
+    """Return the index of the line closing the code fence opened at line `i`, or None."""
+    fence = m.group(2)
+    for j in range(i + 1, len(lines)):
+        c = _FENCE.match(lines[j])
+        if (c and c.group(2)[0] == fence[0] and len(c.group(2)) >= len(fence) and
+                not c.group(3)):
+            return j
+
+
+def iter_block_spans(lines):
+    """Yield `(start, end, lang)` for all top-level blocks in a list of lines, without
+    parsing them.
+
+    `lines[start:end]` are the lines of the block, and `lang` is the language of code
+    blocks (an empty string for indented code blocks), None for other blocks. The
+    blocks are delimited with the same rules as in `MarkdownParser.parse_blocks()`.
+
+    """
+    i, n = 0, len(lines)
+    while i < n:
+        line = lines[i]
+        if _is_blank(line):
+            i += 1
+            continue
+        start = i
+        m = _FENCE.match(line)
+        j = _closing_fence(lines, i, m) if m else None
+        if j is not None:
+            info = m.group(3)
+            i = j + 1
+            yield start, i, info.split()[0] if info else ''
+            continue
+        if _ATX_HEADER.match(line) or _HORIZONTAL_RULE.match(line):
+            i += 1
+            yield start, i, None
+            continue
+        m = _RAW_BEGIN.match(line)
+        if m:
+            end = '\\end{%s}' % m.group(1)
+            while i < n and end not in lines[i]:
+                i += 1
+            i = min(i + 1, n)
+            yield start, i, None
+            continue
+        is_code = _indentation(line) >= 4
+        item = _list_item_match(line)
+        column = item[2] if item else 0
+        i += 1
+        while i < n:
+            line = lines[i]
+            if not _is_blank(line):
+                if is_code and _indentation(line) < 4:
+                    break
+                m = _FENCE.match(line)
+                if (m and (not item or _indentation(line) < column) and
+                        _closing_fence(lines, i, m) is not None):
+                    break
+                sub = _list_item_match(line) if item else None
+                if sub and sub[1] < column:
+                    column = sub[2]
+                i += 1
+                continue
+            # Blank lines: only code blocks and lists can continue after them.
+            j = i
+            while j < n and _is_blank(lines[j]):
+                j += 1
+            if j == n:
+                break
+            if is_code and _indentation(lines[j]) >= 4:
+                i = j
+                continue
+            if item:
+                sub = _list_item_match(lines[j])
+                if (_indentation(lines[j]) >= min(column, 4) or
+                        (sub and sub[0] == item[0] and sub[4] == item[4])):
+                    i = j
+                    continue
+            break
+        yield start, i, '' if is_code else None
+
+
+class MarkdownParser(object):
+    """Parse Markdown into a podoc AST without pandoc.
+
+    Parameters
+    ----------
+
+    sourcepos : bool (False)
+        Whether to set the `source_span` of the top-level blocks, as character offsets in
+        the Markdown string.
+
+    """
+
+    def __init__(self, sourcepos=False):
+        self.sourcepos = sourcepos
+        self._references = {}
+        # Lines of the reference link definitions.
+        self._reference_lines = []
+        # Index of every line in the source, once the reference link definitions have
+        # been removed.
+        self._line_numbers = []
+
+    def _split_lines(self, text):
+        lines = text.replace('\r\n', '\n').replace('\r', '\n').expandtabs(4).split('\n')
+        return self._extract_references(lines)
+
+    def parse(self, text):
+        """Parse a Markdown string and return an AST."""
+        if not self.sourcepos:
+            return ASTNode('root', children=self.parse_blocks(self._split_lines(text)))
+        children = []
+        for start, end, block in self.split_spans(text):
+            for node in self.parse_blocks(block.split('\n')):
+                node.source_span = (start, end)
+                children.append(node)
+        return ASTNode('root', children=children)
+
+    def split_spans(self, text):
+        """Return `(start, end, block)` for all top-level blocks of a Markdown string,
+        where `text[start:end]` is the source of the block and `block` its text.
+
+        The reference link definitions are removed, and kept in the parser for the
+        parsing of the blocks with `parse_blocks()`.
+
+        """
+        lines = self._split_lines(text)
+        starts, ends = _line_offsets(text)
+        numbers = self._line_numbers
+        return [(starts[numbers[i]], ends[numbers[j - 1]], '\n'.join(lines[i:j]))
+                for i, j, _ in iter_block_spans(lines)]
+
+    def split(self, text):
+        """Return the text of the top-level blocks of a Markdown string (see
+        `split_spans()`)."""
+        lines = self._split_lines(text)
+        return ['\n'.join(lines[i:j]) for i, j, _ in iter_block_spans(lines)]
+
+    def _extract_references(self, lines):
+        """Remove reference link definitions, which may be anywhere in the document."""
+        out = []
+        numbers = self._line_numbers = []
+        fence = None
+        for number, line in enumerate(lines):
+            m = _FENCE.match(line)
+            if m and (fence is None or (m.group(2)[0] == fence[0] and
+                                        len(m.group(2)) >= len(fence) and not m.group(3))):
+                fence = m.group(2) if fence is None else None
+            elif fence is None:
+                m = _REFERENCE.match(line)
+                if m:
+                    url = m.group(2) if m.group(2) is not None else m.group(3)
+                    self._references.setdefault(_normalize_label(m.group(1)), _escape_url(url))
+                    self._reference_lines.append(line)
+                    continue
+            out.append(line)
+            numbers.append(number)
+        return out
+
+    # Blocks
+    # --------------------------------------------------------------------------------------------
+
+    def parse_blocks(self, lines, in_list=False):
+        """Parse a list of lines and return a list of block nodes."""
+        blocks = []
+        para = []  # Lines of the current paragraph.
+
+        def flush():
+            if para:
+                blocks.append(self.parse_paragraph(para))
+                del para[:]
+
+        i, n = 0, len(lines)
+        while i < n:
+            line = lines[i]
+            if _is_blank(line):
+                flush()
+                i += 1
+                continue
+            # Fenced code blocks can interrupt a paragraph.
+            m = _FENCE.match(line)
+            node = None
+            if m:
+                node, i = self._parse_fenced_code(lines, i, m)
+            if node is not None:
+                flush()
+                blocks.append(node)
+                continue
+            if para:
+                m = _SETEXT_UNDERLINE.match(line)
+                if m and len(para) == 1:
+                    level = 1 if m.group(1)[0] == '=' else 2
+                    blocks.append(ASTNode('Header', level=level,
+                                          children=self.parse_inlines(para[0].strip())))
+                    del para[:]
+                    i += 1
+                    continue
+                # NOTE: only sublists can start without a blank line before them.
+                if not (in_list and _list_item_match(line)):
+                    para.append(line)
+                    i += 1
+                    continue
+                flush()
+            # Start of a new block.
+            m = _ATX_HEADER.match(line)
+            if m:
+                blocks.append(ASTNode('Header', level=len(m.group(1)),
+                                      children=self.parse_inlines(m.group(2) or '')))
+                i += 1
+            elif _HORIZONTAL_RULE.match(line):
+                blocks.append(ASTNode('HorizontalRule'))
+                i += 1
+            elif _BLOCK_QUOTE.match(line):
+                node, i = self._parse_block_quote(lines, i)
+                blocks.append(node)
+            elif _indentation(line) >= 4:
+                node, i = self._parse_indented_code(lines, i)
+                blocks.append(node)
+            elif _list_item_match(line):
+                node, i = self._parse_list(lines, i)
+                blocks.append(node)
+            elif _RAW_BEGIN.match(line):
+                node, i = self._parse_raw_block(lines, i, _RAW_BEGIN.match(line).group(1))
+                blocks.append(node)
+            else:
+                para.append(line)
+                i += 1
+        flush()
+        return blocks
+
+    def parse_paragraph(self, lines):
+        text = '\n'.join(line.strip() for line in lines)
+        return ASTNode('Para', children=self.parse_inlines(text))
+
+    def _parse_fenced_code(self, lines, i, m):
+        indent, info = len(m.group(1)), m.group(3)
+        j = _closing_fence(lines, i, m)
+        if j is None:
+            # NOTE: like in pandoc, a fence without a closing fence is regular text.
+            return None, i
+        # Remove the indentation of the opening fence.
+        code = [line[min(indent, _indentation(line)):] for line in lines[i + 1:j]]
+        i = j + 1
+        lang = info.split()[0] if info else ''
+        return ASTNode('CodeBlock', lang=lang, children=['\n'.join(code)]), i
+
+    def _parse_indented_code(self, lines, i):
+        code = []
+        while i < len(lines) and (_is_blank(lines[i]) or _indentation(lines[i]) >= 4):
+            code.append(lines[i][4:])
+            i += 1
+        # Remove the trailing blank lines, which are not part of the code block.
+        while code and _is_blank(code[-1]):
+            code.pop()
+            i -= 1
+        return ASTNode('CodeBlock', lang='', children=['\n'.join(code)]), i
+
+    def _parse_block_quote(self, lines, i):
+        contents = []
+        while i < len(lines):
+            line = lines[i]
+            m = _BLOCK_QUOTE.match(line)
+            if m:
+                contents.append(line[m.end():])
+            elif (not _is_blank(line) and contents and not _is_blank(contents[-1]) and
+                    not _FENCE.match(line)):
+                # Lazy continuation line.
+                contents.append(line)
+            else:
+                break
+            i += 1
+        return ASTNode('BlockQuote', children=self.parse_blocks(contents)), i
+
+    def _parse_raw_block(self, lines, i, env):
+        end = '\\end{%s}' % env
+        raw = []
+        while i < len(lines):
+            raw.append(lines[i])
+            i += 1
+            if end in raw[-1]:
+                break
+        return ASTNode('RawBlock', raw_type='latex', children=['\n'.join(raw).strip()]), i
+
+    def _parse_list(self, lines, i):
+        list_type, _, _, start, delimiter = _list_item_match(lines[i])
+        items = []
+        loose = False
+        n = len(lines)
+        while i < n:
+            m = _list_item_match(lines[i])
+            if not m or m[0] != list_type or m[4] != delimiter:
+                break
+            column = m[2]
+            item = [lines[i][column:]]
+            i += 1
+            while i < n:
+                line = lines[i]
+                if _is_blank(line):
+                    # The item continues if the next non-blank line is indented.
+                    j = i
+                    while j < n and _is_blank(lines[j]):
+                        j += 1
+                    if j < n and _indentation(lines[j]) >= min(column, 4):
+                        item.extend([''] * (j - i))
+                        i = j
+                        continue
+                    break
+                indent = _indentation(line)
+                if indent >= column or (indent >= 4 and not _list_item_match(line)):
+                    item.append(line[min(column, indent):])
+                elif (not _is_blank(item[-1]) and not _list_item_match(line) and
+                        not _FENCE.match(line)):
+                    # Lazy continuation line.
+                    item.append(line)
+                else:
+                    break
+                i += 1
+            items.append(item)
+            # A blank line between two items makes the list loose.
+            j = i
+            while j < n and _is_blank(lines[j]):
+                j += 1
+            if j > i and j < n:
+                m = _list_item_match(lines[j])
+                if m and m[0] == list_type and m[4] == delimiter:
+                    loose = True
+                    i = j
+        # A blank line between blocks within an item makes the list loose too.
+        loose = loose or any(_is_blank(line) for item in items for line in item)
+        children = []
+        for item in items:
+            blocks = self.parse_blocks(item, in_list=True)
+            if not loose:
+                for block in blocks:
+                    if block.name == 'Para':
+                        block.name = 'Plain'
+            children.append(ASTNode('ListItem', children=blocks))
+        if list_type == 'bullet':
+            # NOTE: like in the pandoc reader, the bullet character is not kept.
+            node = ASTNode('BulletList', bullet_char='*', delimiter=' ')
+        else:
+            node = ASTNode('OrderedList', start=start, style='Decimal', delimiter=delimiter)
+        node.children = children
+        return node, i
+
+    # Inlines
+    # --------------------------------------------------------------------------------------------
+
+    def parse_inlines(self, text):
+        """Parse inline contents and return a list of nodes and strings."""
+        items = []  # Strings, nodes, and emphasis delimiters (lists).
+        pos, n = 0, len(text)
+        while pos < n:
+            m = _SPECIAL.search(text, pos)
+            if not m:
+                items.append(text[pos:])
+                break
+            if m.start() > pos:
+                items.append(text[pos:m.start()])
+            pos = m.start()
+            c = text[pos]
+            if c in ' \t':
+                end = _SPACES.match(text, pos).end()
+                # NOTE: spaces before a line break are dropped.
+                if end < n and text[end] != '\n':
+                    items.append(' ')
+                pos = end
+            elif c == '\n':
+                items.append(ASTNode('LineBreak'))
+                pos += 1
+            elif c == '\\':
+                nxt = text[pos + 1:pos + 2]
+                if nxt == '\n':
+                    items.append(ASTNode('LineBreak'))
+                    pos += 1
+                elif nxt and nxt in _PUNCTUATION:
+                    items.append(nxt)
+                    pos += 2
+                else:
+                    items.append(c)
+                    pos += 1
+            elif c == '`':
+                pos = self._parse_code(text, pos, items)
+            elif c == '$':
+                pos = self._parse_math(text, pos, items)
+            elif c == '!' or c == '[':
+                pos = self._parse_link(text, pos, items)
+            elif c == '<':
+                m = _AUTOLINK.match(text, pos)
+                if m:
+                    url = m.group(1)
+                    items.append(ASTNode('Link', url=_escape_url(url), children=[url]))
+                    pos = m.end()
+                else:
+                    items.append(c)
+                    pos += 1
+            elif c == '&':
+                m = _ENTITY.match(text, pos)
+                end = m.end() if m else pos + 1
+                items.append(unescape(text[pos:end]))
+                pos = end
+            else:
+                pos = self._parse_delimiter_run(text, pos, items)
+        return self._process_emphasis(items)
+
+    def _parse_code(self, text, pos, items):
+        ticks = re.match(r'`+', text[pos:]).end()
+        m = re.compile(r'(?<!`)`{%d}(?!`)' % ticks).search(text, pos + ticks)
+        if not m:
+            items.append('`' * ticks)
+            return pos + ticks
+        code = ' '.join(text[pos + ticks:m.start()].split())
+        items.append(ASTNode('Code', children=[code]))
+        return m.end()
+
+    def _parse_math(self, text, pos, items):
+        if text.startswith('$$', pos):
+            end = text.find('$$', pos + 2)
+            if end > pos + 2:
+                items.append(ASTNode('MathBlock', children=[text[pos + 2:end]]))
+                return end + 2
+            items.append('$$')
+            return pos + 2
+        # NOTE: the opening $ must be followed by a non-space character, and the next
+        # unescaped $ must follow a non-space character and cannot be followed by a digit.
+        i = pos + 1
+        if i < len(text) and not text[i].isspace():
+            i = text.find('$', i)
+            while i > 0 and text[i - 1] == '\\':
+                i = text.find('$', i + 1)
+            if i > 0 and not text[i - 1].isspace() and not text[i + 1:i + 2].isdigit():
+                items.append(ASTNode('Math', children=[text[pos + 1:i]]))
+                return i + 1
+        items.append('$')
+        return pos + 1
+
+    def _find_closing_bracket(self, text, pos):
+        """Return the position of the bracket closing the one at `pos`."""
+        depth = 0
+        i, n = pos, len(text)
+        while i < n:
+            c = text[i]
+            if c == '\\':
+                i += 2
+                continue
+            if c == '`':
+                # Skip inline code.
+                ticks = re.match(r'`+', text[i:]).end()
+                m = re.compile(r'(?<!`)`{%d}(?!`)' % ticks).search(text, i + ticks)
+                i = m.end() if m else i + ticks
+                continue
+            if c == '[':
+                depth += 1
+            elif c == ']':
+                depth -= 1
+                if depth == 0:
+                    return i
+            i += 1
+        return -1
+
+    def _parse_destination(self, text, pos):
+        """Parse `(url "title")` at `pos` and return `(url, end)`, or None."""
+        m = re.compile(r'\(\s*(?:<([^>\n]*)>|((?:[^\s()\\]|\\.|\([^\s()]*\))*))'
+                       r'(?:\s+(?:"(?:[^"\\]|\\.)*"|\'(?:[^\'\\]|\\.)*\'|\([^)]*\)))?\s*\)'
+                       ).match(text, pos)
+        if not m:
+            return
+        url = m.group(1) if m.group(1) is not None else m.group(2)
+        url = re.sub(r'\\([%s])' % re.escape(string.punctuation), r'\1', url)
+        return _escape_url(url), m.end()
+
+    def _parse_link(self, text, pos, items):
+        is_image = text[pos] == '!'
+        start = pos + 1 if is_image else pos
+        if is_image and text[start:start + 1] != '[':
+            items.append('!')
+            return pos + 1
+        end = self._find_closing_bracket(text, start)
+        if end < 0:
+            items.append(text[pos:start + 1])
+            return start + 1
+        label = text[start + 1:end]
+        url = None
+        d = self._parse_destination(text, end + 1)
+        if d:
+            url, after = d
+        else:
+            # Reference links: [text][ref], [text][] and [text].
+            m = re.compile(r'\[([^\]]*)\]').match(text, end + 1)
+            ref = m.group(1) if m and m.group(1) else label
+            url = self._references.get(_normalize_label(ref), None)
+            after = m.end() if m else end + 1
+        if url is None:
+            items.append(text[pos:start + 1])
+            return start + 1
+        node = ASTNode('Image' if is_image else 'Link', url=url,
+                       children=self.parse_inlines(label))
+        items.append(node)
+        return after
+
+    def _parse_delimiter_run(self, text, pos, items):
+        c = text[pos]
+        end = pos
+        while end < len(text) and text[end] == c:
+            end += 1
+        before = text[pos - 1] if pos > 0 else ' '
+        after = text[end] if end < len(text) else ' '
+        left = not after.isspace() and (after not in _PUNCTUATION or
+                                        before.isspace() or before in _PUNCTUATION)
+        right = not before.isspace() and (before not in _PUNCTUATION or
+                                          after.isspace() or after in _PUNCTUATION)
+        if c == '*':
+            can_open, can_close = left, right
+        else:
+            # NOTE: intraword underscores do not denote emphasis.
+            can_open = left and (not right or before in _PUNCTUATION)
+            can_close = right and (not left or after in _PUNCTUATION)
+        # A delimiter is a mutable list: [char, count, can_open, can_close].
+        items.append([c, end - pos, can_open, can_close])
+        return end
+
+    def _process_emphasis(self, items):
+        """Match the emphasis delimiters and return the list of inline nodes."""
+        i = 0
+        while i < len(items):
+            closer = items[i]
+            if not (isinstance(closer, list) and closer[3]):
+                i += 1
+                continue
+            # Look for the closest matching opener.
+            j = i - 1
+            while j >= 0:
+                opener = items[j]
+                if isinstance(opener, list) and opener[0] == closer[0] and opener[2]:
+                    break
+                j -= 1
+            if j < 0:
+                i += 1
+                continue
+            count = min(opener[1], closer[1], 3)
+            children = self._finalize(items[j + 1:i])
+            if count == 3:
+                # NOTE: like pandoc, `***a***` is a Strong containing an Emph.
+                node = ASTNode('Strong', children=[ASTNode('Emph', children=children)])
+            else:
+                node = ASTNode('Strong' if count == 2 else 'Emph', children=children)
+            opener[1] -= count
+            closer[1] -= count
+            items[j + 1:i] = [node]
+            i = j + 2
+            if not opener[1]:
+                del items[j]
+                i -= 1
+            if not closer[1]:
+                del items[i]
+        return self._finalize(items)
+
+    def _finalize(self, items):
+        """Convert the remaining delimiters to strings and merge consecutive strings."""
+        out = [(item[0] * item[1] if isinstance(item, list) else item) for item in items]
+        return _merge_str([item for item in out if item != ''])
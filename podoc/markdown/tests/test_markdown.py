@@ -7,10 +7,12 @@
 # Imports
 #-------------------------------------------------------------------------------------------------
 
-from pytest import fixture
+from pytest import fixture, raises
 
 from podoc.ast import ASTNode
+from podoc.core import Podoc
 from .._markdown import MarkdownPlugin
+from ..parser import MarkdownParser
 
 
 #-------------------------------------------------------------------------------------------------
@@ -49,6 +51,131 @@ def test_markdown_write(ast, markdown):
     assert MarkdownPlugin().write(ast) == markdown
 
 
+def test_markdown_read_cache():
+    plugin = MarkdownPlugin(native=True, cache_size=10)
+    text = '# Title\n\nhello *world* [a][b]\n\n```\ncode\n\n```\n\n[b]: url'
+    ast = plugin.read(text)
+    assert ast == MarkdownPlugin(native=True).read(text)
+    assert len(plugin.parse_cache) == 3
+
+    # Only the changed blocks are parsed again.
+    new = plugin.read(text.replace('Title', 'Other'))
+    assert new == MarkdownPlugin(native=True).read(text.replace('Title', 'Other'))
+    assert new.children[0] != ast.children[0]
+    assert new.children[1:] == ast.children[1:]
+    assert (plugin.parse_cache.hits, plugin.parse_cache.misses) == (2, 4)
+
+    # The ASTs share the cached blocks, which are frozen.
+    assert new.children[1] is ast.children[1]
+    assert all(node.frozen for node in ast.children)
+    with raises(AttributeError):
+        ast.children[1].add_child(' X')
+    with raises(AttributeError):
+        ast.children[1].children[1].url = 'other'
+    ast.children[1] = ast.children[1].replace(children=['X'])
+    assert plugin.read(text) == MarkdownPlugin(native=True).read(text)
+
+    # The reference link definitions apply to all blocks.
+    new = plugin.read(text.replace(': url', ': other'))
+    assert new.children[1].children[-1].url == 'other'
+
+
+def test_markdown_read_sourcepos():
+    text = '# Title\n\npara\n\n# Title\n'
+    plugin = MarkdownPlugin(native=True, cache_size=10, sourcepos=True)
+    ast = plugin.read(text)
+    assert [node.source_span for node in ast.children] == [(0, 7), (9, 13), (15, 22)]
+
+    # The cached blocks are shared, but not their source spans.
+    new = plugin.read('\n' + text)
+    assert new == ast
+    assert new.children[0].frozen and ast.children[0].frozen
+    assert [node.source_span for node in new.children] == [(1, 8), (10, 14), (16, 23)]
+    assert ast.children[0].source_span == (0, 7)
+
+
+def test_markdown_podoc_options():
+    podoc = Podoc(with_pandoc=False, native=True,
+                  plugin_options={'MarkdownPlugin': {'cache_size': 10, 'sourcepos': True}})
+    plugin = podoc.get_func('markdown', 'ast').func.__self__
+    text = '# Title\n\npara'
+    ast = podoc.convert_text(text, source='markdown', target='ast')
+    assert [node.source_span for node in ast.children] == [(0, 7), (9, 13)]
+    assert len(plugin.parse_cache) == 2
+
+    # The conversions share the caches of the plugin.
+    assert podoc.convert_text(text, source='markdown', target='ast') == ast
+    assert (plugin.parse_cache.hits, plugin.parse_cache.misses) == (2, 2)
+    assert podoc.convert_text(ast, source='ast', target='markdown') == text
+    assert podoc.convert_text(ast, source='ast', target='markdown') == text
+    assert (plugin.render_cache.hits, plugin.render_cache.misses) == (2, 2)
+
+
+def test_markdown_chunks():
+    text = '[a][b]\n\n```\n\n# code\n\n```\n\n' + '# Title\n\n* *item*\n\n  text\n\n' * 5
+    text += '[b]: url'
+    plugin = MarkdownPlugin(native=True, jobs=2, chunk_size=20)
+    chunks = list(plugin._iter_chunks(text))
+    assert len(chunks) == 6
+
+    # The chunks are parsed separately, with the reference link definitions.
+    ast = ASTNode('root', children=[node for chunk in chunks
+                                    for node in plugin.read(chunk).children])
+    assert ast == plugin.read(text)
+    assert ast.children[0].children[0].url == 'url'
+
+
+def test_markdown_parallel_limits(monkeypatch):
+    text = '# Title\n\n* *item*\n\n  text\n\n' * 5
+    plugin = MarkdownPlugin(native=False, jobs=2, chunk_size=20)
+    monkeypatch.setattr(plugin, '_parse',
+                        lambda contents, context=None: MarkdownParser().parse(contents))
+    calls = []
+    _read_parallel = plugin._read_parallel
+
+    def read_parallel(contents, context=None):
+        calls.append(contents)
+        return _read_parallel(contents, context=context)
+
+    monkeypatch.setattr(plugin, '_read_parallel', read_parallel)
+    ast = MarkdownParser().parse(text)
+    assert plugin.read(text) == ast
+    assert calls == [text]
+
+    # The document is parsed with a single job when the conversion has resource limits.
+    assert plugin.read(text, context={'limits': {'cpu': 10}}) == ast
+    assert calls == [text]
+
+
+def test_markdown_write_cache():
+    plugin = MarkdownPlugin(native=True, cache_size=3)
+    text = '# Title\n\nhello *world*\n\n* a\n* b'
+    ast = plugin.read(text)
+    assert plugin.write(ast) == text
+    assert (plugin.render_cache.hits, plugin.render_cache.misses) == (0, 3)
+
+    # Only the changed blocks are rendered again.
+    text = '# Title\n\nhello *world*\n\n* a\n* c'
+    assert plugin.write(plugin.read(text)) == text
+    assert (plugin.render_cache.hits, plugin.render_cache.misses) == (2, 4)
+    assert len(plugin.render_cache) == 3
+
+    # The new blocks of a persistent update are rendered.
+    ast = plugin.read(text)
+    ast = ast.replace_child(0, ast.children[0].replace(level=2))
+    assert plugin.write(ast) == '## Title\n\nhello *world*\n\n* a\n* c'
+
+    # The blocks that are not frozen are always rendered, and can be modified in place.
+    plugin = MarkdownPlugin(native=True, cache_size=10)
+    ast = MarkdownParser().parse('hello\n\nworld\n')
+    assert plugin.write(ast) == 'hello\n\nworld'
+    ast.children[0].add_child(' there')
+    assert plugin.write(ast) == 'hello there\n\nworld'
+    ast.children[1].children[0] = 'you'
+    assert plugin.write(ast) == 'hello there\n\nyou'
+    assert (plugin.render_cache.hits, plugin.render_cache.misses) == (0, 0)
+
+
 # ------------------------------------------------------------------------------------------------
 # Test Markdown renderer inline
 # Check safe round-tripping on CommonMark -> AST -> CommonMark
@@ -66,14 +193,15 @@ def _tree_contains_nodes(ast, names):
 
 def _test_renderer(s, *contains_nodes):
     """Test the renderer on a string."""
-    # Parse the string with CommonMark-py.
-    mp = MarkdownPlugin()
-    ast = mp.read(s)
-    ast.show()
-    # Check that the tree contains a node.
-    if contains_nodes:
-        assert _tree_contains_nodes(ast, contains_nodes)
-    assert mp.write(ast) == s
+    # Parse the string with pandoc and with the native parser.
+    for native in (False, True):
+        mp = MarkdownPlugin(native=native)
+        ast = mp.read(s)
+        ast.show()
+        # Check that the tree contains a node.
+        if contains_nodes:
+            assert _tree_contains_nodes(ast, contains_nodes)
+        assert mp.write(ast) == s
 
 
 def test_markdown_renderer_simple():
@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+
+"""Test native Markdown parser."""
+
+
+#-------------------------------------------------------------------------------------------------
+# Imports
+#-------------------------------------------------------------------------------------------------
+
+from pytest import mark
+
+from podoc.ast import ASTNode, ASTPlugin
+from podoc.core import Podoc
+from podoc.utils import get_test_file_path, load_text, has_pandoc
+from .._markdown import MarkdownPlugin
+from ..parser import MarkdownParser, iter_block_spans
+
+require_pandoc = mark.skipif(not has_pandoc(),
+                             reason='pypandoc is not available')
+
+
+#-------------------------------------------------------------------------------------------------
+# Utils
+#-------------------------------------------------------------------------------------------------
+
+def _parse(text):
+    return MarkdownParser().parse(text)
+
+
+def _test_parser(text):
+    """Check that the native parser gives the same AST as pandoc."""
+    ast = _parse(text)
+    ast.show()
+    assert ast == MarkdownPlugin(native=False).read(text)
+
+
+#-------------------------------------------------------------------------------------------------
+# Test native Markdown parser
+#-------------------------------------------------------------------------------------------------
+
+@mark.parametrize('filename', ['hello', 'simplenb'])
+def test_parser_test_files(filename):
+    # The reference ASTs have been generated with pandoc.
+    text = load_text(get_test_file_path('markdown', filename + '.md'))
+    ast = ASTPlugin().load(get_test_file_path('ast', filename + '.json'))
+    assert _parse(text) == ast
+
+
+def test_parser_simple():
+    ast = ASTNode('root')
+    para = ast.add_child(ASTNode('Para', children=['hello ']))
+    para.add_child(ASTNode('Emph', children=['world']))
+    assert _parse('hello *world*') == ast
+
+
+def test_parser_code_block():
+    ast = _parse('para\n```{output:stdout}\nhello\n\nworld\n```')
+    assert ast.children[1].name == 'CodeBlock'
+    assert ast.children[1].lang == '{output:stdout}'
+    assert ast.children[1].children == ['hello\n\nworld']
+
+    # Unclosed fences are regular text.
+    assert _parse('```\nhello').children[0].name == 'Para'
+
+
+def test_parser_raw_latex():
+    ast = _parse('\\begin{align*}\nx &= y\n\\end{align*}')
+    assert ast.children[0].name == 'RawBlock'
+    assert ast.children[0].raw_type == 'latex'
+
+
+def test_parser_block_spans():
+    text = ('# Title\ntext\n\n- a\n\n- b\n\n  c\n\npara\n\n    code\n\n    code\n\n'
+            'para\n```python\nx\n\ny\n```\n```\nunclosed')
+    lines = text.split('\n')
+    spans = list(iter_block_spans(lines))
+    assert [lang for _, _, lang in spans] == [None, None, None, None, '', None, 'python', None]
+    assert ['\n'.join(lines[i:j]) for i, j, _ in spans][2] == '- a\n\n- b\n\n  c'
+    # The blocks are the same as the parser's.
+    assert len(spans) == len(_parse(text).children)
+
+
+def test_parser_source_spans():
+    text = '# Title\r\n\r\n[a][r] b\r\n[r]: url\r\nc\n\n```\n\tx\n\n```\n\n* a\n* b\n'
+    ast = MarkdownParser(sourcepos=True).parse(text)
+    assert ast == _parse(text)
+    assert [text[slice(*node.source_span)] for node in ast.children] == [
+        '# Title', '[a][r] b\r\n[r]: url\r\nc', '```\n\tx\n\n```', '* a\n* b']
+    # The source spans are not fields.
+    assert 'source_span' not in ast.children[0].keys()
+
+
+@require_pandoc
+@mark.parametrize('text', [
+    # Inlines.
+    'hello *world* **b** `c`',
+    '*a*b and a_b_c and _a_ __b__',
+    '**a** *b **c** d*',
+    '***a*** and ___b___ and ***c** d*',
+    '***a****',
+    'a\\*b\\_c',
+    'x `` a`b `` y',
+    'a  b',
+    'a\nb',
+    'a  \nb',
+    'a\\\nb',
+    '&amp; &lt;b&gt; <b>',
+    # Math.
+    '$x$ and $x$5 and $ y$',
+    'a $\\$x$ b',
+    '$$y$$',
+    # Links.
+    '[a](http://x.org "t") ![im](a.png)',
+    '[link *em*](u)',
+    '[a][r] and [r]\n\n[r]: http://y.org',
+    'see <https://x.y/z?q=1> now',
+    '[a](<b c>) [d](e^f) [g](h\\[i)',
+    '[a][r]\n\n[r]: <b c>',
+    'see <http://a.org/b^c>',
+    # Blocks.
+    '# T #\n\npara',
+    'T\n===\n\nU\n---',
+    'para\n# not a header',
+    'para\n```\ncode\n```',
+    '~~~python\nx = 1\n~~~',
+    '    code\n\n    more\n\nx',
+    '> a\nb\n\n> c',
+    '> # h\n> * a\n> * b',
+    '***',
+    # Lists.
+    '* a\n* b\n\n* c',
+    '* a\n    * b\n* c',
+    '* a\nlazy\n* b',
+    '* a\n\n    b\n* c',
+    '* a\n* b\n\npara',
+    '1. a\n2. b',
+    '3) a\n4) b',
+    '1. one\n\n   two\n2. x',
+    '1. a\n* b',
+])
+def test_parser_pandoc(text):
+    _test_parser(text)
+
+
+def test_parser_emphasis():
+    assert _parse('***a***').children[0].children == [
+        ASTNode('Strong', children=[ASTNode('Emph', children=['a'])])]
+
+
+def test_parser_url():
+    link = _parse('[a](<b c>)').children[0].children[0]
+    assert link.url == 'b%20c'
+    link = _parse('<http://a.org/b^c>').children[0].children[0]
+    assert link.url == 'http://a.org/b%5Ec'
+    assert link.children == ['http://a.org/b^c']
+
+
+@require_pandoc
+@mark.parametrize('text', [
+    # Known differences with pandoc: runs of four or more emphasis delimiters and
+    # link destinations containing unescaped spaces.
+    '****a****',
+    '[a](b c)',
+    '[a](b\\ c)',
+])
+def test_parser_pandoc_differences(text):
+    assert _parse(text) != MarkdownPlugin(native=False).read(text)
+
+
+def test_parser_podoc_native():
+    assert Podoc(native=True, with_pandoc=False).prefers_native('markdown')
+    assert not Podoc(native=['html'], with_pandoc=False).prefers_native('markdown')
+
+    podoc = Podoc(native=['markdown'], with_pandoc=False)
+    assert podoc.convert_text('hello *world*', source='markdown', target='ast') == \
+        _parse('hello *world*')
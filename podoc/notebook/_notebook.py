@@ -2,7 +2,8 @@
 
 """Notebook plugin.
 
-This plugin implements Notebook <-> AST.
+This plugin implements Notebook <-> AST, as well as direct Notebook <-> Markdown
+conversions that copy the Markdown cells verbatim.
 
 When converting a notebook to an AST, some of the structure of the notebook
 is preserved. While the Markdown cells are considered as normal contents,
@@ -50,10 +51,13 @@ from nbformat.v4 import (new_notebook,
                          )
 
 from podoc.markdown import MarkdownPlugin
+from podoc.markdown._markdown import ASTToMarkdown
+from podoc.markdown.parser import _FENCE, _indentation, iter_block_spans
 from podoc.ast import ASTNode  # , TreeTransformer
 from podoc.plugin import IPlugin
-from podoc.tree import TreeTransformer
-from podoc.utils import _get_file, _get_resources_path
+from podoc.query import rewrite
+from podoc.tree import PassManager
+from podoc.utils import _get_file, _get_resources_path, _remove_ansi, process_options
 from ._utils import extract_image, extract_table
 
 logger = logging.getLogger(__name__)
@@ -79,10 +83,6 @@ def output_filename(mime_type=None, unique_key=None,
     return _OUTPUT_FILENAME_TEMPLATE.format(**args)
 
 
-def _remove_ansi(text):
-    return re.sub(r'\x1b[^m]*m', '', text)
-
-
 #-------------------------------------------------------------------------------------------------
 # Notebook reader
 #-------------------------------------------------------------------------------------------------
@@ -96,12 +96,32 @@ def open_notebook(path):
 
 
 class NotebookReader(object):
+    """Read a notebook and return an AST.
+
+    Parameters
+    ----------
+
+    sourcepos : bool (False)
+        Whether to set the `source_span` of the top-level blocks to `(cell_index,
+        cell_index + 1)`.
+
+    """
+
     _NEW_CELL_DELIMITER = '@@@@@ PODOC-NEW-CELL @@@@@'
 
-    def read(self, notebook, context=None):
+    def __init__(self, sourcepos=False):
+        self.sourcepos = sourcepos
+
+    def _set_span(self, nodes, cell_index):
+        if self.sourcepos and cell_index is not None:
+            for node in nodes:
+                node.source_span = (cell_index, cell_index + 1)
+
+    def _init(self, notebook, context=None):
         assert isinstance(notebook, nbformat.NotebookNode)
         self.resources = {}  # Dictionary {filename: data}.
         context = context or {}
+        self._context = context
         # Get the unique key for image names: basename of the output file, if it exists.
         self._unique_key = op.basename(context.get('output', None) or '')
         self._unique_key = self._unique_key or op.basename(context.get('path', None) or '')
@@ -114,20 +134,24 @@ class NotebookReader(object):
         # by default.
         self.language = m.get('language_info', {}).get('name', 'python')
 
+    def read(self, notebook, context=None):
+        self._init(notebook, context=context)
+        context = self._context
+
         # NOTE: for performance reasons, we parse the Markdown of all cells at once
         # to reduce the overhead of calling pandoc.
         self._markdown_tree = []
-        self._read_all_markdown(notebook.cells)
+        self._read_all_markdown(notebook.cells, context=context)
 
         for cell_index, cell in enumerate(notebook.cells):
             getattr(self, 'read_{}'.format(cell.cell_type))(cell, cell_index)
 
         return self.tree
 
-    def _read_all_markdown(self, cells):
+    def _read_all_markdown(self, cells, context=None):
         sources = [cell.source for cell in cells if cell.cell_type == 'markdown']
         contents = ('\n\n%s\n\n' % self._NEW_CELL_DELIMITER).join(sources)
-        ast = MarkdownPlugin().read(contents)
+        ast = MarkdownPlugin().read(contents, context=context)
         if not ast.children:
             logger.debug("Skipping empty node.")
             return
@@ -148,13 +172,15 @@ class NotebookReader(object):
     def read_markdown(self, cell, cell_index=None):
         if self._markdown_tree:
             cell_tree = self._markdown_tree.pop(0)
+            self._set_span(cell_tree.children, cell_index)
             self.tree.children.extend(cell_tree.children)
         else:
             logger.warn("Isolated read_markdown() call: slow because of pandoc call overhead.")
-            ast = MarkdownPlugin().read(cell.source)
+            ast = MarkdownPlugin().read(cell.source, context=self._context)
             if not ast.children:
                 logger.debug("Skipping empty node.")
                 return
+            self._set_span([ast], cell_index)
             self.tree.children.append(ast)  # pragma: no cover
 
     def read_code(self, cell, cell_index=None):
@@ -184,9 +210,11 @@ class NotebookReader(object):
                 # Remove color codes.
                 text = _remove_ansi(text)
                 # Extract image output, if any.
-                out = extract_image(output)
+                # NOTE: the external tools used to extract the images are subject to
+                # the deadline of the conversion.
+                out = extract_image(output, **process_options(self._context))
                 if out is None:
-                    out = extract_table(output)
+                    out = extract_table(output, **process_options(self._context))
                 if out is None:
                     child = ASTNode('CodeBlock',
                                     lang='{output:result}',
@@ -209,12 +237,34 @@ class NotebookReader(object):
             else:  # pragma: no cover
                 raise ValueError("Unknown output type `%s`." % output.output_type)
             node.add_child(child)
+        self._set_span([node], cell_index)
         self.tree.children.append(node)
 
     def read_raw(self, cell, cell_index=None):
         # TODO
         pass
 
+    def read_markdown_verbatim(self, notebook, context=None):
+        """Convert a notebook to Markdown without parsing the Markdown cells.
+
+        The Markdown cells are copied verbatim, while the code cells and their outputs
+        are rendered like in the `notebook -> ast -> markdown` conversion.
+
+        """
+        self._init(notebook, context=context)
+        writer = ASTToMarkdown()
+        out = []
+        for cell_index, cell in enumerate(notebook.cells):
+            if cell.cell_type == 'markdown':
+                source = cell.source.strip('\n')
+                if source:
+                    out.append(source)
+            elif cell.cell_type == 'code':
+                self.read_code(cell, cell_index)
+                node = replace_resource_paths(self.tree.children.pop(), context=context)
+                out.append(writer.transform(node))
+        return '\n\n'.join(out)
+
 
 def _get_cell_lang(node):
     if node.name == 'CodeBlock':
@@ -232,8 +282,8 @@ class CodeCellWrapper(object):
         return mc[0][0] if mc else 'python'
 
     def wrap(self, ast):
-        self.ast = ast.copy()
-        self.ast.children = []
+        # NOTE: the new AST shares the nodes of the original AST.
+        self.ast = ast.replace(children=[])
         self._code_cell = None
         # Infer the notebook's language.
         self.language = self.infer_language(ast)
@@ -301,25 +351,42 @@ def replace_resource_paths(ast, context=None):
         logger.debug("No output or path given, not replacing resource paths.")
         return ast
 
-    class ResourceTransformer(TreeTransformer):
-        def transform_Image(self, node):
-            url = node.url
-            if url.startswith('{resource:'):
-                node.url = re.sub(r'\{resource:([^\}]+)\}', r'%s/\1' % path, url)
-                logger.debug("Replace %s by %s.", url, node.url)
-            return node
-
-        def transform_Node(self, node):
-            node.children = self.transform_children(node)
-            return node
+    # NOTE: only the images with a resource path, and their ancestors, are replaced in a
+    # new AST, which shares the other nodes with the original AST.
+    def _replace(node):
+        url = node.url
+        node = node.replace(url=re.sub(r'\{resource:([^\}]+)\}', r'%s/\1' % path, url))
+        logger.debug("Replace %s by %s.", url, node.url)
+        return node
 
-    return ResourceTransformer().transform(ast)
+    return rewrite(ast, 'Image[url^="{resource:"]', _replace)
 
 
 def _append_newlines(s):
     return '\n'.join(s.rstrip().split('\n')) + '\n'
 
 
+# Paragraph with just an image: `![caption](path)`.
+_IMAGE_PARA = re.compile(r'^!\[([^\]\n]*)\]\(<?([^\s)>]+)>?(?:\s+"[^"]*")?\)$')
+
+
+def _code_contents(lines):
+    """Return the code of a fenced or indented code block, from the block's lines."""
+    m = _FENCE.match(lines[0])
+    if m:
+        indent = len(m.group(1))
+        lines = [line[min(indent, _indentation(line)):] for line in lines[1:-1]]
+    else:
+        lines = [line[4:] for line in lines]
+    return '\n'.join(lines)
+
+
+def _is_output_block(lines, lang):
+    """Return whether a Markdown block following a code cell is one of its outputs."""
+    return (lang == '' or (lang or '').startswith('{output') or
+            (lang is None and _IMAGE_PARA.match('\n'.join(lines).strip()) is not None))
+
+
 def _get_b64_resource(data):
     if not data:
         return ''
@@ -333,12 +400,9 @@ def _get_b64_resource(data):
 
 
 class NotebookWriter(object):
-    def write(self, ast, context=None):
+    def _init(self, context=None):
         self.execution_count = 1
         self._md = MarkdownPlugin()
-        # Add code cells in the AST.
-        ccw = CodeCellWrapper()
-        ast = ccw.wrap(ast)
         # Find the directory containing the notebook file.
         doc_path = (context or {}).get('path', None)
         if doc_path:
@@ -346,6 +410,12 @@ class NotebookWriter(object):
         else:
             logger.warn("No input path, unable to resolve the image relative paths.")
             self._dir_path = None
+
+    def write(self, ast, context=None):
+        self._init(context=context)
+        # Add code cells in the AST.
+        ccw = CodeCellWrapper()
+        ast = ccw.wrap(ast)
         # Create the notebook.
         # new_output, new_code_cell, new_markdown_cell
         # TODO: kernelspect
@@ -364,6 +434,42 @@ class NotebookWriter(object):
         nbformat.validate(nb)
         return nb
 
+    def write_markdown(self, text, context=None):
+        """Create a notebook directly from a Markdown string, without creating the AST.
+
+        The top-level blocks are found with a linear scan of the lines, and the code cells
+        follow the same conventions as `CodeCellWrapper`. Every other block is copied
+        verbatim in its own Markdown cell.
+
+        """
+        self._init(context=context)
+        raw_lines = text.replace('\r\n', '\n').replace('\r', '\n').split('\n')
+        lines = [line.expandtabs(4) for line in raw_lines]
+        blocks = list(iter_block_spans(lines))
+        # Infer the notebook's language: the most common code block language.
+        mc = Counter([lang for _, _, lang in blocks if lang is not None]).most_common(1)
+        language = mc[0][0] if mc else 'python'
+        nb = new_notebook()
+        cell = None
+        for start, end, lang in blocks:
+            if cell is not None:
+                output = self.new_block_output(cell, lines[start:end], lang)
+                if output is not None:
+                    cell.outputs.append(output)
+                    continue
+                # Any other block ends the code cell.
+                cell = None
+                self.execution_count += 1
+            if lang is not None and lang == language:
+                cell = new_code_cell(_code_contents(lines[start:end]),
+                                     execution_count=self.execution_count,
+                                     )
+                nb.cells.append(cell)
+            else:
+                nb.cells.append(new_markdown_cell('\n'.join(raw_lines[start:end])))
+        nbformat.validate(nb)
+        return nb
+
     def new_markdown_cell(self, node, index=None):
         return new_markdown_cell(self._md.write(node))
 
@@ -380,71 +486,108 @@ class NotebookWriter(object):
             # an image.
             if child.name == 'CodeBlock':
                 # The output is a code block.
-                # What is the output's type? It depends on the code block's
-                # name. It can be: `stdout`, `stderr`, `result`.
-                output_type = child.lang or '{output:result}'
-                assert output_type.startswith('{output')
-                contents = child.children[0]
-                # NOTE: append new lines at the end of every line in stdout
-                # and stderr contents, to match with the Jupyter Notebook.
-                if output_type != '{output:result}':
-                    contents = _append_newlines(contents)
-                if output_type == '{output:result}':
-                    kwargs = dict(execution_count=self.execution_count,
-                                  data={'text/plain': contents})
-                    # Output type to pass to nbformat.
-                    output_type = 'execute_result'
-                elif output_type in ('{output:stdout}', '{output:stderr}'):
-                    # Standard output or error.
-                    # NOTE: strip {output } and only keep stdout/stderr in name.
-                    kwargs = dict(text=contents, name=output_type[8:-1])
-                    # Output type to pass to nbformat.
-                    output_type = 'stream'
+                output = self.new_text_output(child.lang or '{output:result}',
+                                              child.children[0])
             elif child.name == 'Para':
                 img = child.children[0]
                 assert img.name == 'Image'
-                fn = img.url
-                caption = self._md.write(img.children[0])
-                output_type = 'display_data'
-                data = {}  # Dictionary {mimetype: data_buffer}.
-                # Infer the mime type of the file, from its filename and
-                # extension.
-                mime_type = guess_type(fn)[0]
-                assert mime_type  # unknown extension: this shouldn't happen!
-                # Get the resource data.
-                if self._dir_path:
-                    image_path = op.join(self._dir_path, fn)
-                # The image path could be absolute.
-                elif op.isabs(fn):
-                    image_path = fn
-                else:  # pragma: no cover
-                    image_path = None
-                # If the image path exists, open it.
-                if image_path and op.exists(image_path):
-                    with open(image_path, 'rb') as f:
-                        data[mime_type] = _get_b64_resource(f.read())
-                else:  # pragma: no cover
-                    logger.debug("File `%s` doesn't exist.", image_path)
-                # Save the caption in the output text.
-                data['text/plain'] = caption
-                # Save the caption in the cell metadata too, so that it is not lost when
-                # executing the notebook.
-                if 'podoc' not in cell.metadata:
-                    cell.metadata['podoc'] = {}
-                cell.metadata['podoc'].update({'output_text': caption})
-                kwargs = dict(data=data)
-            assert not output_type.startswith('{output')
-            output = new_output(output_type, **kwargs)
+                output = self.new_image_output(cell, img.url, self._md.write(img.children[0]))
             cell.outputs.append(output)
         self.execution_count += 1
         return cell
 
+    def new_block_output(self, cell, lines, lang):
+        """Create an output from the lines of a Markdown block following a code cell.
+
+        Return None if the block is not an output: a code block with the `{output:...}`
+        or an empty language, or a paragraph with just an image.
+
+        """
+        if not _is_output_block(lines, lang):
+            return
+        # Text outputs.
+        if lang is not None:
+            return self.new_text_output(lang or '{output:result}', _code_contents(lines))
+        # Image outputs.
+        m = _IMAGE_PARA.match('\n'.join(lines).strip())
+        return self.new_image_output(cell, m.group(2), m.group(1))
+
+    def new_text_output(self, output_type, contents):
+        """Create a text output from the contents of a code block with the
+        `{output:...}` language."""
+        # What is the output's type? It depends on the code block's
+        # name. It can be: `stdout`, `stderr`, `result`.
+        assert output_type.startswith('{output')
+        # NOTE: append new lines at the end of every line in stdout
+        # and stderr contents, to match with the Jupyter Notebook.
+        if output_type != '{output:result}':
+            contents = _append_newlines(contents)
+        if output_type == '{output:result}':
+            kwargs = dict(execution_count=self.execution_count,
+                          data={'text/plain': contents})
+            # Output type to pass to nbformat.
+            output_type = 'execute_result'
+        elif output_type in ('{output:stdout}', '{output:stderr}'):
+            # Standard output or error.
+            # NOTE: strip {output } and only keep stdout/stderr in name.
+            kwargs = dict(text=contents, name=output_type[8:-1])
+            # Output type to pass to nbformat.
+            output_type = 'stream'
+        assert not output_type.startswith('{output')
+        return new_output(output_type, **kwargs)
+
+    def new_image_output(self, cell, fn, caption):
+        """Create an image output from the path of an image file, relative to the
+        document."""
+        output_type = 'display_data'
+        data = {}  # Dictionary {mimetype: data_buffer}.
+        # Infer the mime type of the file, from its filename and
+        # extension.
+        mime_type = guess_type(fn)[0]
+        assert mime_type  # unknown extension: this shouldn't happen!
+        # Get the resource data.
+        if self._dir_path:
+            image_path = op.join(self._dir_path, fn)
+        # The image path could be absolute.
+        elif op.isabs(fn):
+            image_path = fn
+        else:  # pragma: no cover
+            image_path = None
+        # If the image path exists, open it.
+        if image_path and op.exists(image_path):
+            with open(image_path, 'rb') as f:
+                data[mime_type] = _get_b64_resource(f.read())
+        else:  # pragma: no cover
+            logger.debug("File `%s` doesn't exist.", image_path)
+        # Save the caption in the output text.
+        data['text/plain'] = caption
+        # Save the caption in the cell metadata too, so that it is not lost when
+        # executing the notebook.
+        if 'podoc' not in cell.metadata:
+            cell.metadata['podoc'] = {}
+        cell.metadata['podoc'].update({'output_text': caption})
+        return new_output(output_type, data=data)
+
     def new_raw_cell(self, node, index=None):
         # TODO
         pass
 
 
 class NotebookPlugin(IPlugin):
+    """Notebook plugin.
+
+    Parameters
+    ----------
+
+    sourcepos : bool (False)
+        Whether to set the `source_span` of the top-level blocks read from a notebook to
+        `(cell_index, cell_index + 1)` (see `NotebookReader`).
+
+    """
+
+    def __init__(self, sourcepos=False):
+        self.sourcepos = sourcepos
+
     def attach(self, podoc):
         podoc.register_lang('notebook',
                             file_ext='.ipynb',
@@ -456,11 +599,18 @@ class NotebookPlugin(IPlugin):
                             )
         podoc.register_func(source='notebook', target='ast',
                             func=self.read,
-                            post_filter=replace_resource_paths,
+                            post_filter=PassManager([replace_resource_paths]),
                             )
         podoc.register_func(source='ast', target='notebook',
                             func=self.write,
-                            pre_filter=wrap_code_cells,
+                            pre_filter=PassManager([wrap_code_cells]),
+                            )
+        # NOTE: direct conversions that keep the Markdown cells as they are.
+        podoc.register_func(source='notebook', target='markdown',
+                            func=self.to_markdown,
+                            )
+        podoc.register_func(source='markdown', target='notebook',
+                            func=self.from_markdown,
                             )
 
     def load(self, file_or_path):
@@ -487,7 +637,7 @@ class NotebookPlugin(IPlugin):
         return nb
 
     def read(self, nb, context=None):
-        nr = NotebookReader()
+        nr = NotebookReader(sourcepos=self.sourcepos)
         ast = nr.read(nb, context=context)
         if context:
             context.resources = nr.resources
@@ -495,3 +645,13 @@ class NotebookPlugin(IPlugin):
 
     def write(self, ast, context=None):
         return NotebookWriter().write(ast, context=context)
+
+    def to_markdown(self, nb, context=None):
+        nr = NotebookReader()
+        markdown = nr.read_markdown_verbatim(nb, context=context)
+        if context:
+            context.resources = nr.resources
+        return markdown
+
+    def from_markdown(self, text, context=None):
+        return NotebookWriter().write_markdown(text, context=context)
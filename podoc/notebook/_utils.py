@@ -17,6 +17,8 @@ import tempfile
 
 from IPython.lib.latextools import genelatex
 
+from podoc.utils import run_process
+
 logger = logging.getLogger(__name__)
 
 
@@ -70,7 +72,14 @@ tbody tr:nth-child(odd) {
 '''
 
 
-def latex_to_png_base64(latex):
+def latex_to_png_base64(latex, timeout=None, cancel=None, limits=None):
+    """Render LaTeX to a base64-encoded PNG image, with latex and dvipng.
+
+    The `timeout`, `cancel` and `limits` arguments are passed to `run_process()`, the
+    timeout applies to every process.
+
+    """
+    kwargs = dict(timeout=timeout, cancel=cancel, limits=limits)
     with tempfile.TemporaryDirectory() as tmpdir:
         tmpfile = os.path.join(tmpdir, "tmp.tex")
         dvifile = os.path.join(tmpdir, "tmp.dvi")
@@ -80,27 +89,22 @@ def latex_to_png_base64(latex):
         with open(tmpfile, "w") as f:
             f.writelines(contents)
 
-        with open(os.devnull, 'w') as devnull:
-            try:
-                subprocess.check_call(
-                    ["latex", "-halt-on-error", tmpfile], cwd=tmpdir,
-                    stdout=devnull, stderr=devnull)
-            except Exception as e:  # pragma: no cover
-                print("************")
-                print(len(contents))
-                print('\n'.join(contents))
-                raise(e)
+        try:
+            run_process(["latex", "-halt-on-error", tmpfile], cwd=tmpdir, **kwargs)
+        except subprocess.CalledProcessError as e:  # pragma: no cover
+            print("************")
+            print(len(contents))
+            print('\n'.join(contents))
+            raise(e)
 
-            subprocess.check_call(
-                ["dvipng", "-T", "tight", "-x", "6000", "-z", "9",
-                 "-bg", "transparent", "-o", pngfile, dvifile], cwd=tmpdir,
-                stdout=devnull, stderr=devnull)
+        run_process(["dvipng", "-T", "tight", "-x", "6000", "-z", "9",
+                     "-bg", "transparent", "-o", pngfile, dvifile], cwd=tmpdir, **kwargs)
 
         with open(pngfile, 'rb') as f:
             return base64.b64encode(f.read())
 
 
-def extract_image(output):
+def extract_image(output, timeout=None, cancel=None, limits=None):
     """Return the output mime type and data for the first found mime type.
 
     https://github.com/jupyter/nbconvert/blob/master/nbconvert/preprocessors/extractoutput.py
@@ -114,7 +118,7 @@ def extract_image(output):
     # We override the low PNG with a high-resolution one.
     if 'image/png' in output.data and 'text/latex' in output.data:  # pragma: no cover
         latex = ''.join(output.data['text/latex'])
-        b64 = latex_to_png_base64(latex)
+        b64 = latex_to_png_base64(latex, timeout=timeout, cancel=cancel, limits=limits)
         output.data['image/png'] = b64
 
     # Get the output in data formats that the template needs extracted.
@@ -146,7 +150,14 @@ def extract_image(output):
         return mime_type, data
 
 
-def extract_table(output):
+def extract_table(output, timeout=None, cancel=None, limits=None):
+    """Render an HTML table output to a PNG image, with wkhtmltopdf and ImageMagick.
+
+    The `timeout`, `cancel` and `limits` arguments are passed to `run_process()`, the
+    timeout applies to every process.
+
+    """
+    kwargs = dict(timeout=timeout, cancel=cancel, limits=limits)
     # Process HTML output.
     html = output.data.get('text/html', None)
     if not html:
@@ -160,10 +171,11 @@ def extract_table(output):
         html = _TABLE_STYLES + html
         with open(in_path, 'w') as f:
             f.write(html)
-        os.system('wkhtmltopdf -q %s %s' % (in_path, out_path))
-        os.system(('convert -density 300 -trim -border 20x20 '
-                   '-bordercolor white -background white'
-                   ' -alpha remove %s %s') % (out_path, out_path2))
+        # NOTE: wkhtmltopdf may return a non-zero exit code even when the PDF is created.
+        run_process(['wkhtmltopdf', '-q', in_path, out_path], check=False, **kwargs)
+        run_process(['convert', '-density', '300', '-trim', '-border', '20x20',
+                     '-bordercolor', 'white', '-background', 'white',
+                     '-alpha', 'remove', out_path, out_path2], check=False, **kwargs)
         with open(out_path2, 'rb') as f:
             data = f.read()
     return 'image/png', data
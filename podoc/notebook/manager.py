@@ -12,7 +12,7 @@ import os.path as op
 
 from tornado import web
 import nbformat
-from traitlets import Unicode, Bool
+from traitlets import Bool, Dict, Unicode
 from traitlets.config import Configurable
 # BUG FIX: see https://github.com/jupyter/notebook/issues/3056
 try:
@@ -45,10 +45,14 @@ class PodocContentsManager(FileContentsManager, Configurable):
     # This will be passed to the FormatManager, overwriting any config there.
     verbose_metadata = Bool(False, config=True)
 
+    # Keyword arguments of the podoc plugins, by plugin class name, for example
+    # `{'MarkdownPlugin': {'cache_size': 1000}}` to cache the parsed Markdown blocks.
+    plugin_options = Dict(config=True)
+
     def __init__(self, *args, **kwargs):
         super(PodocContentsManager, self).__init__(*args, **kwargs)
 
-        self._podoc = Podoc()
+        self._podoc = Podoc(plugin_options=self.plugin_options)
 
     def _do_use_podoc(self, file_ext):
         """Determine whether podoc can convert a file extension to a
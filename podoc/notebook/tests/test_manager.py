@@ -72,6 +72,12 @@ class TestPodocContentsManager(tm.TestContentsManager):
             root_dir=self.td,
         )
 
+    def test_plugin_options(self):
+        options = {'MarkdownPlugin': {'cache_size': 10}}
+        cm = PodocContentsManager(root_dir=self.td, plugin_options=options)
+        plugin = cm._podoc.get_func('markdown', 'ast').func.__self__
+        assert plugin.parse_cache.max_size == 10
+
     def test_get(self):
         super(TestPodocContentsManager, self).test_get()
         cm = self.contents_manager
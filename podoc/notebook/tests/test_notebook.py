@@ -12,12 +12,14 @@ import re
 from textwrap import dedent
 
 from podoc.ast import ASTPlugin, ASTNode
+from podoc.core import Podoc
 from podoc.markdown import MarkdownPlugin
 from podoc.utils import get_test_file_path, load_text
 from .._notebook import (_get_b64_resource,
                          open_notebook,
                          NotebookReader,
                          NotebookWriter,
+                         replace_resource_paths,
                          wrap_code_cells,
                          )
 
@@ -75,6 +77,19 @@ def test_wrap_code_cells_2():
     assert ast_wrapped == ast_expected
 
 
+def test_replace_resource_paths():
+    image = ASTNode('Image', url='{resource:a.png}', children=['a'])
+    para = ASTNode('Para', children=['text'])
+    ast = ASTNode('root', children=[para, ASTNode('Para', children=[image])])
+
+    ast_1 = replace_resource_paths(ast, context={'path': 'dir/doc.ipynb'})
+    assert ast_1.children[1].children[0].url == 'doc_files/a.png'
+    # The original AST is unchanged, and the unchanged nodes are shared.
+    assert image.url == '{resource:a.png}'
+    assert ast_1.children[0] is para
+    assert wrap_code_cells(ast_1).children[0] is para
+
+
 #-------------------------------------------------------------------------------------------------
 # Test NotebookReader
 #-------------------------------------------------------------------------------------------------
@@ -115,6 +130,25 @@ def test_notebook_reader_notebook():
     assert 'output_4_1.png' in reader.resources
 
 
+def test_notebook_reader_sourcepos():
+    path = get_test_file_path('notebook', 'simplenb.ipynb')
+    notebook = open_notebook(path)
+    ast = NotebookReader(sourcepos=True).read(notebook)
+    assert ast == NotebookReader().read(notebook)
+    spans = [node.source_span for node in ast.children]
+    assert spans[0] == (0, 1)
+    assert all(span[1] == span[0] + 1 for span in spans)
+    assert spans == sorted(spans)
+    # The code cells have their index.
+    assert [node.source_span[0] for node in ast.children if node.name == 'CodeCell'] == [
+        i for i, cell in enumerate(notebook.cells) if cell.cell_type == 'code']
+
+    # The option is passed to the plugin through Podoc.
+    podoc = Podoc(with_pandoc=False, plugin_options={'NotebookPlugin': {'sourcepos': True}})
+    converted = podoc.convert_file(path, source='notebook', target='ast')
+    assert [node.source_span for node in converted.children] == spans
+
+
 def test_output_text(podoc):
     img_path = get_test_file_path('markdown', 'simplenb_files/simplenb_4_1.png')
     markdown = dedent('''
@@ -132,6 +166,24 @@ def test_output_text(podoc):
     assert 'Some text' in md
 
 
+def test_notebook_reader_markdown_verbatim(podoc):
+    path = get_test_file_path('notebook', 'simplenb.ipynb')
+    notebook = open_notebook(path)
+    # The direct conversion gives the same Markdown as the conversion through the AST.
+    reader = NotebookReader()
+    markdown = reader.read_markdown_verbatim(notebook, context={'path': path})
+    assert markdown + '\n' == load_text(get_test_file_path('markdown', 'simplenb.md'))
+    assert 'simplenb_4_1.png' in reader.resources
+
+    # The Markdown cells are kept as they are.
+    notebook.cells[0].source = '# A __notebook__\n\n\n- item'
+    markdown = NotebookReader().read_markdown_verbatim(notebook)
+    assert markdown.startswith('# A __notebook__\n\n\n- item\n\n')
+
+    _, context = podoc.convert_file(path, target='markdown', return_context=True)
+    assert context.lang_chain == ['notebook', 'markdown']
+
+
 #-------------------------------------------------------------------------------------------------
 # Test NotebookWriter
 #-------------------------------------------------------------------------------------------------
@@ -172,3 +224,28 @@ def test_notebook_writer_notebook():
     nb_expected = open_notebook(get_test_file_path('notebook', 'simplenb.ipynb'))
     # Ignore some fields when comparing the notebooks.
     assert nb == nb_expected
+
+
+def test_notebook_writer_markdown(podoc):
+    path = get_test_file_path('markdown', 'simplenb.md')
+    text = load_text(path)
+    # The direct conversion gives the same notebook as the conversion through the AST.
+    nb = NotebookWriter().write_markdown(text, context={'path': path})
+    ast = MarkdownPlugin(native=True).read(text)
+    nb_expected = NotebookWriter().write(ast, context={'path': path})
+    for cell in nb.cells + nb_expected.cells:
+        cell.pop('id', None)
+    assert nb == nb_expected
+    assert [cell.cell_type for cell in nb.cells] == ['markdown', 'markdown', 'code',
+                                                     'markdown', 'code', 'markdown']
+    assert nb.cells[4].outputs[1].data['text/plain'] == 'Output image'
+    assert 'image/png' in nb.cells[4].outputs[1].data
+
+    # The Markdown blocks are kept as they are.
+    nb = NotebookWriter().write_markdown('# A __notebook__\n\n- a\n\n- b\n\n'
+                                         '```python\n1\n```\n\n```\n1\n```\n\n*1*')
+    assert [cell.source for cell in nb.cells] == ['# A __notebook__', '- a\n\n- b', '1', '*1*']
+    assert nb.cells[2].outputs[0].data['text/plain'] == '1'
+
+    _, context = podoc.convert_file(path, target='notebook', return_context=True)
+    assert context.lang_chain == ['markdown', 'notebook']
@@ -0,0 +1,283 @@
+# -*- coding: utf-8 -*-
+
+"""Tree queries.
+
+The nodes of a tree can be found with CSS-like selectors:
+
+* `Image`: nodes with a given name, `*` for all nodes
+* `CodeBlock[lang]`: nodes with a field
+* `CodeBlock[lang=python]`, `Header[level!=1]`, `Link[url^="http"]`, `Link[url$=.pdf]`,
+  `Link[url*=github]`: nodes with a field equal to, different from, starting with,
+  ending with, or containing a value (compared as strings)
+* `BlockQuote Link`: nodes below another node
+* `ListItem > Para`: children of another node
+* `Link, Image`: nodes matching any of several selectors
+
+The selectors are compiled once, and the queries are answered with an index of the
+nodes by name, so that they only visit the matching nodes and their ancestors.
+
+"""
+
+
+#-------------------------------------------------------------------------------------------------
+# Imports
+#-------------------------------------------------------------------------------------------------
+
+from functools import lru_cache
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+
+#-------------------------------------------------------------------------------------------------
+# Selectors
+#-------------------------------------------------------------------------------------------------
+
+_TOKEN = re.compile(r'''
+    \s*(?P<comb>[>,])\s*                                    # combinator or separator
+    | (?P<space>\s+)                                        # descendant combinator
+    | (?P<name>\*|[A-Za-z_][\w-]*)                          # node name
+    | \[\s*(?P<key>[A-Za-z_]\w*)\s*                         # field predicate
+      (?:(?P<op>[!^$*]?=)\s*
+         (?:"(?P<dq>[^"]*)"|'(?P<sq>[^']*)'|(?P<bare>[^\]\s]+))\s*)?
+      \]
+    ''', re.VERBOSE)
+
+_MISSING = object()
+
+
+def _check(op, value, expected):
+    if op is None:
+        return True
+    value = str(value)
+    if op == '=':
+        return value == expected
+    elif op == '!=':
+        return value != expected
+    elif op == '^=':
+        return value.startswith(expected)
+    elif op == '$=':
+        return value.endswith(expected)
+    return expected in value
+
+
+class _Compound(object):
+    """Name and field predicates of a node in a selector."""
+
+    __slots__ = ('name', 'wildcard', 'predicates')
+
+    def __init__(self):
+        self.name = None
+        self.wildcard = False
+        self.predicates = []
+
+    def is_empty(self):
+        return self.name is None and not self.wildcard and not self.predicates
+
+    def match(self, node):
+        if self.name is not None and node.name != self.name:
+            return False
+        for key, op, expected in self.predicates:
+            value = node.get(key, _MISSING)
+            if value is _MISSING or not _check(op, value, expected):
+                return False
+        return True
+
+
+class Selector(object):
+    """Compiled selector (see `compile_selector()`).
+
+    Every alternative of the selector is a list of `_Compound` and a list of
+    combinators (`>` or ` `) between them.
+
+    """
+
+    def __init__(self, alternatives):
+        self.alternatives = alternatives
+
+
+@lru_cache(maxsize=256)
+def compile_selector(selector):
+    """Compile a selector string and return a `Selector` instance."""
+    alternatives = []
+    compounds, combinators = [_Compound()], []
+    pos = 0
+    selector = selector.strip()
+    while pos < len(selector):
+        m = _TOKEN.match(selector, pos)
+        if not m or m.end() == pos:
+            raise ValueError("Invalid selector `%s` at position %d." % (selector, pos))
+        pos = m.end()
+        comb = m.group('comb') or (' ' if m.group('space') else None)
+        compound = compounds[-1]
+        if comb:
+            if compound.is_empty():
+                raise ValueError("Invalid selector `%s` at position %d." % (selector, pos))
+            if comb == ',':
+                alternatives.append((compounds, combinators))
+                compounds, combinators = [_Compound()], []
+            else:
+                compounds.append(_Compound())
+                combinators.append(comb)
+        elif m.group('name'):
+            if not compound.is_empty():
+                raise ValueError("Invalid selector `%s` at position %d." % (selector, pos))
+            # NOTE: `*` is a compound with no condition.
+            compound.name = m.group('name') if m.group('name') != '*' else None
+            compound.wildcard = compound.name is None
+        else:
+            value = next((v for v in m.group('dq', 'sq', 'bare') if v is not None), None)
+            compound.predicates.append((m.group('key'), m.group('op'), value))
+    alternatives.append((compounds, combinators))
+    if compounds[-1].is_empty():
+        raise ValueError("Invalid selector `%s`." % selector)
+    return Selector(alternatives)
+
+
+#-------------------------------------------------------------------------------------------------
+# Tree index
+#-------------------------------------------------------------------------------------------------
+
+class TreeIndex(object):
+    """Index of the nodes of a tree, to answer selector queries.
+
+    The index is built when it is first needed, and it is not updated when the tree
+    is modified in place. The persistent updates (see `rewrite()`) return new trees,
+    which need new indices.
+
+    """
+
+    def __init__(self, tree):
+        self.tree = tree
+        self._nodes = None
+
+    def _build(self):
+        # Nodes in depth-first order, with the index of their parent and their position
+        # in their parent's children.
+        nodes, parents, positions = [], [], []
+        by_name = {}
+        stack = [(self.tree, -1, 0)]
+        while stack:
+            node, parent, position = stack.pop()
+            i = len(nodes)
+            nodes.append(node)
+            parents.append(parent)
+            positions.append(position)
+            ids = by_name.get(node.name, None)
+            if ids is None:
+                by_name[node.name] = [i]
+            else:
+                ids.append(i)
+            children = node.children
+            for k in range(len(children) - 1, -1, -1):
+                if not isinstance(children[k], str):
+                    stack.append((children[k], i, k))
+        self._nodes, self._parents, self._positions = nodes, parents, positions
+        self._by_name = by_name
+
+    def _matches_ancestors(self, i, compounds, combinators, k):
+        """Whether the ancestors of the node `i` match the compounds before `k`."""
+        if k == 0:
+            return True
+        compound, combinator = compounds[k - 1], combinators[k - 1]
+        nodes, parents = self._nodes, self._parents
+        p = parents[i]
+        while p >= 0:
+            if compound.match(nodes[p]) and \
+                    self._matches_ancestors(p, compounds, combinators, k - 1):
+                return True
+            if combinator == '>':
+                return False
+            p = parents[p]
+        return False
+
+    def _select_ids(self, selector):
+        if self._nodes is None:
+            self._build()
+        if isinstance(selector, str):
+            selector = compile_selector(selector)
+        nodes = self._nodes
+        out = set()
+        for compounds, combinators in selector.alternatives:
+            last = compounds[-1]
+            candidates = (self._by_name.get(last.name, ()) if last.name is not None
+                          else range(len(nodes)))
+            n = len(compounds) - 1
+            out.update(i for i in candidates if last.match(nodes[i]) and
+                       self._matches_ancestors(i, compounds, combinators, n))
+        return sorted(out)
+
+    def count(self, name):
+        """Number of nodes with a given name."""
+        if self._nodes is None:
+            self._build()
+        return len(self._by_name.get(name, ()))
+
+    def select(self, selector):
+        """Return the nodes matching a selector, in document order."""
+        ids = self._select_ids(selector)
+        nodes = self._nodes
+        return [nodes[i] for i in ids]
+
+    def path(self, node_id):
+        """Return the path of a node, as a tuple of child indices from the root."""
+        parents, positions = self._parents, self._positions
+        path = []
+        while parents[node_id] >= 0:
+            path.append(positions[node_id])
+            node_id = parents[node_id]
+        return tuple(reversed(path))
+
+    def select_paths(self, selector):
+        """Return the paths of the nodes matching a selector, in document order (see
+        `Node.replace_at()`)."""
+        return [self.path(i) for i in self._select_ids(selector)]
+
+    def rewrite(self, selector, func):
+        """Return a new tree where `func(node)` has replaced all nodes matching a
+        selector.
+
+        Only the matching nodes and their ancestors are copied, and the new tree shares
+        all other nodes with the original tree. When a node and one of its descendants
+        match, `func()` receives the node with the new descendant.
+
+        """
+        ids = self._select_ids(selector)
+        if not ids:
+            return self.tree
+        nodes, parents, positions = self._nodes, self._parents, self._positions
+        matched = set(ids)
+        # The matching nodes and their ancestors are rebuilt from the leaves to the root.
+        touched = set()
+        for i in ids:
+            while i >= 0 and i not in touched:
+                touched.add(i)
+                i = parents[i]
+        # New children of the touched nodes: `{position: child}`.
+        changes = {}
+        node = self.tree
+        for i in sorted(touched, reverse=True):
+            node = nodes[i]
+            new_children = changes.pop(i, None)
+            if new_children:
+                children = list(node.children)
+                for position, child in new_children.items():
+                    children[position] = child
+                node = node.replace(children=children)
+            if i in matched:
+                node = func(node)
+            if node is not nodes[i] and parents[i] >= 0:
+                changes.setdefault(parents[i], {})[positions[i]] = node
+        return node
+
+
+def select(tree, selector):
+    """Return the nodes of a tree matching a selector, in document order."""
+    return TreeIndex(tree).select(selector)
+
+
+def rewrite(tree, selector, func):
+    """Return a new tree where `func(node)` has replaced all nodes matching a selector
+    (see `TreeIndex.rewrite()`)."""
+    return TreeIndex(tree).rewrite(selector, func)
@@ -0,0 +1,279 @@
+# -*- coding: utf-8 -*-
+
+"""reStructuredText plugin."""
+
+
+#-------------------------------------------------------------------------------------------------
+# Imports
+#-------------------------------------------------------------------------------------------------
+
+import logging
+import os.path as op
+import re
+
+from podoc.ast import ASTNode
+from podoc.plugin import IPlugin
+from podoc.tree import TreeTransformer
+from podoc.utils import _get_file, _get_resources_path, _save_resources
+
+logger = logging.getLogger(__name__)
+
+
+#-------------------------------------------------------------------------------------------------
+# Utils
+#-------------------------------------------------------------------------------------------------
+
+# Header underline characters, by level.
+_UNDERLINES = '=-~^\'"'
+
+# Inline nodes rendered with rST inline markup, which must be separated from the
+# surrounding words.
+_MARKUP_NAMES = ('Emph', 'Strong', 'Code', 'Math', 'Link', 'Strikeout')
+
+_ESCAPE_RE = re.compile(r'([\\*`|]|_(?=\W|$))')
+
+
+def escape_rst(text):
+    """Escape the characters that have a special meaning in rST inline text."""
+    return _ESCAPE_RE.sub(r'\\\1', text)
+
+
+def _indent(text, n):
+    """Indent all non-empty lines of a text."""
+    return '\n'.join((' ' * n + line) if line else line for line in text.split('\n'))
+
+
+def _resource_url(url):
+    # NOTE: the resources that have not been replaced by actual paths are referred
+    # to by their file name.
+    return re.sub(r'^\{resource:([^\}]+)\}$', r'\1', url)
+
+
+#-------------------------------------------------------------------------------------------------
+# rST renderer
+#-------------------------------------------------------------------------------------------------
+
+class ASTToRST(TreeTransformer):
+    """Read an AST and render a reStructuredText string."""
+
+    def __init__(self):
+        # Definitions of the inline images: `(name, url)`.
+        self._substitutions = []
+
+    def transform_main(self, ast):
+        """Render a whole document, with the definitions of the inline images."""
+        out = self.transform(ast)
+        if self._substitutions:
+            out += '\n\n' + '\n'.join('.. |{}| image:: {}'.format(name, url)
+                                      for name, url in self._substitutions)
+        return out
+
+    def get_inner_contents(self, node):
+        first = node.children[0] if node.children else None
+        if isinstance(first, ASTNode) and first.is_block_like():
+            # Consecutive blocks are separated by blank lines.
+            return '\n\n'.join(self._iter_blocks(node))
+        return self._join_inlines(node.children, self.transform_children(node))
+
+    def _iter_blocks(self, node):
+        first = True
+        for child, s in zip(node.children, self.transform_children(node)):
+            if not s:
+                continue
+            # NOTE: like pandoc, we write an empty comment before a block quote, which
+            # would otherwise be absorbed by the previous block (list, literal block,
+            # directive, block quote) or lose its indentation in a list item.
+            if (isinstance(child, ASTNode) and child.name == 'BlockQuote' and
+                    (not first or node.name == 'ListItem')):
+                s = '..\n\n' + s
+            first = False
+            yield s
+
+    def _join_inlines(self, children, outputs):
+        """Concatenate inline contents, escaping the spaces between inline markup and
+        adjacent words."""
+        out = []
+        for i, (child, s) in enumerate(zip(children, outputs)):
+            prev = children[i - 1] if i else None
+            if out and s and out[-1]:
+                is_markup = isinstance(child, ASTNode) and child.name in _MARKUP_NAMES
+                prev_markup = isinstance(prev, ASTNode) and prev.name in _MARKUP_NAMES
+                if ((is_markup and out[-1][-1].isalnum()) or
+                        (prev_markup and s[0].isalnum())):
+                    out.append('\\ ')
+            out.append(s)
+        return ''.join(out)
+
+    def transform_str(self, text):
+        return escape_rst(text)
+
+    def transform_Node(self, node):
+        return self.get_inner_contents(node)
+
+    # Block nodes
+    # --------------------------------------------------------------------------------------------
+
+    def _write_inlines(self, children):
+        text = self._join_inlines(children, [self.transform(child) for child in children])
+        # NOTE: paragraphs with line breaks are written as line blocks.
+        if any(isinstance(child, ASTNode) and child.name == 'LineBreak' for child in children):
+            text = '\n'.join('| ' + line for line in text.split('\n'))
+        return text
+
+    def transform_Plain(self, node):
+        children = node.children
+        # Paragraph with a single image.
+        if len(children) == 1 and isinstance(children[0], ASTNode) and \
+                children[0].name == 'Image':
+            image = children[0]
+            return '.. image:: {}\n   :alt: {}'.format(_resource_url(image.url),
+                                                       image.text_contents())
+        # NOTE: display math is written in a math directive, which splits the paragraph.
+        out, inlines = [], []
+        for child in children:
+            if isinstance(child, ASTNode) and child.name == 'MathBlock':
+                if inlines:
+                    out.append(self._write_inlines(inlines))
+                inlines = []
+                out.append(self.transform(child))
+            else:
+                inlines.append(child)
+        if inlines:
+            out.append(self._write_inlines(inlines))
+        return '\n\n'.join(s.strip(' ') for s in out if s.strip())
+
+    def transform_Para(self, node):
+        return self.transform_Plain(node)
+
+    def transform_Header(self, node):
+        text = self.get_inner_contents(node)
+        char = _UNDERLINES[min(node.level, len(_UNDERLINES)) - 1]
+        return '{}\n{}'.format(text, char * len(text))
+
+    def transform_CodeBlock(self, node):
+        lang = node.get('lang', None) or ''
+        code = _indent(''.join(node.children), 3)
+        m = re.match(r'^\{output:([^\}]+)\}$', lang)
+        if m:
+            # Code cell output: stdout, stderr, result, error.
+            return '.. code::\n   :class: output {}\n\n{}'.format(m.group(1), code)
+        if lang:
+            return '.. code:: {}\n\n{}'.format(lang, code)
+        return '::\n\n{}'.format(code)
+
+    def transform_CodeCell(self, node):
+        # NOTE: code cells are rendered as their source and outputs, so that a notebook
+        # and its Markdown version give the same rST.
+        return '\n\n'.join(filter(None, self.transform_children(node)))
+
+    def transform_BlockQuote(self, node):
+        return _indent(self.get_inner_contents(node), 3)
+
+    def transform_MathBlock(self, node):
+        return '.. math::\n\n{}'.format(_indent(''.join(node.children).strip(), 3))
+
+    def transform_RawBlock(self, node):
+        raw_type = node.get('raw_type', None) or 'latex'
+        return '.. raw:: {}\n\n{}'.format(raw_type, _indent(''.join(node.children), 3))
+
+    def transform_HorizontalRule(self, node):
+        return '-' * 20
+
+    def _write_list(self, node, list_type):
+        assert list_type in ('bullet', 'ordered')
+        if list_type == 'ordered':
+            number = node.get('start', 1)
+            suffix = ')' if node.get('delimiter', '.') == ')' else '.'
+        # NOTE: the items of loose lists are separated by blank lines.
+        loose = any(isinstance(child, ASTNode) and child.name == 'Para'
+                    for item in node.children for child in item.children)
+        out = []
+        for item in self.transform_children(node):
+            bullet = '-' if list_type == 'bullet' else '{}{}'.format(number, suffix)
+            if out:
+                # NOTE: in tight lists, the items ending with a block (nested list, code
+                # block, directive, line block) must be followed by a blank line too.
+                out.append('\n\n' if loose or '\n' in out[-1] else '\n')
+            # We indent all lines in the item to the item's contents.
+            out.append(bullet + ' ' + _indent(item, len(bullet) + 1).lstrip(' '))
+            if list_type == 'ordered':
+                number += 1
+        return ''.join(out)
+
+    def transform_BulletList(self, node):
+        return self._write_list(node, 'bullet')
+
+    def transform_OrderedList(self, node):
+        return self._write_list(node, 'ordered')
+
+    def transform_ListItem(self, node):
+        return self.get_inner_contents(node)
+
+    # Inline nodes
+    # --------------------------------------------------------------------------------------------
+
+    def transform_Emph(self, node):
+        return '*{}*'.format(self.get_inner_contents(node))
+
+    def transform_Strong(self, node):
+        return '**{}**'.format(self.get_inner_contents(node))
+
+    def transform_Strikeout(self, node):
+        # NOTE: rST has no strikeout markup, like pandoc we write it as text.
+        return '[STRIKEOUT:{}]'.format(self.get_inner_contents(node))
+
+    def transform_Code(self, node):
+        return '``{}``'.format(''.join(node.children))
+
+    def transform_LineBreak(self, node):
+        return '\n'
+
+    def transform_Math(self, node):
+        return ':math:`{}`'.format(''.join(node.children))
+
+    def transform_Link(self, node):
+        text = self.get_inner_contents(node)
+        if node.text_contents() == node.url:
+            return node.url
+        # NOTE: anonymous hyperlinks allow several links with the same text.
+        return '`{} <{}>`__'.format(text, node.url)
+
+    def transform_Image(self, node):
+        # Inline images are substitutions defined at the end of the document.
+        name = 'image{}'.format(len(self._substitutions) + 1)
+        self._substitutions.append((name, _resource_url(node.url)))
+        return '|{}|'.format(name)
+
+
+#-------------------------------------------------------------------------------------------------
+# rST plugin
+#-------------------------------------------------------------------------------------------------
+
+class RSTPlugin(IPlugin):
+    def attach(self, podoc):
+        podoc.register_lang('rst', file_ext='.rst', load_func=self.load, dump_func=self.dump)
+        # NOTE: when pandoc is available, the conversion to rST is done by pandoc unless
+        # the native writer is preferred.
+        if podoc.with_pandoc and not podoc.prefers_native('rst'):
+            return
+        podoc.register_func(source='ast', target='rst', func=self.write)
+
+    def load(self, file_or_path):
+        """Load a reStructuredText file and return a string."""
+        with _get_file(file_or_path, 'r') as f:
+            text = f.read()
+        return text
+
+    def dump(self, text, file_or_path, context=None):
+        """Dump string to a reStructuredText file."""
+        with _get_file(file_or_path, 'w') as f:
+            path = op.realpath(f.name)
+            f.write(text)
+            f.write('\n')
+        # Save the resources.
+        if (context or {}).get('resources', {}):
+            _save_resources(context.get('resources', {}), _get_resources_path(path))
+
+    def write(self, ast, context=None):
+        assert isinstance(ast, ASTNode)
+        return ASTToRST().transform_main(ast)
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+
+"""Test reStructuredText plugin."""
+
+
+#-------------------------------------------------------------------------------------------------
+# Imports
+#-------------------------------------------------------------------------------------------------
+
+from podoc.ast import ASTNode
+from podoc.core import Podoc
+from podoc.markdown.parser import MarkdownParser
+from podoc.utils import has_pandoc
+from .._rst import ASTToRST, escape_rst
+
+
+#-------------------------------------------------------------------------------------------------
+# Utils
+#-------------------------------------------------------------------------------------------------
+
+def _test_renderer(markdown, rst):
+    ast = MarkdownParser().parse(markdown)
+    assert ASTToRST().transform_main(ast) == rst
+
+
+#-------------------------------------------------------------------------------------------------
+# Test rST renderer
+#-------------------------------------------------------------------------------------------------
+
+def test_escape_rst():
+    assert escape_rst('a*b `c` snake_case word_') == 'a\\*b \\`c\\` snake_case word\\_'
+
+
+def test_rst_inline():
+    _test_renderer('hello *world* **a** `b`', 'hello *world* **a** ``b``')
+    _test_renderer('*a*b', '*a*\\ b')
+    _test_renderer('a $x$ b', 'a :math:`x` b')
+    _test_renderer('[a](http://x.org) <http://y.org>', '`a <http://x.org>`__ http://y.org')
+    _test_renderer('a\nb', '| a\n| b')
+    _test_renderer('a ![b](b.png) c', 'a |image1| c\n\n.. |image1| image:: b.png')
+
+
+def test_rst_blocks():
+    _test_renderer('# A\n\n## B', 'A\n=\n\nB\n-')
+    _test_renderer('```python\na\n\nb\n```', '.. code:: python\n\n   a\n\n   b')
+    _test_renderer('    a', '::\n\n   a')
+    _test_renderer('```{output:stdout}\na\n```', '.. code::\n   :class: output stdout\n\n   a')
+    _test_renderer('a $$y$$ b', 'a\n\n.. math::\n\n   y\n\nb')
+    _test_renderer('> a', '   a')
+    # The block quotes are separated from the previous blocks by an empty comment.
+    _test_renderer('```\ncode\n```\n\n> q', '::\n\n   code\n\n..\n\n   q')
+    _test_renderer('* a\n\n> q', '- a\n\n..\n\n   q')
+    _test_renderer('> a\n\n> b', '   a\n\n..\n\n   b')
+    _test_renderer('* > q\n* b', '- ..\n\n     q\n\n- b')
+    _test_renderer('![a](a.png)', '.. image:: a.png\n   :alt: a')
+    _test_renderer('\\begin{align*}\nx\n\\end{align*}',
+                   '.. raw:: latex\n\n   \\begin{align*}\n   x\n   \\end{align*}')
+
+
+def test_rst_lists():
+    _test_renderer('* a\n* b', '- a\n- b')
+    _test_renderer('* a\n\n* b', '- a\n\n- b')
+    _test_renderer('9) a\n10) b\n\n    c', '9) a\n\n10) b\n\n    c')
+    _test_renderer('1. a\n    * b\n    * c', '1. a\n\n   - b\n   - c')
+    _test_renderer('1. a\n    * b\n    * c\n2. d', '1. a\n\n   - b\n   - c\n\n2. d')
+    _test_renderer('* a\n* ```\n  b\n  ```\n* c\n* d', '- a\n- ::\n\n     b\n\n- c\n- d')
+
+
+def test_rst_code_cell():
+    ast = ASTNode('root')
+    cell = ast.add_child(ASTNode('CodeCell'))
+    cell.add_child(ASTNode('CodeBlock', lang='python', children=['1']))
+    cell.add_child(ASTNode('Para', children=[ASTNode('Image', url='{resource:a.png}',
+                                                     children=['Output'])]))
+    assert ASTToRST().transform_main(ast) == ('.. code:: python\n\n   1\n\n'
+                                              '.. image:: a.png\n   :alt: Output')
+
+
+def test_rst_plugin():
+    podoc = Podoc(native=['rst'])
+    assert not podoc.get_func('ast', 'rst').get('pandoc', None)
+    assert podoc.convert_text('*a*', source='markdown', target='rst') == '*a*'
+    if has_pandoc():
+        assert Podoc().get_func('ast', 'rst').pandoc
@@ -0,0 +1,358 @@
+# -*- coding: utf-8 -*-
+
+"""Script plugin.
+
+This plugin implements Script <-> Notebook and Script <-> AST for scripts in the
+percent format. Every cell starts with a marker line: `# %%` for code cells, and
+`# %% [markdown]` for Markdown cells, whose lines are commented. The IPython magics
+of the code cells are commented too, so that the script remains valid Python. The
+code lines that look like cell markers, and the comments that look like commented
+magics or markers (e.g. `# %d items`), are commented once more, so that they are read
+back unchanged.
+
+The outputs of a code cell are written in the Markdown cell following it, with the
+same conventions as the Markdown plugin: `{output:...}` code blocks and paragraphs
+with just an image.
+
+Scripts are read and written one line at a time, and the Markdown cells are parsed
+with the native Markdown parser, so that these conversions never call pandoc.
+
+"""
+
+
+#-------------------------------------------------------------------------------------------------
+# Imports
+#-------------------------------------------------------------------------------------------------
+
+import logging
+import os.path as op
+import re
+
+import nbformat
+from nbformat.v4 import new_notebook, new_code_cell, new_markdown_cell
+
+from podoc.ast import ASTNode
+from podoc.markdown._markdown import ASTToMarkdown
+from podoc.markdown.parser import MarkdownParser, iter_block_spans
+from podoc.notebook._notebook import (CodeCellWrapper,
+                                      NotebookReader,
+                                      NotebookWriter,
+                                      _is_output_block,
+                                      replace_resource_paths,
+                                      )
+from podoc.plugin import IPlugin
+from podoc.utils import _get_file, _get_resources_path, _save_resources
+
+logger = logging.getLogger(__name__)
+
+
+#-------------------------------------------------------------------------------------------------
+# Utils
+#-------------------------------------------------------------------------------------------------
+
+# IPython magics and shell commands.
+_MAGIC = re.compile(r'^\s*(%%?|!)\w')
+
+
+def _cell_type(line, marker):
+    """Return the type of the cell started by a line, or None if the line is not a
+    cell marker."""
+    if not line.startswith(marker):
+        return
+    rest = line[len(marker):]
+    if rest and not rest[0].isspace():
+        return
+    return 'markdown' if re.search(r'\[(markdown|md)\]', rest) else 'code'
+
+
+def _is_escaped(line, marker, comment):
+    """Whether a code line is commented by the writer: a magic or a cell marker,
+    commented any number of times."""
+    while not _MAGIC.match(line):
+        line = line.lstrip()
+        if _cell_type(line, marker) is not None:
+            return True
+        if not line.startswith(comment):
+            return False
+        line = line[len(comment):]
+    return True
+
+
+def _fence(code, lang=''):
+    """Return a fenced code block longer than the fences within the code."""
+    n = max([3] + [len(fence) + 1 for fence in re.findall(r'^ {0,3}(`{3,})', code, re.M)])
+    return '{0}{1}\n{2}\n{0}'.format('`' * n, lang, code)
+
+
+#-------------------------------------------------------------------------------------------------
+# Script reader
+#-------------------------------------------------------------------------------------------------
+
+class ScriptReader(object):
+    """Read a script in the percent format.
+
+    Parameters
+    ----------
+
+    marker : str ('# %%')
+        Prefix of the lines starting a new cell.
+    comment : str ('#')
+        Line comment prefix of the script's language.
+    language : str ('python')
+        Language of the code cells.
+
+    """
+
+    def __init__(self, marker='# %%', comment='#', language='python'):
+        self.marker = marker
+        self.comment = comment
+        self.language = language
+
+    def cell_type(self, line):
+        """Return the type of the cell started by a line, or None if the line is not
+        a cell marker."""
+        return _cell_type(line, self.marker)
+
+    def _uncomment(self, line):
+        if not line.startswith(self.comment):
+            return line
+        line = line[len(self.comment):]
+        return line[1:] if line.startswith(' ') else line
+
+    def _unescape(self, line):
+        # NOTE: the writer comments the magics and the cell markers, and the comments
+        # that look like them, once.
+        stripped = line.lstrip()
+        if not stripped.startswith(self.comment):
+            return line
+        uncommented = line[:len(line) - len(stripped)] + self._uncomment(stripped)
+        return (uncommented if _is_escaped(uncommented, self.marker, self.comment)
+                else line)
+
+    def iter_cells(self, lines):
+        """Yield `(cell_type, source)` for all cells in an iterable of lines.
+
+        The lines before the first marker form a code cell.
+
+        """
+        cell_type, source = 'code', []
+        for line in lines:
+            line = line.rstrip('\r\n')
+            new_type = self.cell_type(line)
+            if new_type is None:
+                if cell_type == 'markdown':
+                    line = self._uncomment(line)
+                else:
+                    line = self._unescape(line)
+                source.append(line)
+                continue
+            yield from _make_cell(cell_type, source)
+            cell_type, source = new_type, []
+        yield from _make_cell(cell_type, source)
+
+    def iter_markdown(self, lines):
+        """Yield the Markdown of all cells, with the conventions of the Markdown
+        plugin."""
+        for cell_type, source in self.iter_cells(lines):
+            yield source if cell_type == 'markdown' else _fence(source, self.language)
+
+    def read(self, lines):
+        """Read a script and return an AST."""
+        return MarkdownParser().parse('\n\n'.join(self.iter_markdown(lines)))
+
+    def read_notebook(self, lines, context=None):
+        """Read a script and return a notebook, keeping the script's cells."""
+        writer = NotebookWriter()
+        writer._init(context=context)
+        nb = new_notebook()
+        cell = None
+        n_code_cells = 0
+        for cell_type, source in self.iter_cells(lines):
+            if cell_type == 'code':
+                n_code_cells += 1
+                writer.execution_count = n_code_cells
+                cell = new_code_cell(source, execution_count=n_code_cells)
+                nb.cells.append(cell)
+                continue
+            # A Markdown cell following a code cell, and with only outputs, contains
+            # the outputs of that cell.
+            if cell is not None:
+                md_lines = source.expandtabs(4).split('\n')
+                spans = list(iter_block_spans(md_lines))
+                if all(_is_output_block(md_lines[i:j], lang) for i, j, lang in spans):
+                    cell.outputs.extend(writer.new_block_output(cell, md_lines[i:j], lang)
+                                        for i, j, lang in spans)
+                    cell = None
+                    continue
+            cell = None
+            nb.cells.append(new_markdown_cell(source))
+        nbformat.validate(nb)
+        return nb
+
+
+def _make_cell(cell_type, source):
+    # Remove the blank lines around the cell.
+    text = '\n'.join(source).strip('\n')
+    if text.strip():
+        yield cell_type, text
+
+
+#-------------------------------------------------------------------------------------------------
+# Script writer
+#-------------------------------------------------------------------------------------------------
+
+class ScriptWriter(object):
+    """Write a script in the percent format.
+
+    Parameters
+    ----------
+
+    marker : str ('# %%')
+        Prefix of the lines starting a new cell.
+    comment : str ('#')
+        Line comment prefix of the script's language.
+
+    """
+
+    def __init__(self, marker='# %%', comment='#'):
+        self.marker = marker
+        self.comment = comment
+        self.resources = {}
+
+    def iter_lines(self, cells):
+        """Yield the lines of the script from `(cell_type, source)` tuples."""
+        for i, (cell_type, source) in enumerate(cells):
+            if i:
+                yield ''
+            if cell_type == 'markdown':
+                yield self.marker + ' [markdown]'
+                for line in source.split('\n'):
+                    yield '{} {}'.format(self.comment, line) if line else self.comment
+            else:
+                yield self.marker
+                for line in source.split('\n'):
+                    yield ('{} {}'.format(self.comment, line)
+                           if _is_escaped(line, self.marker, self.comment) else line)
+
+    def _iter_code_cell(self, node, writer):
+        assert node.name == 'CodeCell'
+        yield 'code', node.children[0].children[0]
+        # The outputs are written in a Markdown cell.
+        outputs = [writer.transform(child) for child in node.children[1:]]
+        if outputs:
+            yield 'markdown', '\n\n'.join(outputs)
+
+    def iter_ast_cells(self, ast):
+        """Yield the cells of an AST, with the same conventions as the notebook
+        writer."""
+        writer = ASTToMarkdown()
+        for node in CodeCellWrapper().wrap(ast).children:
+            if node.name == 'CodeCell':
+                yield from self._iter_code_cell(node, writer)
+            else:
+                yield 'markdown', writer.transform(node)
+
+    def iter_notebook_cells(self, notebook, context=None):
+        """Yield the cells of a notebook, with the Markdown cells copied verbatim.
+
+        The images of the outputs are saved in the `resources` attribute.
+
+        """
+        reader = NotebookReader()
+        reader._init(notebook, context=context)
+        self.resources = reader.resources
+        writer = ASTToMarkdown()
+        for cell_index, cell in enumerate(notebook.cells):
+            if cell.cell_type == 'markdown':
+                source = cell.source.strip('\n')
+                if source:
+                    yield 'markdown', source
+            elif cell.cell_type == 'code':
+                reader.read_code(cell, cell_index)
+                node = replace_resource_paths(reader.tree.children.pop(), context=context)
+                yield from self._iter_code_cell(node, writer)
+
+    def write(self, ast):
+        """Write an AST and return a script."""
+        return '\n'.join(self.iter_lines(self.iter_ast_cells(ast)))
+
+    def write_notebook(self, notebook, context=None):
+        """Write a notebook and return a script."""
+        return '\n'.join(self.iter_lines(self.iter_notebook_cells(notebook, context=context)))
+
+
+#-------------------------------------------------------------------------------------------------
+# Script plugin
+#-------------------------------------------------------------------------------------------------
+
+class ScriptPlugin(IPlugin):
+    """Script plugin.
+
+    Parameters
+    ----------
+
+    marker : str ('# %%')
+        Prefix of the lines starting a new cell.
+    comment : str ('#')
+        Line comment prefix of the script's language.
+    language : str ('python')
+        Language of the code cells.
+    file_ext : str ('.py')
+        File extension of the scripts.
+
+    """
+
+    def __init__(self, marker='# %%', comment='#', language='python', file_ext='.py'):
+        self.marker = marker
+        self.comment = comment
+        self.language = language
+        self.file_ext = file_ext
+
+    def attach(self, podoc):
+        podoc.register_lang('script', file_ext=self.file_ext,
+                            load_func=self.load, dump_func=self.dump)
+        podoc.register_func(source='script', target='ast', func=self.read)
+        podoc.register_func(source='ast', target='script', func=self.write)
+        podoc.register_func(source='script', target='notebook', func=self.to_notebook)
+        podoc.register_func(source='notebook', target='script', func=self.from_notebook)
+
+    def load(self, file_or_path):
+        """Load a script and return a string."""
+        with _get_file(file_or_path, 'r') as f:
+            text = f.read()
+        return text
+
+    def dump(self, text, file_or_path, context=None):
+        """Dump a string to a script."""
+        with _get_file(file_or_path, 'w') as f:
+            path = op.realpath(f.name)
+            f.write(text)
+            f.write('\n')
+        # Save the resources.
+        if (context or {}).get('resources', {}):
+            _save_resources(context.get('resources', {}), _get_resources_path(path))
+
+    def _reader(self):
+        return ScriptReader(marker=self.marker, comment=self.comment, language=self.language)
+
+    def _writer(self):
+        return ScriptWriter(marker=self.marker, comment=self.comment)
+
+    def read(self, text, context=None):
+        assert isinstance(text, str)
+        return self._reader().read(text.split('\n'))
+
+    def write(self, ast, context=None):
+        assert isinstance(ast, ASTNode)
+        return self._writer().write(ast)
+
+    def to_notebook(self, text, context=None):
+        assert isinstance(text, str)
+        return self._reader().read_notebook(text.split('\n'), context=context)
+
+    def from_notebook(self, notebook, context=None):
+        writer = self._writer()
+        text = writer.write_notebook(notebook, context=context)
+        if context:
+            context.resources = writer.resources
+        return text
@@ -0,0 +1,2 @@
+# %% [markdown]
+# hello *world*
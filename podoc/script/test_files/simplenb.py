@@ -0,0 +1,45 @@
+# %% [markdown]
+# # A notebook
+
+# %% [markdown]
+# First, some code:
+
+# %%
+print('hello *world*')
+2 * 3
+
+# %% [markdown]
+# ```{output:stdout}
+# hello *world*
+# ```
+#
+# ```{output:result}
+# 6
+# ```
+
+# %% [markdown]
+# An image:
+
+# %%
+import numpy as np
+import matplotlib.pyplot as plt
+# %matplotlib inline
+np.random.seed(2016)
+plt.imshow(np.random.rand(4, 4, 3), interpolation='none')
+plt.xticks([])
+plt.yticks([])
+plt.show()
+
+# %% [markdown]
+# ```{output:stderr}
+# Vendor:  Continuum Analytics, Inc.
+# Package: mkl
+# Message: trial mode expires in 30 days
+# ```
+#
+# ![Output image](simplenb_files/simplenb_4_1.png)
+
+# %% [markdown]
+# ```javascript
+# "This is not part of the previous code cell's output, since it's not Python."
+# ```
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+
+"""Test script plugin."""
+
+
+#-------------------------------------------------------------------------------------------------
+# Imports
+#-------------------------------------------------------------------------------------------------
+
+from nbformat.v4 import new_notebook, new_code_cell
+
+from podoc.ast import ASTPlugin
+from podoc.core import Podoc
+from podoc.markdown.parser import MarkdownParser
+from podoc.notebook._notebook import open_notebook
+from podoc.utils import get_test_file_path, load_text
+from .._script import ScriptPlugin, ScriptReader, ScriptWriter
+
+
+#-------------------------------------------------------------------------------------------------
+# Utils
+#-------------------------------------------------------------------------------------------------
+
+def _remove_ids(nb):
+    for cell in nb.cells:
+        cell.pop('id', None)
+    nb.nbformat_minor = 0
+    return nb
+
+
+#-------------------------------------------------------------------------------------------------
+# Test script plugin
+#-------------------------------------------------------------------------------------------------
+
+def test_script_reader_cells():
+    text = ('import os\n\n# %% [markdown]\n# # Title\n#\n# text\n\n'
+            '# %%\n# %matplotlib inline\nx = 1  # comment\n\n\n# %%time\n'
+            '# %% [markdown] {"tags": []}\n#no space\n\n# %%\n\n')
+    cells = list(ScriptReader().iter_cells(text.split('\n')))
+    assert cells == [('code', 'import os'),
+                     ('markdown', '# Title\n\ntext'),
+                     ('code', '%matplotlib inline\nx = 1  # comment\n\n\n%%time'),
+                     ('markdown', 'no space'),
+                     ]
+
+    # The magics are commented again.
+    lines = ScriptWriter().iter_lines(cells)
+    assert list(ScriptReader().iter_cells(lines)) == cells
+
+
+def test_script_magic_comments():
+    # The comments that look like commented magics are kept.
+    code = ('# %d items expected\n# !important: keep this disabled\n'
+            '%time x = 1\nif x:\n    !ls\n    # %%timeit\n# # %%\nx = 1')
+    lines = list(ScriptWriter().iter_lines([('code', code)]))
+    assert lines[1:4] == ['# # %d items expected', '# # !important: keep this disabled',
+                          '# %time x = 1']
+    assert list(ScriptReader().iter_cells(lines)) == [('code', code)]
+
+    # The code lines that look like cell markers do not split the cell.
+    code_2 = '# %%\nx = 1\n# %% [markdown]\n    # %%\n# # %%'
+    lines = list(ScriptWriter().iter_lines([('code', code_2), ('markdown', 'a')]))
+    assert lines[1:3] == ['# # %%', 'x = 1']
+    assert list(ScriptReader().iter_cells(lines)) == [('code', code_2), ('markdown', 'a')]
+
+    nb = new_notebook(cells=[new_code_cell(code)])
+    script = ScriptPlugin().from_notebook(nb)
+    assert ScriptPlugin().to_notebook(script).cells[0].source == code
+
+
+def test_script_marker():
+    reader = ScriptReader(marker='-- %%', comment='--', language='lua')
+    ast = reader.read(['print(1)', '-- %% [markdown]', '-- *text*'])
+    assert ast == MarkdownParser().parse('```lua\nprint(1)\n```\n\n*text*')
+
+    writer = ScriptWriter(marker='-- %%', comment='--')
+    assert writer.write(ast) == '-- %%\nprint(1)\n\n-- %% [markdown]\n-- *text*'
+
+
+def test_script_fence():
+    # The code blocks can contain fences.
+    code = 'x = """\n```\n"""'
+    ast = ScriptReader().read(['# %%', code])
+    assert ast.children[0].children == [code]
+
+
+def test_script_to_notebook():
+    path = get_test_file_path('script', 'simplenb.py')
+    nb = ScriptPlugin().to_notebook(load_text(path), context={'path': path})
+    nb_expected = open_notebook(get_test_file_path('notebook', 'simplenb.ipynb'))
+    assert _remove_ids(nb) == _remove_ids(nb_expected)
+
+    # The script cells are kept, and only Markdown cells with outputs are outputs.
+    nb = ScriptPlugin().to_notebook('# %%\n1\n\n# %% [markdown]\n# ```\n# 1\n# ```\n\n'
+                                    '# %% [markdown]\n# a\n#\n# b\n\n'
+                                    '# %% [markdown]\n# ```\n# 2\n# ```')
+    assert [cell.cell_type for cell in nb.cells] == ['code', 'markdown', 'markdown']
+    assert nb.cells[0].outputs[0].data['text/plain'] == '1'
+    assert nb.cells[1].source == 'a\n\nb'
+
+
+def test_script_podoc():
+    podoc = Podoc(with_pandoc=False)
+    path = get_test_file_path('script', 'simplenb.py')
+    _, context = podoc.convert_file(path, target='notebook', return_context=True)
+    assert context.lang_chain == ['script', 'notebook']
+
+    ast = podoc.convert_file(path, target='ast')
+    assert ast == ASTPlugin().load(get_test_file_path('ast', 'simplenb.json'))
+
+    text = podoc.convert_text(ast, source='ast', target='script')
+    assert text + '\n' == load_text(path)
@@ -10,11 +10,15 @@
 import logging
 import os
 import os.path as op
+from threading import Event, Timer
+import time
 
 from pytest import fixture, raises
 
 from ..core import Podoc, _find_path, _get_annotation, _connected_component
-from ..utils import get_test_file_path, load_text, dump_text
+from ..tree import Node, PassManager, TreeRewriter
+from ..utils import (get_test_file_path, load_text, dump_text,
+                     ConversionTimeout, ConversionCancelled)
 
 logger = logging.getLogger(__name__)
 
@@ -36,6 +40,9 @@ def test_find_path():
     assert _find_path([(1, 2), (2, 3), (3, 4), (4, 5)], 1, 5) == \
         [1, 2, 3, 4, 5]
     assert _find_path([(1, 2), (2, 3), (1, 4), (4, 5)], 1, 5) == [1, 4, 5]
+    # Dense graph without any path to the target.
+    edges = [(i, j) for i in range(50) for j in range(50) if i != j]
+    assert _find_path(edges, 0, 50) is None
 
 
 def test_connected_component():
@@ -112,6 +119,40 @@ def test_podoc_convert_1(tempdir, podoc_fixture):
     assert p.convert_file(path, target='lower') == 'hello'
 
 
+def test_podoc_convert_timeout(tempdir, podoc_fixture):
+    p = podoc_fixture
+
+    @p.register_func(source='upper', target='slow')
+    def slow(text, context=None):
+        time.sleep(.2)
+        return text
+
+    p.register_lang('slow')
+    p.register_func(source='slow', target='lower', func=lambda text, context=None: text)
+
+    assert p.convert_text('A', lang_chain=['upper', 'slow', 'lower'], timeout=10) == 'A'
+    with raises(ConversionTimeout):
+        p.convert_text('A', lang_chain=['upper', 'slow', 'lower'], timeout=.1)
+
+    # Default timeout.
+    p.timeout = .1
+    with raises(ConversionTimeout):
+        p.convert_text('A', lang_chain=['upper', 'slow', 'lower'])
+    p.timeout = None
+
+    # Cancellation.
+    cancel = Event()
+    Timer(.1, cancel.set).start()
+    with raises(ConversionCancelled):
+        p.convert_text('A', lang_chain=['upper', 'slow', 'lower'], cancel=cancel)
+
+    # Cancellation of a batch conversion.
+    path = op.join(tempdir, 'test.up')
+    dump_text('HELLO', path)
+    with raises(ConversionCancelled):
+        p.convert_files([path, path], target='lower', cancel=cancel)
+
+
 def test_podoc_convert_2(tempdir, podoc_fixture):
     p = podoc_fixture
 
@@ -136,6 +177,41 @@ def test_podoc_convert_2(tempdir, podoc_fixture):
     assert load_text(op.join(tempdir, 'out', 'test2.low')) == 'test2'
 
 
+def test_podoc_filters():
+    p = Podoc(plugins=[], with_pandoc=False)
+    p.register_lang('a')
+    p.register_lang('b')
+    p.register_lang('c')
+    calls = []
+
+    class Tag(TreeRewriter):
+        node_local = True
+
+        def __init__(self, tag):
+            self.tag = tag
+
+        def transform_Node(self, node):
+            calls.append((self.tag, node.name))
+            return self.rebuild(node).replace(tags=node.get('tags', ()) + (self.tag,))
+
+    def check(tree, context=None):
+        assert context.source == 'a'
+        return tree
+
+    p.register_func(source='a', target='b', func=lambda tree, context=None: tree,
+                    pre_filter=check,
+                    post_filter=PassManager([Tag('post')]))
+    p.register_func(source='b', target='c', func=lambda tree, context=None: tree,
+                    pre_filter=PassManager([Tag('pre')]))
+
+    tree = Node('root', children=[Node('child')])
+    out = p.convert_text(tree, source='a', target='c')
+    assert out.tags == out.children[0].tags == ('post', 'pre')
+    # The post-filter of the first conversion and the pre-filter of the second one
+    # have been applied in a single traversal.
+    assert calls == [('post', 'child'), ('pre', 'child'), ('post', 'root'), ('pre', 'root')]
+
+
 def test_podoc_2(tempdir):
     p = Podoc(with_pandoc=False)
 
@@ -153,7 +229,7 @@ def test_podoc_2(tempdir):
 
     assert context.source == 'markdown'
     assert context.target == 'notebook'
-    assert context.lang_chain == ['markdown', 'ast', 'notebook']
+    assert context.lang_chain == ['markdown', 'notebook']
 
     assert '"cell_type": "markdown"' in load_text(ipynb_path)
 
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+
+"""Test tree queries."""
+
+
+#-------------------------------------------------------------------------------------------------
+# Imports
+#-------------------------------------------------------------------------------------------------
+
+from pytest import fixture, raises
+
+from ..query import TreeIndex, compile_selector, rewrite, select
+from ..tree import Node
+
+
+#-------------------------------------------------------------------------------------------------
+# Fixtures
+#-------------------------------------------------------------------------------------------------
+
+@fixture
+def tree():
+    link_1 = Node('Link', url='http://a.org/x.pdf', children=['a'])
+    link_2 = Node('Link', url='b.md', children=['b'])
+    image = Node('Image', url='{resource:a.png}', children=['c'])
+    quote = Node('BlockQuote', children=[Node('Para', children=[link_2, image])])
+    return Node('root', children=[Node('Header', level=1, children=['Title']),
+                                  Node('Para', children=['see ', link_1]),
+                                  quote,
+                                  Node('CodeBlock', lang='python', children=['1']),
+                                  Node('Header', level=2, children=['Sub']),
+                                  ])
+
+
+#-------------------------------------------------------------------------------------------------
+# Test queries
+#-------------------------------------------------------------------------------------------------
+
+def test_compile_selector():
+    assert compile_selector('Link') is compile_selector('Link')
+    for selector in ('', 'Link >', '> Link', 'Link,', 'Link Image*', 'Link[url', '[=a]'):
+        with raises(ValueError):
+            compile_selector(selector)
+
+
+def test_select(tree):
+    def urls(selector):
+        return [node.url for node in select(tree, selector)]
+
+    assert urls('Link') == ['http://a.org/x.pdf', 'b.md']
+    assert urls('Image, Link') == ['http://a.org/x.pdf', 'b.md', '{resource:a.png}']
+    assert urls('Link[url^=http]') == ['http://a.org/x.pdf']
+    assert urls('Link[url$=".pdf"]') == ['http://a.org/x.pdf']
+    assert urls("Link[url*='.']") == ['http://a.org/x.pdf', 'b.md']
+    assert urls('Link[url!=b.md]') == ['http://a.org/x.pdf']
+    assert urls('Unknown') == []
+
+    # Fields are compared as strings.
+    assert [node.children for node in select(tree, 'Header[level=2]')] == [['Sub']]
+    assert len(select(tree, 'CodeBlock[lang]')) == 1
+    assert len(select(tree, 'Header[lang]')) == 0
+    assert len(select(tree, '[level]')) == 2
+    assert len(select(tree, '*')) == 10
+
+    # Ancestry.
+    assert urls('BlockQuote Link') == ['b.md']
+    assert urls('BlockQuote > Link') == []
+    assert urls('BlockQuote > Para > *') == ['b.md', '{resource:a.png}']
+    assert urls('root > Para > Link') == ['http://a.org/x.pdf']
+    assert urls('root BlockQuote Para Image') == ['{resource:a.png}']
+
+
+def test_tree_index(tree):
+    index = TreeIndex(tree)
+    assert index.count('Header') == 2
+    assert index.count('Unknown') == 0
+
+    paths = index.select_paths('Link')
+    assert paths == [(1, 1), (2, 0, 0)]
+    assert tree.replace_at(paths[1], Node('Link', url='c.md')).children[2] \
+        .children[0].children[0].url == 'c.md'
+    assert index.select_paths('root') == [()]
+
+
+def test_rewrite(tree):
+    def _upper(node):
+        return node.replace(url=node.url.upper())
+
+    tree_1 = rewrite(tree, 'Link', _upper)
+    assert [node.url for node in select(tree_1, 'Link')] == ['HTTP://A.ORG/X.PDF', 'B.MD']
+
+    # The original tree is unchanged, and the other nodes are shared.
+    assert [node.url for node in select(tree, 'Link')] == ['http://a.org/x.pdf', 'b.md']
+    assert tree_1.children[0] is tree.children[0]
+    assert tree_1.children[2].children[0].children[1] is tree.children[2].children[0].children[1]
+    assert rewrite(tree, 'Unknown', _upper) is tree
+
+    # Nested matches: the ancestors see the new descendants.
+    tree_2 = rewrite(tree, 'Para, Link', lambda node: node.replace(seen=True))
+    para = tree_2.children[1]
+    assert para.seen and para.children[1].seen
+    assert tree_2.children[2].children[0].children[0].seen
@@ -7,12 +7,16 @@
 # Imports
 #-------------------------------------------------------------------------------------------------
 
+import gc
+import pickle
+import sys
 from textwrap import dedent
 
-from pytest import fixture
+from pytest import fixture, raises
 
 from ..utils import captured_output
-from ..tree import Node, TreeTransformer, show_tree, filter_tree
+from ..tree import (Node, PassManager, RenderCache, TreeRewriter, TreeTransformer, show_tree,
+                    filter_tree, walk, iter_nodes, diff, patch)
 
 
 #-------------------------------------------------------------------------------------------------
@@ -123,6 +127,111 @@ def test_transform_3(root):
     assert t.transform(root).children[0].name == root.children[0].name + ' visited'
 
 
+def test_transform_bottom_up(root):
+
+    class MyTreeTransformer(TreeTransformer):
+        bottom_up = True
+
+        def transform_str(self, text):
+            return text.upper()
+
+        def transform_Node(self, node):
+            return node.name + '(' + ','.join(self.transform_children(node)) + ')'
+
+    t = MyTreeTransformer()
+    assert t.transform(root) == 'root(1(1.1(1.1.1,1.1.2),1.2),2)'
+    assert t.transform('a') == 'A'
+
+    # Trees deeper than the recursion limit.
+    depth = 2 * sys.getrecursionlimit()
+    tree = Node('leaf', children=['x'])
+    for i in range(depth):
+        tree = Node(str(i % 2), children=[tree])
+    out = t.transform(tree)
+    assert out.startswith('1(0(1(') and out.endswith('leaf(X)' + ')' * depth)
+
+    # Copy and filtering.
+    tree = filter_tree(tree.copy(), lambda node: node if node.name != 'leaf' else None)
+    for i in range(depth - 1):
+        tree = tree.children[0]
+    assert tree.name == '0' and tree.children == []
+
+
+def test_transform_cursor(root):
+
+    class MyTreeTransformer(TreeTransformer):
+        def transform_Node(self, node):
+            c = self.cursor
+            self.transform_children(node)
+            # The cursor can be used before and after transforming the children.
+            assert self.cursor.node is node
+            self.positions[node.name] = (c.parent.name if c.parent else None, c.index,
+                                         c.prev, getattr(c.next, 'name', c.next), c.depth)
+
+    expected = {'root': (None, None, None, None, 0),
+                '1': ('root', 0, None, '2', 1),
+                '1.1': ('1', 0, None, '1.2', 2),
+                }
+    for bottom_up in (False, True):
+        t = MyTreeTransformer()
+        t.bottom_up = bottom_up
+        t.positions = {}
+        t.transform(root)
+        assert t.positions == expected
+        # Nothing is stored in the nodes.
+        assert root.children[0].get('_visit_meta', None) is None
+        assert t.cursor.node is None
+
+    # Ancestors.
+    class AncestorsTransformer(TreeTransformer):
+        bottom_up = True
+
+        def transform_Node(self, node):
+            if node.name == '1.1':
+                return tuple(n.name for n in self.cursor.ancestors())
+            return next(_ for _ in self.transform_children(node) if isinstance(_, tuple))
+
+    assert AncestorsTransformer().transform(root) == ('1', 'root')
+
+
+def test_transform_cached(root):
+    class Transformer(TreeTransformer):
+        bottom_up = True
+
+        def transform_Node(self, node):
+            self.n += 1
+            return '(%s)' % ','.join(self.transform_children(node))
+
+    t = Transformer()
+    t.n = 0
+    cache = RenderCache(max_size=1)
+    expected = t.transform(root)
+    # The children that are not frozen are always transformed.
+    assert t.transform_cached(root, cache) == expected
+    assert t.n == 3 + 3
+    assert (cache.hits, cache.misses) == (0, 0)
+
+    root.children[0].freeze()
+    assert t.transform_cached(root, cache) == expected
+    assert t.transform_cached(root, cache) == expected
+    # The first child was transformed once, the root every time.
+    assert t.n == 3 + 3 + 3 + 1
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    # A new version of the tree shares its unchanged frozen children.
+    new = root.replace(children=root.children + [Node('3').freeze()])
+    assert t.transform_cached(new, cache) == t.transform(new)
+    assert (cache.hits, cache.misses) == (2, 2)
+
+    # Least recently used eviction.
+    cache['a'] = 1
+    assert len(cache) == 1
+    assert 'a' in cache
+    assert cache.get('a') == 1
+    cache.clear()
+    assert cache.get('a') is None
+
+
 def test_filter(root):
     assert root == root
     assert filter_tree(root, lambda node: node) == root
@@ -140,3 +249,307 @@ def test_filter(root):
     root_without_ones = root.copy()
     root_without_ones.children.pop(0)
     assert filter_tree(root, remove_ones) == root_without_ones
+
+
+def test_filter_in_place(root):
+    copy = root.copy()
+    h = root.structural_hash()
+
+    def rename(node):
+        node.name = node.name.replace('1', 'one')
+        return node
+    assert filter_tree(root, rename, copy=False) is root
+    assert [node.name for node in walk(root)] == ['root', 'one', 'one.one']
+    assert root.structural_hash() != h
+
+    # Nodes can be replaced or removed.
+    assert filter_tree(root, lambda node: Node('new') if node.name == 'one.one' else node,
+                       copy=False).children[0].children == [Node('new'), '1.2']
+    assert filter_tree(root, lambda node: None if node.name == 'one' else node,
+                       copy=False).children == ['2']
+    assert filter_tree(copy, lambda node: None, copy=False) is None
+
+
+def test_walk(root):
+    assert [node.name for node in walk(root)] == ['root', '1', '1.1']
+    assert list(walk(root, strings=True))[3:] == ['1.1.1', '1.1.2', '1.2', '2']
+    assert list(walk('text')) == ['text']
+
+    # Pruning.
+    assert [node.name for node in walk(root, prune=lambda node: node.name == '1')] == \
+        ['root', '1']
+    assert list(walk(root, prune=lambda node: node.name == '1.1', strings=True))[3:] == \
+        ['1.2', '2']
+
+    # Early exit.
+    it = walk(root)
+    assert next(it) is root
+    assert next(it) is root.children[0]
+
+    assert [node.name for node in iter_nodes(root)] == ['root', '1', '1.1']
+    assert [node.name for node in iter_nodes(root, '1.1', 'root')] == ['root', '1.1']
+    assert list(iter_nodes(root, 'unknown')) == []
+
+
+def test_node_fields(root):
+    # Attribute and dictionary syntax.
+    assert root.hello == root['hello'] == root.get('hello') == 'world'
+    assert 'hello' in root
+    assert root.get('unknown', 0) == 0
+    with raises(AttributeError):
+        root.unknown
+    with raises(KeyError):
+        root['unknown']
+    root['unknown'] = 1
+    assert root.unknown == 1
+    assert root.keys() == ['name', 'children', 'hello', 'unknown']
+    assert not hasattr(root, '__dict__')
+
+    # The visit metadata is created when needed, and it is not a field.
+    assert root.get('_visit_meta', None) is None
+    root._visit_meta['x'] = 1
+    assert root.get('_visit_meta') == {'x': 1}
+    assert '_visit_meta' not in root.keys()
+    assert root == root.copy()
+    assert not root.copy()._visit_meta
+
+    # Pickling.
+    assert pickle.loads(pickle.dumps(root)) == root
+
+
+def test_persistent_updates(root):
+    original = root.copy()
+
+    root_1 = root.replace(hello='you')
+    assert root_1.hello == 'you'
+    assert root_1.children == root.children
+    assert root_1.children is not root.children
+
+    root_2 = root.replace_child(1, '3')
+    assert root_2.children == [root.children[0], '3']
+    assert root_2.children[0] is root.children[0]
+
+    root_3 = root.replace_at((0, 0, 1), 'new')
+    assert root_3.children[0].children[0].children == ['1.1.1', 'new']
+    assert root_3.children[0].children[1] is root.children[0].children[1]
+    assert root_3.children[1] is root.children[1]
+
+    # The original tree is unchanged.
+    assert root == original
+
+
+def test_tree_rewriter(root):
+    class MyTreeRewriter(TreeRewriter):
+        def transform_str(self, text):
+            return text + '!' if text == '1.2' else text
+
+    root_1 = MyTreeRewriter().transform(root)
+    assert root_1.children[0].children[1] == '1.2!'
+    assert root.children[0].children[1] == '1.2'
+    # The unchanged subtrees are shared.
+    assert root_1.children[0].children[0] is root.children[0].children[0]
+    assert root_1 is not root
+
+    assert TreeRewriter().transform(root) is root
+
+
+def test_pass_manager(root):
+    calls = []
+
+    class Rename(TreeRewriter):
+        node_local = True
+
+        def transform_Node(self, node):
+            calls.append(node.name)
+            return self.rebuild(node).replace(name=node.name.replace('.', '_'))
+
+    class Split(TreeRewriter):
+        node_local = True
+
+        def transform_1_1(self, node):
+            # The node has been renamed by the previous pass.
+            return [node.replace(name='a'), 'text', node.replace(name='b')]
+
+    class Upper(TreeRewriter):
+        node_local = True
+
+        def transform_Node(self, node):
+            return self.rebuild(node).replace(name=node.name.upper())
+
+        def transform_root(self, node):
+            return self.rebuild(node)
+
+    def double(tree, context=None):
+        return tree.replace(children=tree.children * 2)
+
+    passes = [Rename(), Split(), Upper(), double, Upper()]
+    expected = root
+    for p in passes:
+        expected = p(expected) if p is double else p.transform(expected)
+    calls[:] = []
+
+    pm = PassManager(passes)
+    assert [len(stage) if isinstance(stage, list) else stage
+            for stage in pm.iter_stages()] == [3, double, 1]
+    out = pm.transform(root)
+    assert out == expected
+    assert [getattr(child, 'name', child) for child in out.children[0].children] == \
+        ['A', 'text', 'B', '1.2']
+    # The first pass has been applied once to every node, in a single traversal.
+    assert calls == ['1.1', '1', 'root']
+
+    # The passes without transformation methods are skipped, and unchanged
+    # subtrees are shared.
+    class Nothing(TreeRewriter):
+        node_local = True
+
+    assert PassManager([Nothing(), Nothing()]).transform(root) is root
+    assert (PassManager([Nothing()]) + PassManager([double]))(root).children[0] is \
+        root.children[0]
+    assert len(PassManager([Nothing()]) + PassManager([double])) == 2
+
+
+def test_node_equality():
+    # Trees deeper than the recursion limit.
+    def _deep_tree(leaf):
+        tree = Node('leaf', children=[leaf])
+        for i in range(2 * sys.getrecursionlimit()):
+            tree = Node('node', children=['a', tree], level=i)
+        return tree
+
+    tree = _deep_tree('x')
+    assert tree == _deep_tree('x')
+    assert tree != _deep_tree('y')
+    assert tree.structural_hash() == _deep_tree('x').structural_hash()
+    assert tree.structural_hash() != _deep_tree('y').structural_hash()
+
+    # Fields.
+    assert Node('a', x=1, y=2) == Node('a', y=2, x=1)
+    assert Node('a', x=1) != Node('a', x=2)
+    assert Node('a', x=1) != Node('a')
+    node = Node('a', x=1)
+    del node.x
+    assert node == Node('a')
+    assert Node('a', children=['b']) != Node('a', children=[Node('b')])
+
+
+def test_structural_hash(root):
+    h = root.structural_hash()
+    assert root.copy().structural_hash() == h
+    # The hash is stable.
+    assert h == '85d45cecbb25c7ef55d0ab44cba1b7e6'
+
+    assert Node('a', x=1, y=2).structural_hash() == Node('a', y=2, x=1).structural_hash()
+    assert Node('a', x=1).structural_hash() != Node('a', x='1').structural_hash()
+    assert (Node('a', children=['ab', 'c']).structural_hash() !=
+            Node('a', children=['a', 'bc']).structural_hash())
+
+    # The visit metadata is ignored.
+    root._visit_meta['x'] = 1
+    assert root.structural_hash() == h
+
+    # The trees can be modified in place after they have been hashed.
+    assert not root.frozen
+    root.x = 1
+    assert root.structural_hash() != h
+    del root.x
+    assert root.structural_hash() == h
+    root.children[0].children[0].level = 2
+    assert root.structural_hash() != h
+    del root.children[0].children[0].level
+    root.children[0].add_child('x')
+    assert root.structural_hash() != h
+    root.children[0].children.pop()
+    assert root.structural_hash() == h
+
+
+def test_freeze(root):
+    h = root.structural_hash()
+    assert root.freeze() is root
+    assert root.frozen and root.children[0].children[0].frozen
+    assert root.structural_hash() == h
+
+    # The frozen nodes are read-only.
+    with raises(AttributeError):
+        root.x = 1
+    with raises(AttributeError):
+        del root.hello
+    with raises(AttributeError):
+        root.children[0].add_child('x')
+    root._visit_meta['x'] = 1
+    root.source_span = (0, 1)
+
+    # The copies and the persistent updates are not frozen, and share the digests of
+    # the unchanged frozen subtrees.
+    assert not root.copy().frozen
+    new = root.replace_child(1, 'y')
+    assert not new.frozen and new.children[0] is root.children[0]
+    assert new.structural_hash() != h
+    new.x = 1
+
+
+def test_diff_patch(root):
+    assert diff(root, root.copy()) == []
+
+    # Replace, insert, and delete blocks.
+    new = root.replace_child(0, Node('x', children=['y']))
+    new = new.replace(children=new.children[:1] + [Node('z')] + new.children[1:])
+    edits = diff(root, new)
+    assert [(e.op, e.start, e.end) for e in edits] == [('replace', 0, 1)]
+    assert len(edits[0].new) == 2
+    patched = patch(root, edits)
+    assert patched == new
+    assert patched.children[-1] is root.children[-1]
+    assert root == root.copy()
+
+    edits = diff(new, root)
+    assert patch(new, edits) == root
+
+    # Trees modified in place after they have been compared.
+    old = root.copy()
+    assert diff(old, root) == []
+    root.children[0].children[0].level = 2
+    assert [(e.op, e.start, e.end) for e in diff(old, root)] == [('replace', 0, 1)]
+    old = root.copy()
+    assert diff(old, root) == []
+    root.children[0].add_child('x')
+    assert [(e.op, e.start, e.end) for e in diff(old, root)] == [('replace', 0, 1)]
+
+    # The edits are located between identical blocks.
+    old = Node('root', children=[Node('p', children=['a']) for _ in range(10)])
+    new = old.replace_child(5, Node('p', children=['b']))
+    assert [(e.op, e.start, e.end) for e in diff(old, new)] == [('replace', 5, 6)]
+
+    # Root fields.
+    new = root.replace(x=1)
+    edits = diff(root, new)
+    assert [e.op for e in edits] == ['fields']
+    assert patch(root, edits) == new
+    assert patch(new, diff(new, root)) == root
+
+
+def test_source_span(root):
+    assert root.source_span is None
+    root.source_span = (0, 10)
+    h = root.structural_hash()
+    assert root.source_span == (0, 10)
+    assert root.copy().source_span == (0, 10)
+    assert root.replace(x=1).source_span == (0, 10)
+    # The source spans are not fields.
+    assert root == Node('root', hello='world', children=root.children)
+    assert root.structural_hash() == h
+    assert 'source_span' not in root
+
+
+def test_node_no_cycle():
+    # The nodes are freed without the cyclic garbage collector.
+    gc.collect()
+    gc.disable()
+    try:
+        node = Node('root', children=[Node('1', children=['a'])])
+        node.children[0]._visit_meta['is_block'] = True
+        node.copy()
+        del node
+        assert gc.collect() == 0
+    finally:
+        gc.enable()
@@ -10,13 +10,18 @@
 import json
 import logging
 import os.path as op
+import sys
+from threading import Event, Timer
+import time
 
-from pytest import mark
+from pytest import mark, raises
 
 from ..utils import (Bunch, Path, load_text, dump_text, _get_file, _merge_str, _shorten_string,
+                     _remove_ansi,
                      _get_resources_path, _save_resources, _load_resources,
                      get_test_file_path, _create_dir_if_not_exists,
                      pandoc, has_pandoc, get_pandoc_formats,
+                     run_process, process_options, ConversionTimeout, ConversionCancelled,
                      )
 
 logger = logging.getLogger(__name__)
@@ -54,6 +59,10 @@ def test_shorten_string():
     assert '(...)' in s
 
 
+def test_remove_ansi():
+    assert _remove_ansi('\x1b[0;31mError\x1b[0m: a') == 'Error: a'
+
+
 def test_create_dir_if_not_exists(tempdir):
     assert not _create_dir_if_not_exists(tempdir)
     assert _create_dir_if_not_exists(op.join(tempdir, 'test'))
@@ -109,3 +118,63 @@ def test_pandoc():
     sl, tl = get_pandoc_formats()
     assert 'markdown' in sl
     assert 'markdown' in tl
+
+
+#-------------------------------------------------------------------------------------------------
+# Test external processes
+#-------------------------------------------------------------------------------------------------
+
+def _python(code):
+    return [sys.executable, '-c', code]
+
+
+def test_run_process():
+    assert run_process(_python('print(input())'), input=b'hello').strip() == b'hello'
+    with raises(Exception):
+        run_process(_python('import sys; sys.exit(1)'))
+    run_process(_python('import sys; sys.exit(1)'), check=False)
+
+
+def test_run_process_timeout():
+    t0 = time.monotonic()
+    with raises(ConversionTimeout) as e:
+        run_process(_python('import time; time.sleep(10)'), timeout=.5)
+    assert time.monotonic() - t0 < 5
+    assert e.value.timeout == .5
+    assert e.value.cmd[0] == sys.executable
+
+
+def test_run_process_cancel():
+    cancel = Event()
+    Timer(.2, cancel.set).start()
+    t0 = time.monotonic()
+    with raises(ConversionCancelled):
+        run_process(_python('import time; time.sleep(10)'), cancel=cancel)
+    assert time.monotonic() - t0 < 5
+
+
+@mark.skipif(sys.platform == 'win32', reason='resource limits are only supported on Unix')
+def test_run_process_limits():
+    # Allocating 1 GB fails with a 256 MB memory limit.
+    code = 'b = bytearray(1 << 30)'
+    run_process(_python(code))
+    with raises(Exception):
+        run_process(_python(code), limits={'memory': 256 << 20})
+    with raises(ValueError):
+        run_process(_python(code), limits={'unknown': 1})
+
+
+def test_process_options():
+    assert process_options(None) == dict(timeout=None, cancel=None, limits=None)
+    assert 0 < process_options({'deadline': time.monotonic() + 10})['timeout'] <= 10
+    with raises(ConversionTimeout):
+        process_options({'deadline': time.monotonic() - 1})
+    cancel = Event()
+    cancel.set()
+    with raises(ConversionCancelled):
+        process_options({'cancel': cancel})
+
+
+def test_pandoc_timeout():
+    with raises(ConversionTimeout):
+        pandoc('hello *world*', 'json', format='markdown', timeout=1e-6)
@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+
+"""Plain text plugin.
+
+The text extraction keeps only the human text of a document: markup, URLs and raw
+blocks are dropped, and the blocks are separated by blank lines. It works on the
+podoc AST, on pandoc JSON documents, and directly on notebooks.
+
+"""
+
+
+#-------------------------------------------------------------------------------------------------
+# Imports
+#-------------------------------------------------------------------------------------------------
+
+import logging
+
+from podoc.ast import ASTNode
+from podoc.markdown.parser import MarkdownParser
+from podoc.plugin import IPlugin
+from podoc.utils import Bunch, _remove_ansi
+
+logger = logging.getLogger(__name__)
+
+
+#-------------------------------------------------------------------------------------------------
+# Block iterators
+#-------------------------------------------------------------------------------------------------
+
+# Each block iterator yields `(kind, arg, text)` tuples, where `kind` is `Header`
+# (`arg` is the level), `CodeBlock` (`arg` is the language), or `Para`.
+
+_SKIPPED_NAMES = ('RawBlock', 'RawInline')
+_LEAF_BLOCK_NAMES = ('Para', 'Plain', 'Header', 'CodeBlock')
+
+
+def _inline_text(node):
+    """Return the text of a podoc AST node."""
+    children = node.children
+    # Fast path for the blocks with a single string, like code blocks.
+    if len(children) == 1 and isinstance(children[0], str):
+        return children[0]
+    out = []
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, str):
+            out.append(node)
+            continue
+        name = node.name
+        if name == 'LineBreak':
+            out.append('\n')
+        elif name not in _SKIPPED_NAMES:
+            stack.extend(reversed(node.children))
+    return ''.join(out)
+
+
+def iter_ast_blocks(ast):
+    """Iterate over the leaf blocks of a podoc AST."""
+    stack = [ast]
+    while stack:
+        node = stack.pop()
+        name = node.name
+        if name in _LEAF_BLOCK_NAMES:
+            arg = (node.level if name == 'Header' else
+                   node.get('lang', None) if name == 'CodeBlock' else None)
+            yield (name if name != 'Plain' else 'Para'), arg, _inline_text(node)
+        elif name not in _SKIPPED_NAMES:
+            stack.extend(reversed([child for child in node.children
+                                   if not isinstance(child, str)]))
+
+
+def _pandoc_inline_text(inlines):
+    """Return the text of a list of pandoc JSON inline elements."""
+    out = []
+    stack = list(reversed(inlines))
+    while stack:
+        d = stack.pop()
+        if isinstance(d, list):
+            stack.extend(reversed(d))
+            continue
+        if not isinstance(d, dict):
+            continue
+        t, c = d.get('t', None), d.get('c', None)
+        if t == 'Str':
+            out.append(c)
+        elif t == 'Space':
+            out.append(' ')
+        elif t in ('SoftBreak', 'LineBreak'):
+            out.append('\n')
+        elif t in ('Code', 'Math'):
+            out.append(c[1])
+        elif t in ('Link', 'Image', 'Quoted', 'Cite', 'Span'):
+            stack.append(c[1])
+        elif t not in _SKIPPED_NAMES and isinstance(c, list):
+            # NOTE: element attributes are lists of strings, which are skipped.
+            stack.append(c)
+    return ''.join(out)
+
+
+def iter_pandoc_blocks(d):
+    """Iterate over the leaf blocks of a pandoc JSON document, without creating the
+    podoc AST."""
+    stack = list(reversed(d['blocks'] if isinstance(d, dict) else d))
+    while stack:
+        d = stack.pop()
+        if isinstance(d, list):
+            stack.extend(reversed(d))
+            continue
+        if not isinstance(d, dict):
+            continue
+        t, c = d.get('t', None), d.get('c', None)
+        if t in ('Para', 'Plain'):
+            yield 'Para', None, _pandoc_inline_text(c)
+        elif t == 'Header':
+            yield 'Header', c[0], _pandoc_inline_text(c[2])
+        elif t == 'CodeBlock':
+            classes = c[0][1]
+            yield 'CodeBlock', classes[0] if classes else '', c[1]
+        elif t not in _SKIPPED_NAMES and isinstance(c, list):
+            # NOTE: the attributes and list styles do not contain blocks.
+            stack.append(c)
+
+
+_IMAGE_MIME_TYPES = ('image/png', 'image/jpeg', 'image/svg+xml')
+
+
+def iter_notebook_blocks(notebook):
+    """Iterate over the leaf blocks of a notebook, with the same conventions as the
+    notebook reader.
+
+    The Markdown cells are parsed with the native Markdown parser.
+
+    """
+    language = notebook.metadata.get('language_info', {}).get('name', 'python')
+    for cell in notebook.cells:
+        if cell.cell_type == 'markdown':
+            yield from iter_ast_blocks(MarkdownParser().parse(cell.source))
+            continue
+        elif cell.cell_type != 'code':
+            continue
+        yield 'CodeBlock', language, cell.source.rstrip()
+        for output in cell.get('outputs', []):
+            if output.output_type == 'stream':
+                yield ('CodeBlock', '{output:%s}' % output.name,
+                       _remove_ansi(output.text.rstrip()))
+            elif output.output_type == 'error':
+                yield ('CodeBlock', '{output:error}',
+                       _remove_ansi('\n'.join(output.traceback)))
+            elif output.output_type in ('display_data', 'execute_result'):
+                text = cell.metadata.get('podoc', {}).get('output_text', None)
+                text = _remove_ansi(text or output.data.get('text/plain', 'Output'))
+                if any(mime_type in output.data for mime_type in _IMAGE_MIME_TYPES):
+                    # The text of an image output is its legend.
+                    yield 'Para', None, text if '\n' not in text else 'Output'
+                else:
+                    yield 'CodeBlock', '{output:result}', text
+
+
+def _iter_blocks(obj):
+    if isinstance(obj, ASTNode):
+        return iter_ast_blocks(obj)
+    elif isinstance(obj, dict) and 'cells' in obj:
+        return iter_notebook_blocks(obj)
+    elif isinstance(obj, (dict, list)):
+        return iter_pandoc_blocks(obj)
+    raise ValueError("Unsupported document type `%s`." % type(obj))
+
+
+#-------------------------------------------------------------------------------------------------
+# Text extraction
+#-------------------------------------------------------------------------------------------------
+
+def iter_text(blocks):
+    """Yield the text of the blocks, separated by blank lines."""
+    first = True
+    for _, _, text in blocks:
+        if not text:
+            continue
+        if not first:
+            yield '\n\n'
+        first = False
+        yield text
+
+
+def iter_fields(blocks):
+    """Yield the text of the blocks grouped by section and kind.
+
+    Every record has the following fields:
+
+    * `headers`: tuple with the titles of the section and its parent sections
+    * `kind`: `text`, `code`, or `output`
+    * `text`: the text of the consecutive blocks of this kind within the section
+
+    """
+    headers = ()
+    record = None
+    for name, arg, text in blocks:
+        if name == 'Header':
+            headers = headers[:arg - 1] + ('',) * (arg - 1 - len(headers)) + (text,)
+            continue
+        if not text:
+            continue
+        if name == 'CodeBlock':
+            kind = 'output' if (arg or '').startswith('{output') else 'code'
+        else:
+            kind = 'text'
+        if record and record.headers == headers and record.kind == kind:
+            record.text += '\n\n' + text
+            continue
+        if record:
+            yield record
+        record = Bunch(headers=headers, kind=kind, text=text)
+    if record:
+        yield record
+
+
+def extract_text(doc, fields=False, sink=None):
+    """Extract the text of a document.
+
+    Parameters
+    ----------
+
+    doc : ASTNode, notebook, or dict
+        The document: a podoc AST, a notebook, or a pandoc JSON document.
+    fields : bool (False)
+        Whether to return records with the header path of each block, and the code and
+        outputs separated from the text (see `iter_fields()`).
+    sink : file-like or callable (None)
+        If set, the text chunks (or the records) are sent to `sink.write()` (or
+        `sink()`) as they are extracted, and nothing is returned.
+
+    """
+    blocks = _iter_blocks(doc)
+    out = iter_fields(blocks) if fields else iter_text(blocks)
+    if sink is None:
+        return list(out) if fields else ''.join(out)
+    write = getattr(sink, 'write', sink)
+    for item in out:
+        write(item)
+
+
+#-------------------------------------------------------------------------------------------------
+# Text plugin
+#-------------------------------------------------------------------------------------------------
+
+class TextPlugin(IPlugin):
+    def attach(self, podoc):
+        podoc.register_lang('text', file_ext='.txt')
+        podoc.register_func(source='ast', target='text', func=self.write)
+        podoc.register_func(source='notebook', target='text', func=self.write)
+
+    def write(self, doc, context=None):
+        return extract_text(doc)
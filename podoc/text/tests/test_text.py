@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+
+"""Test plain text plugin."""
+
+
+#-------------------------------------------------------------------------------------------------
+# Imports
+#-------------------------------------------------------------------------------------------------
+
+from io import StringIO
+import json
+
+from pytest import raises
+
+from podoc.core import Podoc
+from podoc.markdown.parser import MarkdownParser
+from podoc.utils import get_test_file_path, load_text
+from .._text import extract_text
+
+
+#-------------------------------------------------------------------------------------------------
+# Test text extraction
+#-------------------------------------------------------------------------------------------------
+
+def test_extract_text():
+    ast = MarkdownParser().parse('# Title\n\nhello *world* [link](http://x.org) '
+                                 '$x$\nand ![image](a.png)\n\n'
+                                 '* a\n* b\n\n'
+                                 '\\begin{align*}\nx\n\\end{align*}\n\n'
+                                 '```python\na = 1\n```')
+    assert extract_text(ast) == 'Title\n\nhello world link x\nand image\n\na\n\nb\n\na = 1'
+
+    with raises(ValueError):
+        extract_text('hello')
+
+
+def test_extract_fields():
+    ast = MarkdownParser().parse('a\n\n# A\n\nb\n\nc\n\n```python\nd\n```\n\n'
+                                 '```{output:stdout}\ne\n```\n\n### C\n\nf\n\n## B\n\ng')
+    records = extract_text(ast, fields=True)
+    assert [(r.headers, r.kind, r.text) for r in records] == [
+        ((), 'text', 'a'),
+        (('A',), 'text', 'b\n\nc'),
+        (('A',), 'code', 'd'),
+        (('A',), 'output', 'e'),
+        (('A', '', 'C'), 'text', 'f'),
+        (('A', 'B'), 'text', 'g'),
+    ]
+
+
+def test_extract_sink():
+    ast = MarkdownParser().parse('# A\n\nb')
+    f = StringIO()
+    extract_text(ast, sink=f)
+    assert f.getvalue() == 'A\n\nb'
+
+    records = []
+    extract_text(ast, fields=True, sink=records.append)
+    assert records[0].headers == ('A',)
+
+
+def test_extract_pandoc_notebook():
+    podoc = Podoc(with_pandoc=False)
+    for name in ('hello', 'simplenb'):
+        expected = load_text(get_test_file_path('text', name + '.txt'))
+        # pandoc JSON.
+        d = json.loads(load_text(get_test_file_path('ast', name + '.json')))
+        assert extract_text(d) == expected
+        # Notebook.
+        nb = podoc.load(get_test_file_path('notebook', name + '.ipynb'))
+        assert extract_text(nb) == expected
+
+
+def test_text_plugin():
+    podoc = Podoc(with_pandoc=False)
+    path = get_test_file_path('notebook', 'simplenb.ipynb')
+    _, context = podoc.convert_file(path, target='text', return_context=True)
+    assert context.lang_chain == ['notebook', 'text']
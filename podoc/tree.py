@@ -7,10 +7,14 @@
 # Imports
 #-------------------------------------------------------------------------------------------------
 
-from itertools import zip_longest
+from collections import OrderedDict, namedtuple
+from difflib import SequenceMatcher
+import hashlib
+import json
 import logging
+from operator import is_
 
-from .utils import Bunch, _shorten_string
+from .utils import _shorten_string
 
 logger = logging.getLogger(__name__)
 
@@ -19,14 +23,107 @@ logger = logging.getLogger(__name__)
 # Tree transformer
 #-------------------------------------------------------------------------------------------------
 
+class Cursor(object):
+    """Position of the node being transformed by a tree transformer.
+
+    The parent, the index, and the siblings of the node are found on demand from the
+    traversal stack of the transformer, so that nothing is stored in the nodes. A cursor
+    is only valid during the call of the transformation method that created it.
+
+    """
+
+    __slots__ = ('node', '_transformer', '_depth')
+
+    def __init__(self, transformer):
+        self._transformer = transformer
+        self.node = transformer._node
+        self._depth = len(transformer._frames or ())
+
+    def _iter_path(self):
+        """Yield `(parent, children, index)` from the node's parent to the root."""
+        transformer = self._transformer
+        frames = transformer._frames
+        node = self.node
+        for k in range(self._depth - 1, -1, -1):
+            parent, _, outputs = frames[k]
+            children = transformer.get_node_children(parent)
+            # NOTE: the frame's outputs contain the previous children of the node.
+            i = len(outputs)
+            # The path stops at nodes that were not transformed by their parent.
+            if i >= len(children) or children[i] is not node:
+                return
+            yield parent, children, i
+            node = parent
+
+    def _position(self):
+        return next(self._iter_path(), (None, None, None))
+
+    @property
+    def parent(self):
+        """Parent of the node, or None for the root."""
+        return self._position()[0]
+
+    @property
+    def index(self):
+        """Index of the node in its parent's children, or None for the root."""
+        return self._position()[2]
+
+    @property
+    def prev(self):
+        """Previous sibling of the node, or None."""
+        _, children, i = self._position()
+        return children[i - 1] if children and i > 0 else None
+
+    @property
+    def next(self):
+        """Next sibling of the node, or None."""
+        _, children, i = self._position()
+        return children[i + 1] if children and i + 1 < len(children) else None
+
+    def ancestors(self):
+        """Return the ancestors of the node, from its parent to the root."""
+        return [parent for parent, _, _ in self._iter_path()]
+
+    @property
+    def depth(self):
+        return len(self.ancestors())
+
+
 class TreeTransformer(object):
     """Transform any kind of tree.
 
     By default, this object acts on Node instances. However, derived
     classes can act on other types of trees, for example nested dictionaries.
 
+    The transformation method of a node is `transform_<name>()`, or `transform_Node()`
+    if there is none. These methods are looked up once per class, in a dispatch table.
+
+    When the `bottom_up` class attribute is set, the transformations of the children
+    of a node are computed before the node's transformation method is called, which
+    gets them from `transform_children()`. The tree is then traversed with an explicit
+    stack instead of recursive calls, so that trees of any depth can be transformed.
+    This requires the transformation methods not to depend on any state set by their
+    parents, and to only transform their own children, before modifying them.
+
+    The transformation methods can get the parent and the siblings of the node from the
+    `cursor` attribute.
+
     """
 
+    # Whether to use the iterative post-order traversal.
+    bottom_up = False
+
+    # Node whose children have already been transformed, with the transformed
+    # children (the strings are transformed when needed).
+    _transformed = None
+
+    # Traversal stack: `(node, children, outputs)` for the ancestors of the node being
+    # transformed, where `outputs` are the transformed children visited so far.
+    _frames = None
+
+    # Node being transformed.
+    _node = None
+
     # To override
     # --------------------------------------------------------------------------------------------
 
@@ -46,29 +143,46 @@ class TreeTransformer(object):
         """
         return node.children
 
-    def set_next_child(self, child, next_child):
-        """To be overriden. Set the next and previous children."""
-        if child is not None and not isinstance(child, str):
-            child._visit_meta['nxt'] = next_child
-        if next_child is not None and not isinstance(next_child, str):
-            next_child._visit_meta['prv'] = child
+    @property
+    def cursor(self):
+        """Position of the node being transformed (see `Cursor`)."""
+        return Cursor(self)
 
     # Transformation methods
     # --------------------------------------------------------------------------------------------
 
     def transform_children(self, node):
-        out = []
         children = self.get_node_children(node)
-        for child, next_child in zip_longest(children, children[1:]):
-            # Double-linked list for children.
-            self.set_next_child(child, next_child)
-            transformed_children = self.transform(child)
-            if isinstance(transformed_children, list):
-                out.extend(transformed_children)
+        transformed = self._transformed
+        if transformed is not None and transformed[0] is node:
+            # The children have already been transformed by the iterative traversal,
+            # except the strings.
+            outputs = transformed[1]
+            if type(self).transform_str is not TreeTransformer.transform_str:
+                transform_str = self.transform_str
+                outputs = [transform_str(child) if isinstance(child, str) else output
+                           for child, output in zip(children, outputs)]
+        else:
+            frames = self._frames
+            if frames is None:
+                frames = self._frames = []
+            outputs = []
+            frames.append((node, None, outputs))
+            try:
+                for child in children:
+                    outputs.append(self.transform(child))
+            finally:
+                frames.pop()
+        out = []
+        for output in outputs:
+            if output is None:
+                continue
+            elif isinstance(output, list):
+                # Remove None children.
+                out.extend([_ for _ in output if _ is not None])
             else:
-                out.append(transformed_children)
-        # Remove None children.
-        return [_ for _ in out if _ is not None]
+                out.append(output)
+        return out
 
     def transform_str(self, contents):
         return contents
@@ -76,42 +190,284 @@ class TreeTransformer(object):
     def transform_Node(self, node):
         return node  # pragma: no cover
 
+    @classmethod
+    def _dispatch_table(cls):
+        """Return the transformation functions of the class, by node name."""
+        table = cls.__dict__.get('_dispatch', None)
+        if table is None:
+            table = {name[len('transform_'):]: getattr(cls, name)
+                     for name in dir(cls) if name.startswith('transform_')}
+            cls._dispatch = table
+        return table
+
     def get_transform_func(self, node):
         assert node is not None
         name = ('str' if isinstance(node, str)
                 else self.get_node_name(node))
-        return getattr(self, 'transform_' + name, self.transform_Node)
+        func = self._dispatch_table().get(name, None)
+        return func.__get__(self) if func is not None else self.transform_Node
+
+    def _transform_bottom_up(self, root):
+        table = self._dispatch_table()
+        default = table['Node']
+        get_name = self.get_node_name
+        get_children = self.get_node_children
+        saved = self._transformed, self._node
+        # The frames of the ancestors of the current node are pushed on the traversal
+        # stack: `(node, children, outputs)` where `children` iterates over the children
+        # that have not been visited yet, and `outputs` contains the visited strings
+        # and the transformed nodes.
+        frames = self._frames
+        if frames is None:
+            frames = self._frames = []
+        base = len(frames)
+        node, children, outputs = root, iter(get_children(root) or ()), []
+        try:
+            while True:
+                for child in children:
+                    if isinstance(child, str):
+                        outputs.append(child)
+                        continue
+                    frames.append((node, children, outputs))
+                    node, children, outputs = child, iter(get_children(child) or ()), []
+                    break
+                else:
+                    # All children of the node have been transformed.
+                    self._transformed = (node, outputs)
+                    self._node = node
+                    out = table.get(get_name(node), default)(self, node)
+                    if len(frames) == base:
+                        break
+                    node, children, outputs = frames.pop()
+                    outputs.append(out)
+        finally:
+            del frames[base:]
+            self._transformed, self._node = saved
+        return out
 
     def transform(self, node):
         """Transform a node and the tree below it."""
-        return self.get_transform_func(node)(node)
+        if self.bottom_up and not isinstance(node, str):
+            return self._transform_bottom_up(node)
+        saved = self._node
+        self._node = node
+        out = self.get_transform_func(node)(node)
+        self._node = saved
+        return out
+
+    def transform_cached(self, node, cache):
+        """Transform a Node tree, taking the transformations of the unchanged children
+        of the root from a `RenderCache`.
+
+        The transformation of a child must only depend on the subtree of the child, and
+        not on the state of the transformer. Only the frozen children are looked up, with
+        their cached digests (see `Node.freeze()`), since hashing the other children at
+        every call would cost more than transforming them. The frozen children are meant
+        to be shared between the versions of a document, for example by the parse cache
+        of the Markdown plugin, so that only the new children are transformed.
+
+        """
+        cls = type(self)
+        frames = self._frames
+        if frames is None:
+            frames = self._frames = []
+        outputs = []
+        frames.append((node, None, outputs))
+        try:
+            for child in self.get_node_children(node):
+                if isinstance(child, str):
+                    outputs.append(child)
+                    continue
+                digest = child._digest
+                if digest is None:
+                    outputs.append(self.transform(child))
+                    continue
+                key = (cls, digest)
+                out = cache.get(key, _MISSING)
+                if out is _MISSING:
+                    out = cache[key] = self.transform(child)
+                outputs.append(out)
+        finally:
+            frames.pop()
+        saved = self._transformed, self._node
+        self._transformed, self._node = (node, outputs), node
+        try:
+            return self.get_transform_func(node)(node)
+        finally:
+            self._transformed, self._node = saved
 
 
 #-------------------------------------------------------------------------------------------------
 # Node
 #-------------------------------------------------------------------------------------------------
 
-def _remove_visit_meta(node):
-    if '_visit_meta' in node:
-        node._visit_meta = {}
-    return node
+class Node(object):
+    """Generic node type, represents a tree.
+
+    The nodes support both the attribute and the dictionary syntax for their fields:
+    `name`, `children`, and any keyword argument passed to the constructor.
+
+    The nodes use `__slots__` and do not create any reference cycle, so that large
+    trees are cheap and freed as soon as they are not used. The fields listed in
+    the `_fields` class attribute have their own slot, the other ones are stored in
+    a dictionary created when needed. The `_visit_meta` dictionary, used to annotate
+    the nodes during conversions, is not a field and is also created when needed.
+    The `source_span` of a node, set by some readers, is not a field either.
+
+    The trees can be updated in place, or in a persistent way with `replace()`,
+    `replace_child()` and `replace_at()`, which return new nodes sharing all unchanged
+    subtrees with the original tree (see also `TreeRewriter`).
+
+    Two trees are equal when they have the same structure and fields, which is checked
+    by walking both trees at once. `structural_hash()` returns a hash of the tree that
+    is stable across processes. A tree can be frozen with `freeze()`: the digest of
+    every subtree is then cached in its root node, and the frozen nodes cannot be
+    modified anymore, except with the persistent updates, which return nodes that are
+    not frozen. Hashing a tree whose unchanged subtrees are frozen only hashes the
+    new nodes.
+
+    """
+
+    __slots__ = ('name', 'children', '_attrs', '_meta', '_set', '_digest', '_span')
+
+    # Fields with their own slot, defined by the subclasses.
+    _fields = ()
 
+    # Bit of each field with its own slot in the `_set` bitmask of the fields that are set.
+    _field_bits = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._field_bits = {key: 1 << i for i, key in enumerate(cls._fields)}
 
-class Node(Bunch):
-    """Generic node type, represents a tree."""
     def __init__(self, name='Node', children=None, **kwargs):
-        super(Node, self).__init__(**kwargs)
-        self._visit_meta = {}
         # Empty names are forbidden.
         assert name
         assert isinstance(name, str)
-        self.name = name
-        self.children = children or []
+        object.__setattr__(self, 'name', name)
+        object.__setattr__(self, 'children', children or [])
+        object.__setattr__(self, '_attrs', None)
+        object.__setattr__(self, '_meta', None)
+        object.__setattr__(self, '_set', 0)
+        object.__setattr__(self, '_digest', None)
+        object.__setattr__(self, '_span', None)
         assert isinstance(self.children, list)
+        kwargs.pop('_visit_meta', None)
+        for key, value in kwargs.items():
+            setattr(self, key, value)
+
+    # Fields
+    # --------------------------------------------------------------------------------------------
+
+    def __getattr__(self, key):
+        # NOTE: only called when there is no slot or the slot is not set.
+        attrs = object.__getattribute__(self, '_attrs') if key != '_attrs' else None
+        if attrs and key in attrs:
+            return attrs[key]
+        raise AttributeError(key)
+
+    def __setattr__(self, key, value):
+        if key == '_visit_meta':
+            object.__setattr__(self, '_meta', value)
+            return
+        elif key == 'source_span':
+            object.__setattr__(self, '_span', value)
+            return
+        self._check_frozen()
+        try:
+            object.__setattr__(self, key, value)
+        except AttributeError:
+            if self._attrs is None:
+                object.__setattr__(self, '_attrs', {})
+            self._attrs[key] = value
+            return
+        bit = self._field_bits.get(key, 0)
+        if bit:
+            object.__setattr__(self, '_set', self._set | bit)
+
+    def __delattr__(self, key):
+        self._check_frozen()
+        if key in self._field_bits:
+            object.__delattr__(self, key)
+            object.__setattr__(self, '_set', self._set & ~self._field_bits[key])
+        elif self._attrs and key in self._attrs:
+            del self._attrs[key]
+        else:
+            object.__delattr__(self, key)
+
+    @property
+    def _visit_meta(self):
+        if self._meta is None:
+            object.__setattr__(self, '_meta', {})
+        return self._meta
+
+    @property
+    def source_span(self):
+        """Position of the node in the source of the document, as a `(start, end)`
+        tuple, or None.
+
+        The positions are character offsets in the source text, or cell indices for
+        notebooks. The copies of a node keep its source span.
+
+        """
+        return self._span
+
+    def keys(self):
+        """Names of all fields of the node."""
+        out = ['name', 'children']
+        bits = self._set
+        if bits:
+            out.extend(key for i, key in enumerate(self._fields) if bits >> i & 1)
+        if self._attrs:
+            out.extend(self._attrs)
+        return out
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+
+    def __getitem__(self, key):
+        if key == '_visit_meta' and self._meta is not None:
+            return self._meta
+        if key == 'name' or key == 'children':
+            return object.__getattribute__(self, key)
+        bit = self._field_bits.get(key, 0)
+        if bit:
+            if not self._set & bit:
+                raise KeyError(key)
+            return object.__getattribute__(self, key)
+        if self._attrs and key in self._attrs:
+            return self._attrs[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        setattr(self, key, value)
+
+    def __contains__(self, key):
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    # Tree
+    # --------------------------------------------------------------------------------------------
 
     def add_child(self, child):
         """A child is either a Node or a string."""
         assert isinstance(child, (Node, str))
+        self._check_frozen()
         self.children.append(child)
         return child
 
@@ -119,17 +475,133 @@ class Node(Bunch):
         """Print-friendly representation of a node, used in tree show()."""
         return self.name
 
+    def _same_fields(self, other):
+        """Whether two nodes have the same fields, except their children."""
+        if self._fields is not other._fields:
+            return ({k: v for k, v in self.items() if k != 'children'} ==
+                    {k: v for k, v in other.items() if k != 'children'})
+        bits = self._set
+        if bits != other._set or (self._attrs or None) != (other._attrs or None):
+            return False
+        if bits:
+            for i, key in enumerate(self._fields):
+                if bits >> i & 1 and getattr(self, key) != getattr(other, key):
+                    return False
+        return True
+
     def __eq__(self, other):
-        """Ensure that nxt and prv items are discarded when testing
-        the equality of two trees."""
-        self = filter_tree(self, _remove_visit_meta)
-        return super(Node, self).__eq__(filter_tree(other, _remove_visit_meta))
+        """The `_visit_meta` dictionaries are discarded when testing the equality of
+        two trees."""
+        if not isinstance(other, Node):
+            return NotImplemented
+        stack = [(self, other)]
+        while stack:
+            a, b = stack.pop()
+            if a is b:
+                continue
+            if a.name != b.name or len(a.children) != len(b.children):
+                return False
+            if not a._same_fields(b):
+                return False
+            for x, y in zip(a.children, b.children):
+                if isinstance(x, Node) and isinstance(y, Node):
+                    stack.append((x, y))
+                elif isinstance(x, Node) or isinstance(y, Node) or x != y:
+                    return False
+        return True
+
+    def __ne__(self, other):
+        eq = self.__eq__(other)
+        return eq if eq is NotImplemented else not eq
+
+    # NOTE: the nodes are mutable, use structural_hash() instead.
+    __hash__ = None
+
+    def structural_hash(self):
+        """Return a hash of the tree, as a hexadecimal string.
+
+        Equal trees have the same hash, in any process and on any platform, so that
+        it can be used as a cache key.
+
+        """
+        return _TreeHasher().transform(self).hex()
+
+    # Frozen trees
+    # --------------------------------------------------------------------------------------------
+
+    @property
+    def frozen(self):
+        """Whether the node is frozen (see `freeze()`)."""
+        return self._digest is not None
+
+    def _check_frozen(self):
+        if self._digest is not None:
+            raise AttributeError("The node `%s` is frozen, use `replace()` or `copy()`."
+                                 % self.name)
+
+    def freeze(self):
+        """Freeze the tree and cache the digests of all its subtrees.
+
+        The fields of the frozen nodes cannot be set, and `add_child()` raises an
+        exception. Their lists of children must not be modified either. The copies of
+        the frozen nodes, and the nodes returned by the persistent updates, are not
+        frozen.
+
+        """
+        _TreeHasher(freeze=True).transform(self)
+        return self
+
+    def __getstate__(self):
+        return dict(self.items())
+
+    def __setstate__(self, state):
+        self.__init__(**state)
 
     def copy(self):
-        node = super(Node, self).copy()
-        node = self.__class__(**node)
-        node.children = [child.copy() if hasattr(child, 'copy') else child
-                         for child in node.children]
+        root = _copy_node(self)
+        stack = [root]
+        while stack:
+            children = stack.pop().children
+            for i, child in enumerate(children):
+                if isinstance(child, Node):
+                    children[i] = _copy_node(child)
+                    stack.append(children[i])
+        return root
+
+    # Persistent updates
+    # --------------------------------------------------------------------------------------------
+
+    def replace(self, **fields):
+        """Return a new node with some fields replaced.
+
+        The new node has the same children as this node, unless `children` is passed.
+
+        """
+        out = _copy_node(self)
+        for key, value in fields.items():
+            setattr(out, key, value)
+        return out
+
+    def replace_child(self, index, child):
+        """Return a new node where a child has been replaced."""
+        children = list(self.children)
+        children[index] = child
+        return self.replace(children=children)
+
+    def replace_at(self, path, node):
+        """Return a new tree where the node at a given path has been replaced.
+
+        The path is a sequence of child indices from the root. Only the ancestors of the
+        replaced node are copied.
+
+        """
+        ancestors = []
+        parent = self
+        for index in path:
+            ancestors.append((parent, index))
+            parent = parent.children[index]
+        for parent, index in reversed(ancestors):
+            node = parent.replace_child(index, node)
         return node
 
     def show(self):
@@ -142,14 +614,464 @@ class Node(Bunch):
                          lambda node: node.children)
 
 
-def filter_tree(tree, func):
-    class FilterTransformer(TreeTransformer):
-        def transform_Node(self, node):
-            node = func(node.copy())
-            if node:
-                node.children = self.transform_children(node)
+def _copy_node(node):
+    """Copy a node, but not its children."""
+    cls = node.__class__
+    if cls.__init__ is not Node.__init__:
+        out = cls(**dict(node.items()))
+        out.children = list(node.children)
+        object.__setattr__(out, '_span', node._span)
+        return out
+    # NOTE: the slots are copied directly, which is much faster than the constructor.
+    out = object.__new__(cls)
+    setattr_ = object.__setattr__
+    setattr_(out, 'name', node.name)
+    setattr_(out, 'children', list(node.children))
+    setattr_(out, '_attrs', dict(node._attrs) if node._attrs else None)
+    setattr_(out, '_meta', None)
+    bits = node._set
+    setattr_(out, '_set', bits)
+    setattr_(out, '_digest', None)
+    setattr_(out, '_span', node._span)
+    if bits:
+        for i, key in enumerate(cls._fields):
+            if bits >> i & 1:
+                setattr_(out, key, getattr(node, key))
+    return out
+
+
+def walk(tree, prune=None, strings=False):
+    """Iterate over the nodes of a tree, in depth-first order.
+
+    The nodes are neither copied nor modified, and the iteration can be stopped at
+    any time.
+
+    Parameters
+    ----------
+
+    tree : Node
+        The root of the tree.
+    prune : function (None)
+        If `prune(node)` is true, the nodes below the node are skipped.
+    strings : bool (False)
+        Whether to yield the strings of the tree too.
+
+    """
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        yield node
+        if isinstance(node, str) or (prune is not None and prune(node)):
+            continue
+        children = node.children
+        if strings:
+            stack.extend(reversed(children))
+        else:
+            stack.extend(child for child in reversed(children) if not isinstance(child, str))
+
+
+def iter_nodes(tree, *names):
+    """Iterate over the nodes of a tree with some names, or all nodes if no names are
+    given, in depth-first order."""
+    if not names:
+        return walk(tree)
+    return (node for node in walk(tree) if node.name in names)
+
+
+def filter_tree(tree, func, copy=True):
+    """Apply `func()` to all nodes of a tree.
+
+    `func(node)` is called on each node, from the root to the leaves, and returns the
+    new node, or None to remove the node and the tree below it.
+
+    Parameters
+    ----------
+
+    tree : Node
+        The root of the tree.
+    func : function
+        The function applied to all nodes.
+    copy : bool (True)
+        If true, the tree is not modified: `func()` is called on a copy of each node,
+        whose children are the original children, which it should not modify, and
+        `filter_tree()` returns a new tree. Otherwise, `func()` is called on the
+        original nodes, which it can modify, and the tree is modified in place, with
+        the subtrees it shares with other trees.
+
+    """
+    if not isinstance(tree, Node):
+        return tree
+    root = func(_copy_node(tree) if copy else tree)
+    stack = [root] if root else []
+    while stack:
+        node = stack.pop()
+        children = []
+        for child in node.children:
+            if isinstance(child, Node):
+                child = func(_copy_node(child) if copy else child)
+                if not child:
+                    continue
+                stack.append(child)
+            children.append(child)
+        # NOTE: this also clears the cached digest of the modified nodes.
+        node.children = children
+    return root
+
+
+#-------------------------------------------------------------------------------------------------
+# Tree rewriter
+#-------------------------------------------------------------------------------------------------
+
+class TreeRewriter(TreeTransformer):
+    """Transform a tree into a new tree, without modifying the original tree.
+
+    The transformation methods return new nodes, for example with `Node.replace()`,
+    or the original nodes. By default, a node is kept if its children are unchanged,
+    so that the new tree shares all unchanged subtrees with the original tree.
+
+    """
+
+    bottom_up = True
+
+    # Whether the transformation of a node only depends on the node and its transformed
+    # children, so that the rewriter can be fused with others (see `PassManager`).
+    node_local = False
+
+    def rebuild(self, node):
+        """Return the node with its transformed children, or the node itself if they
+        are unchanged."""
+        children = self.transform_children(node)
+        old = node.children
+        if len(children) == len(old) and all(map(is_, children, old)):
             return node
-    return FilterTransformer().transform(tree)
+        return node.replace(children=children)
+
+    def transform_Node(self, node):
+        return self.rebuild(node)
+
+
+#-------------------------------------------------------------------------------------------------
+# Pass manager
+#-------------------------------------------------------------------------------------------------
+
+class _FusedRewriter(TreeRewriter):
+    """Apply several node-local rewriters to every node in a single traversal."""
+
+    def __init__(self, passes):
+        self.passes = passes
+        base = TreeRewriter._dispatch_table()
+        # `(rewriter, methods by node name, default method or None)` for every pass,
+        # without the methods inherited from `TreeRewriter`.
+        self._tables = []
+        for p in passes:
+            table = type(p)._dispatch_table()
+            methods = {name: func for name, func in table.items()
+                       if name not in ('Node', 'str') and base.get(name, None) is not func}
+            default = table['Node'] if table['Node'] is not base['Node'] else None
+            self._tables.append((p, methods, default))
+
+    def is_noop(self):
+        """Whether no pass transforms any node."""
+        return not any(methods or default for _, methods, default in self._tables)
+
+    def _apply(self, node, start=0):
+        """Apply the passes to a node whose children have been rewritten."""
+        tables = self._tables
+        for i in range(start, len(tables)):
+            p, methods, default = tables[i]
+            func = methods.get(node.name, default)
+            if func is None:
+                continue
+            # The children of the node are already transformed.
+            saved = p._transformed
+            p._transformed = (node, node.children)
+            try:
+                out = func(p, node)
+            finally:
+                p._transformed = saved
+            if isinstance(out, Node):
+                node = out
+                continue
+            if not isinstance(out, list):
+                return out
+            # The following passes are applied to the nodes replacing the node.
+            nodes = []
+            for child in out:
+                child = self._apply(child, i + 1) if isinstance(child, Node) else child
+                if isinstance(child, list):
+                    nodes.extend(child)
+                else:
+                    nodes.append(child)
+            return nodes
+        return node
+
+    def transform_Node(self, node):
+        return self._apply(self.rebuild(node))
+
+
+class PassManager(object):
+    """Run a sequence of passes on a tree, fusing the node-local rewriters.
+
+    A pass is either a function `func(tree, context=None)` returning the new tree, or a
+    `TreeRewriter` instance. The consecutive rewriters with the `node_local` attribute
+    are applied to every node in a single traversal of the tree, in the order of the
+    passes, and the traversal is skipped when none of them has a transformation method.
+
+    Node-local rewriters must not use the cursor, transform the children themselves, or
+    override `transform_str()`: their transformation methods only get the node, whose
+    children have been rewritten by all passes.
+
+    A pass manager can be registered as a pre- or post-filter of a conversion, and
+    `Podoc` fuses the post-filter of a conversion with the pre-filter of the next one
+    when both are pass managers.
+
+    Parameters
+    ----------
+
+    passes : list
+        The functions and rewriters to apply, in order.
+
+    """
+
+    def __init__(self, passes=()):
+        self.passes = []
+        for p in passes:
+            self.add(p)
+
+    def add(self, p):
+        """Append a pass."""
+        if getattr(p, 'node_local', False):
+            assert type(p).transform_str is TreeTransformer.transform_str
+        self.passes.append(p)
+        return self
+
+    def __add__(self, other):
+        return PassManager(self.passes + other.passes)
+
+    def __len__(self):
+        return len(self.passes)
+
+    def iter_stages(self):
+        """Yield the stages of the pass manager: lists of consecutive node-local
+        rewriters to fuse, and other passes."""
+        group = []
+        for p in self.passes:
+            if isinstance(p, TreeRewriter) and p.node_local:
+                group.append(p)
+                continue
+            if group:
+                yield group
+                group = []
+            yield p
+        if group:
+            yield group
+
+    def transform(self, tree, context=None):
+        """Apply all passes to a tree and return the new tree."""
+        for stage in self.iter_stages():
+            if isinstance(stage, list):
+                fused = _FusedRewriter(stage)
+                if not fused.is_noop():
+                    tree = fused.transform(tree)
+            elif isinstance(stage, TreeTransformer):
+                tree = stage.transform(tree)
+            else:
+                tree = stage(tree, context=context)
+        return tree
+
+    def __call__(self, tree, context=None):
+        return self.transform(tree, context=context)
+
+
+#-------------------------------------------------------------------------------------------------
+# Render cache
+#-------------------------------------------------------------------------------------------------
+
+_MISSING = object()
+
+
+class RenderCache(object):
+    """Size-bounded cache of the transformations of subtrees, used by
+    `TreeTransformer.transform_cached()`.
+
+    The least recently used transformations are evicted first.
+
+    Parameters
+    ----------
+
+    max_size : int (1024)
+        Maximum number of transformations in the cache.
+
+    """
+
+    def __init__(self, max_size=1024):
+        self.max_size = max_size
+        self._items = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        try:
+            value = self._items[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self._items.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def __setitem__(self, key, value):
+        self._items[key] = value
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def __len__(self):
+        return len(self._items)
+
+    def clear(self):
+        self._items.clear()
+
+
+#-------------------------------------------------------------------------------------------------
+# Structural hash
+#-------------------------------------------------------------------------------------------------
+
+class _TreeHasher(TreeTransformer):
+    """Compute the digest of every node from its fields and the digests of its
+    children.
+
+    The digests are cached in the frozen nodes only, and the frozen subtrees are not
+    traversed again. The hasher freezes the nodes it hashes when `freeze` is set.
+
+    """
+
+    bottom_up = True
+
+    def __init__(self, freeze=False):
+        # Serialized fields of the nodes, by fields.
+        self._serialized = {}
+        # Whether to freeze the nodes, caching their digests.
+        self._freeze = freeze
+
+    def _fields(self, node):
+        if node._set or node._attrs:
+            keys = node.keys()
+            # NOTE: the first keys are the name and the children.
+            key = (node.name,) + tuple([(k, node[k]) for k in keys[2:]])
+        else:
+            keys, key = ('name',), node.name
+        try:
+            fields = self._serialized.get(key, None)
+        except TypeError:
+            # Unhashable fields are not cached.
+            fields = key = None
+        if fields is None:
+            fields = sorted((k, node[k]) for k in keys if k != 'children')
+            fields = json.dumps(fields, ensure_ascii=False, default=repr).encode('utf-8')
+            if key is not None:
+                self._serialized[key] = fields
+        return fields
+
+    def get_node_children(self, node):
+        return node.children if node._digest is None else ()
+
+    def transform_Node(self, node):
+        if node._digest is not None:
+            return node._digest
+        fields = self._fields(node)
+        # NOTE: the children were transformed by the iterative traversal: the strings are
+        # unchanged and the nodes are replaced by their digests.
+        parts = [fields]
+        for child in self._transformed[1]:
+            if isinstance(child, str):
+                # NOTE: the strings are prefixed by their length so that consecutive
+                # strings are not ambiguous.
+                b = child.encode('utf-8')
+                parts.append(b's%d:' % len(b))
+                parts.append(b)
+            else:
+                parts.append(b'n')
+                parts.append(child)
+        digest = hashlib.blake2b(b''.join(parts), digest_size=16).digest()
+        if self._freeze:
+            object.__setattr__(node, '_digest', digest)
+        return digest
+
+
+#-------------------------------------------------------------------------------------------------
+# Diff
+#-------------------------------------------------------------------------------------------------
+
+Edit = namedtuple('Edit', ('op', 'start', 'end', 'new'))
+Edit.__doc__ = """Edit of the children of a tree's root.
+
+`op` is `insert`, `delete`, or `replace`: the children from `start` to `end` (excluded)
+are replaced by the `new` children. When `op` is `fields`, `new` is the dictionary of the
+new fields of the root (except its children).
+
+"""
+
+
+def _root_fields(node):
+    return {key: value for key, value in node.items() if key != 'children'}
+
+
+def diff(old, new):
+    """Return the list of edits that turn a tree into another one, block by block.
+
+    The children of both roots are compared with their structural hashes, which are
+    cached in the frozen nodes, so that comparing two versions of a document that share
+    unchanged frozen subtrees is cheap (see `Node.freeze()`). An empty list means that
+    the trees are equal.
+
+    """
+    hasher = _TreeHasher()
+
+    def _keys(children):
+        return [child if isinstance(child, str) else hasher.transform(child)
+                for child in children]
+
+    a, b = _keys(old.children), _keys(new.children)
+    edits = []
+    if _root_fields(old) != _root_fields(new):
+        edits.append(Edit('fields', None, None, _root_fields(new)))
+    elif a == b:
+        return []
+    # NOTE: the common prefix and suffix are skipped before matching the children, which
+    # is quadratic in the worst case.
+    n = min(len(a), len(b))
+    p = next((i for i in range(n) if a[i] != b[i]), n)
+    q = next((i for i in range(n - p) if a[-1 - i] != b[-1 - i]), n - p)
+    matcher = SequenceMatcher(None, a[p:len(a) - q], b[p:len(b) - q], autojunk=False)
+    for op, i1, i2, j1, j2 in matcher.get_opcodes():
+        if op != 'equal':
+            edits.append(Edit(op, p + i1, p + i2, new.children[p + j1:p + j2]))
+    return edits
+
+
+def patch(tree, edits):
+    """Apply a list of edits returned by `diff()` and return the new tree.
+
+    The tree is not modified, and the new tree shares all unchanged children with it.
+
+    """
+    if not edits:
+        return tree
+    children = list(tree.children)
+    fields = {}
+    # NOTE: the edits are applied from the end so that the indices remain valid.
+    for edit in reversed(edits):
+        if edit.op == 'fields':
+            fields = edit.new
+            continue
+        children[edit.start:edit.end] = edit.new
+    out = tree.__class__(children=children, **fields) if fields else _copy_node(tree)
+    out.children = children
+    return out
 
 
 #-------------------------------------------------------------------------------------------------
@@ -157,6 +1079,8 @@ def filter_tree(tree, func):
 #-------------------------------------------------------------------------------------------------
 
 class TreePrinter(TreeTransformer):
+    bottom_up = True
+
     prefix_t = '├─ '
     prefix_l = '└─ '
     prefix_d = '│  '
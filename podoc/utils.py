@@ -8,11 +8,20 @@ import json
 import logging
 import os
 import os.path as op
+import re
+import signal
+import subprocess
 import sys
+import time
 
 import pypandoc
 
-pandoc = pypandoc.convert
+try:
+    import resource
+except ImportError:  # pragma: no cover
+    # NOTE: resource limits are only available on Unix.
+    resource = None
+
 logger = logging.getLogger(__name__)
 
 
@@ -76,6 +85,11 @@ def _shorten_string(s, lim=40):
     return s if len(s) <= lim else (s[:lim // 2] + ' (...) ' + s[-lim // 2:])
 
 
+def _remove_ansi(text):
+    """Remove the ANSI escape sequences (colors) from a text."""
+    return re.sub(r'\x1b[^m]*m', '', text)
+
+
 #-------------------------------------------------------------------------------------------------
 # Resources
 #-------------------------------------------------------------------------------------------------
@@ -169,6 +183,150 @@ def _merge_str(l):
     return out
 
 
+#-------------------------------------------------------------------------------------------------
+# External processes
+#-------------------------------------------------------------------------------------------------
+
+class ConversionTimeout(RuntimeError):
+    """Raised when a conversion or an external process exceeds its deadline."""
+    def __init__(self, cmd=None, timeout=None):
+        self.cmd = cmd
+        self.timeout = timeout
+        what = '`%s`' % ' '.join(cmd) if cmd else 'The conversion'
+        super(ConversionTimeout, self).__init__(
+            "%s timed out after %s seconds." % (what, timeout))
+
+
+class ConversionCancelled(RuntimeError):
+    """Raised when a conversion is cancelled."""
+    def __init__(self, cmd=None):
+        self.cmd = cmd
+        what = '`%s`' % ' '.join(cmd) if cmd else 'The conversion'
+        super(ConversionCancelled, self).__init__("%s was cancelled." % what)
+
+
+# Polling interval of external processes when a cancellation event is given, in seconds.
+_CANCEL_POLL_INTERVAL = .1
+
+# Mapping between resource limit names and the corresponding `RLIMIT_*` name.
+_RLIMITS = {
+    'memory': 'RLIMIT_AS',  # in bytes
+    'cpu': 'RLIMIT_CPU',  # in seconds
+}
+
+
+def _set_limits(limits):
+    """Return a function setting resource limits in a child process."""
+    if not limits:
+        return None
+    if resource is None:  # pragma: no cover
+        logger.debug("Resource limits are not supported on this platform.")
+        return None
+    unknown = set(limits) - set(_RLIMITS)
+    if unknown:
+        raise ValueError("Unknown resource limits: %s." % ', '.join(sorted(unknown)))
+
+    def preexec():
+        for name, value in limits.items():
+            if value is not None:
+                rlimit = getattr(resource, _RLIMITS[name])
+                resource.setrlimit(rlimit, (value, value))
+    return preexec
+
+
+def _kill_process(process):
+    """Kill a process and all of its children."""
+    try:
+        if sys.platform != 'win32':
+            # The process is the leader of its own process group.
+            os.killpg(process.pid, signal.SIGKILL)
+        else:  # pragma: no cover
+            process.kill()
+    except (ProcessLookupError, PermissionError):  # pragma: no cover
+        pass
+    # Reap the process and close the pipes.
+    process.communicate()
+
+
+def run_process(args, input=None, cwd=None, timeout=None, cancel=None, limits=None,
+                check=True):
+    """Run an external process and return its standard output.
+
+    Parameters
+    ----------
+
+    args : list
+        The command and its arguments.
+    input : bytes (None)
+        Data sent to the standard input of the process.
+    cwd : str (None)
+        The working directory of the process.
+    timeout : float (None)
+        Maximum duration of the process, in seconds. The process group is killed and
+        `ConversionTimeout` is raised when it is exceeded.
+    cancel : threading.Event (None)
+        When this event is set, the process group is killed and `ConversionCancelled`
+        is raised.
+    limits : dict (None)
+        Resource limits of the process, with `memory` (bytes) and `cpu` (seconds) keys.
+    check : bool (True)
+        Whether to raise `subprocess.CalledProcessError` on a non-zero exit code.
+
+    """
+    if timeout is not None and timeout <= 0:
+        raise ConversionTimeout(args, timeout)
+    kwargs = {}
+    if sys.platform != 'win32':
+        # Run the process in a new process group, so that the tools it spawns
+        # are killed with it.
+        kwargs['start_new_session'] = True
+    process = subprocess.Popen(args, cwd=cwd,
+                               stdin=subprocess.PIPE if input is not None else subprocess.DEVNULL,
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                               preexec_fn=_set_limits(limits),
+                               **kwargs)
+    deadline = time.monotonic() + timeout if timeout is not None else None
+    while True:
+        wait = deadline - time.monotonic() if deadline is not None else None
+        if cancel is not None:
+            wait = min(wait, _CANCEL_POLL_INTERVAL) if wait is not None else _CANCEL_POLL_INTERVAL
+        try:
+            stdout, stderr = process.communicate(input, timeout=wait)
+            break
+        except subprocess.TimeoutExpired:
+            # NOTE: the input has already been sent to the process.
+            input = None
+            if cancel is not None and cancel.is_set():
+                _kill_process(process)
+                raise ConversionCancelled(args)
+            if deadline is not None and time.monotonic() >= deadline:
+                _kill_process(process)
+                raise ConversionTimeout(args, timeout)
+    if check and process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, args,
+                                            output=stdout, stderr=stderr)
+    return stdout
+
+
+def process_options(context):
+    """Return the `run_process()` options of a conversion context.
+
+    The timeout is the time remaining before the deadline of the conversion.
+
+    """
+    context = context or {}
+    deadline = context.get('deadline', None)
+    timeout = None
+    if deadline is not None:
+        timeout = deadline - time.monotonic()
+        if timeout <= 0:
+            raise ConversionTimeout(timeout=context.get('timeout', None))
+    cancel = context.get('cancel', None)
+    if cancel is not None and cancel.is_set():
+        raise ConversionCancelled()
+    return dict(timeout=timeout, cancel=cancel, limits=context.get('limits', None))
+
+
 #-------------------------------------------------------------------------------------------------
 # pandoc wrapper
 #-------------------------------------------------------------------------------------------------
@@ -185,17 +343,35 @@ PANDOC_MARKDOWN_FORMAT = ('markdown'
                           )
 
 
-def get_pandoc_formats():
-    import pypandoc
-    return pypandoc.get_pandoc_formats()
+def pandoc(source, to, format=None, extra_args=(), outputfile=None,
+           timeout=None, cancel=None, limits=None):
+    """Convert a string with pandoc and return the output.
 
+    This function runs the pandoc executable found by pypandoc, with an optional
+    timeout, cancellation event, and resource limits (see `run_process()`).
 
-def get_pandoc_api_version():
-    import pypandoc
-    return json.loads(pypandoc.convert_text('', 'json', format='markdown'))['pandoc-api-version']
+    """
+    assert format
+    # NOTE: PDF output is done by pandoc from LaTeX, as a function of the output file
+    # extension.
+    if to == 'pdf':
+        to = 'latex'
+    args = [pypandoc.get_pandoc_path(), '--from=' + format, '--to=' + to]
+    if outputfile:
+        args.append('--output=' + outputfile)
+    args.extend(extra_args)
+    try:
+        out = run_process(args, input=source.encode('utf-8'),
+                          timeout=timeout, cancel=cancel, limits=limits)
+    except subprocess.CalledProcessError as e:
+        raise RuntimeError('Pandoc died with exitcode "%s" during conversion: %s' %
+                           (e.returncode, e.stderr.decode('utf-8', 'replace')))
+    return out.decode('utf-8')
 
 
-PANDOC_API_VERSION = get_pandoc_api_version()
+def get_pandoc_formats():
+    import pypandoc
+    return pypandoc.get_pandoc_formats()
 
 
 def has_pandoc():  # pragma: no cover
@@ -211,6 +387,20 @@ def has_pandoc():  # pragma: no cover
     return False
 
 
+# Pandoc API version used when pandoc is not installed.
+_DEFAULT_PANDOC_API_VERSION = [1, 17, 0, 5]
+
+
+def get_pandoc_api_version():
+    if not has_pandoc():  # pragma: no cover
+        return _DEFAULT_PANDOC_API_VERSION
+    import pypandoc
+    return json.loads(pypandoc.convert_text('', 'json', format='markdown'))['pandoc-api-version']
+
+
+PANDOC_API_VERSION = get_pandoc_api_version()
+
+
 def generate_json_test_files():  # pragma: no cover
     """Regenerate all *.json files in ast/test_files."""
     curdir = op.realpath(op.dirname(__file__))